@@ -0,0 +1,184 @@
+"""
+Budget allocation engine shared by onboarding, budget setup and the
+simulated AI recommendation.
+
+Categories are grouped (essentials, lifestyle, savings, debt, other) by the
+category registry. Each group gets a share of income that is split evenly
+across the user's categories in it, a savings goal is funded from lifestyle categories,
+per-category min/max bounds are enforced by redistributing the excess over
+the unbounded categories, and the result is rounded to whole minor units
+(cents) so the amounts add up to exactly the income. Everything is done on
+small NumPy vectors, so it is cheap enough to rerun on every widget change.
+"""
+import numpy as np
+
+from category_registry import DEBT, ESSENTIALS, GROUP_IDS, GROUPS, LIFESTYLE, OTHER, REGISTRY, SAVINGS
+
+# 50/30/20 style split used when nothing is known about the user's goals
+DEFAULT_GROUP_WEIGHTS = {ESSENTIALS: 0.5, LIFESTYLE: 0.25, SAVINGS: 0.15, DEBT: 0.05, OTHER: 0.05}
+
+
+def goal_group_weights(financial_goal="", saving_preference=20, has_debt=False):
+    """
+    Group shares of income for a user's goal and desired savings rate
+
+    Args:
+        financial_goal (str): Primary financial goal from the budget form
+        saving_preference (float): Desired savings percentage
+        has_debt (bool): Whether the user has significant debt
+
+    Returns:
+        dict: group -> share of income, summing to 1
+    """
+    if has_debt:
+        weights = {ESSENTIALS: 0.45, LIFESTYLE: 0.15, DEBT: 0.25, OTHER: 0.05}
+    elif financial_goal in ["Save for emergency fund", "Save for major purchase"]:
+        weights = {ESSENTIALS: 0.45, LIFESTYLE: 0.2, DEBT: 0.05, OTHER: 0.05}
+    elif financial_goal == "Build long-term wealth":
+        weights = {ESSENTIALS: 0.4, LIFESTYLE: 0.15, DEBT: 0.05, OTHER: 0.05}
+    else:
+        weights = {ESSENTIALS: 0.4, LIFESTYLE: 0.3, DEBT: 0.05, OTHER: 0.05}
+    weights[SAVINGS] = saving_preference / 100
+
+    total = sum(weights.values())
+    return {group: weight / total for group, weight in weights.items()}
+
+
+def _fund_goal(amounts, groups, lower, goal_contribution):
+    """
+    Move up to goal_contribution into the largest savings category, taken from lifestyle
+
+    Returns:
+        int: Index of the savings category funded, or None if there is none
+    """
+    savings = np.flatnonzero(groups == GROUP_IDS[SAVINGS])
+    if not len(savings):
+        return None
+    target = savings[np.argmax(amounts[savings])]
+    shortfall = goal_contribution - amounts[target]
+    if shortfall <= 0:
+        return target
+
+    lifestyle = groups == GROUP_IDS[LIFESTYLE]
+    spare = np.where(lifestyle, np.maximum(amounts - lower, 0), 0)
+    available = spare.sum()
+    if available > 0:
+        taken = min(shortfall, available)
+        amounts -= spare * (taken / available)
+        amounts[target] += taken
+    return target
+
+
+def _apply_bounds(amounts, lower, upper, total):
+    """
+    Clamp amounts to [lower, upper] while keeping their sum at total
+
+    Whatever clamping adds or removes is spread over the categories that are
+    still free to move, in proportion to their amounts. Infeasible bounds are
+    relaxed: lower bounds are scaled down if they exceed the total, and upper
+    bounds are scaled up if they cannot reach it.
+    """
+    if lower.sum() > total:
+        lower = lower * (total / lower.sum())
+    if upper.sum() < total:
+        upper = upper * (total / upper.sum()) if upper.sum() > 0 else np.full_like(upper, total)
+
+    for _ in range(len(amounts) + 1):
+        amounts = np.clip(amounts, lower, upper)
+        residual = total - amounts.sum()
+        if abs(residual) < 1e-9:
+            break
+        free = amounts < upper if residual > 0 else amounts > lower
+        if not free.any():
+            break
+        share = np.where(free, amounts, 0)
+        if share.sum() <= 0:
+            share = free.astype(float)
+        amounts = amounts + residual * share / share.sum()
+    return amounts
+
+
+def _round_to_total(amounts, total_minor, minor_per_unit):
+    """Round to whole minor units, giving leftover units to the largest remainders"""
+    scaled = amounts * minor_per_unit
+    floored = np.floor(scaled)
+    leftover = int(total_minor - floored.sum())
+    if leftover > 0:
+        order = np.argsort(-(scaled - floored), kind="stable")
+        floored[order[:leftover]] += 1
+    elif leftover < 0:
+        order = np.argsort(scaled - floored, kind="stable")
+        floored[order[:-leftover]] -= 1
+    return floored / minor_per_unit
+
+
+def allocate(income, categories, group_weights=None, bounds=None, savings_target=None,
+             goal_contribution=0, minor_per_unit=100):
+    """
+    Allocate a monthly income across categories
+
+    Args:
+        income (float): Monthly income to allocate in full
+        categories (list): Category names, in display order
+        group_weights (dict): group -> share of income; DEFAULT_GROUP_WEIGHTS if omitted.
+                              Shares of groups the user has no categories in are
+                              spread over the other groups.
+        bounds (dict): category -> (min, max) amount; either side may be None
+        savings_target (float): Share of income for the savings group, overriding
+                                group_weights
+        goal_contribution (float): Monthly amount the largest savings category
+                                   should reach, taken from lifestyle categories
+        minor_per_unit (int): Minor units per currency unit used for rounding
+
+    Returns:
+        dict: category -> amount, summing exactly to income
+    """
+    if not categories:
+        return {}
+
+    weights_by_group = dict(group_weights or DEFAULT_GROUP_WEIGHTS)
+    if savings_target is not None:
+        weights_by_group[SAVINGS] = savings_target
+
+    groups = np.array([REGISTRY.group_id(cat) for cat in categories])
+    group_weight = np.array([weights_by_group.get(group, 0.0) for group in GROUPS], dtype=float)
+    counts = np.bincount(groups, minlength=len(GROUPS))
+
+    weights = group_weight[groups] / counts[groups]
+    if weights.sum() <= 0:
+        weights = np.ones(len(categories))
+    amounts = income * weights / weights.sum()
+
+    lower = np.zeros(len(categories))
+    upper = np.full(len(categories), np.inf)
+    for i, cat in enumerate(categories):
+        low, high = (bounds or {}).get(cat, (None, None))
+        if low is not None:
+            lower[i] = low
+        if high is not None:
+            upper[i] = high
+
+    if goal_contribution > 0:
+        target = _fund_goal(amounts, groups, lower, goal_contribution)
+        if target is not None:
+            # Don't let bound redistribution take the goal money back
+            lower[target] = min(upper[target], max(lower[target], amounts[target]))
+
+    if bounds:
+        amounts = _apply_bounds(amounts, lower, upper, income)
+
+    amounts = _round_to_total(amounts, round(income * minor_per_unit), minor_per_unit)
+    return {cat: float(amount) for cat, amount in zip(categories, amounts)}
+
+
+def to_percentages(allocations, income):
+    """
+    Convert amounts to the {"percentage", "amount"} entries used by recommendations
+
+    Returns:
+        dict: category -> {"percentage": share of income in %, "amount": amount}
+    """
+    return {
+        cat: {"percentage": round(amount / income * 100, 1) if income > 0 else 0, "amount": amount}
+        for cat, amount in allocations.items()
+    }
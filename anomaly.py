@@ -0,0 +1,209 @@
+"""
+Streaming anomaly detection for new expenses.
+
+Each category keeps running statistics on the user document under
+`expense_stats.<category>`:
+
+- Welford mean and variance of log(1 + amount), since spending amounts are
+  heavily right-skewed
+- P² quantile sketches (Jain & Chlamtac) for the median, p90 and p99
+
+A new expense is scored against its category's statistics before being
+folded in, in O(1) time and without reading any expense history. The
+z-score is stored on the expense as `anomaly_score`, and expenses that are
+both several deviations above normal and above the category's p90 are
+flagged with `anomaly`.
+"""
+import math
+
+from firebase_admin import firestore
+
+# Expenses a category needs before new ones are scored
+MIN_HISTORY = 5
+
+# z-score (in log space) above which an expense is unusual
+ANOMALY_Z_SCORE = 3.0
+
+# Floor on the log-space standard deviation so identical amounts don't give infinite scores
+MIN_STD = 0.05
+
+QUANTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+
+
+class P2Quantile:
+    """
+    P² streaming quantile estimate using five markers
+
+    Args:
+        p (float): Quantile to track, between 0 and 1
+        state (dict): Persisted {"h": heights, "n": positions}
+    """
+
+    def __init__(self, p, state=None):
+        self.p = p
+        self.heights = list((state or {}).get("h", []))
+        self.positions = list((state or {}).get("n", []))
+
+    def state(self):
+        return {"h": self.heights, "n": self.positions}
+
+    def _desired(self, count):
+        p = self.p
+        initial = (1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5)
+        increments = (0, p / 2, p, (1 + p) / 2, 1)
+        return [initial[i] + (count - 5) * increments[i] for i in range(5)]
+
+    def add(self, x):
+        q, n = self.heights, self.positions
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            if len(q) == 5:
+                n[:] = [1, 2, 3, 4, 5]
+            return
+
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+        for i in range(k + 1, 5):
+            n[i] += 1
+
+        desired = self._desired(n[4])
+        for i in range(1, 4):
+            d = desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                parabolic = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if q[i - 1] < parabolic < q[i + 1]:
+                    q[i] = parabolic
+                else:
+                    q[i] = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def value(self):
+        """Current estimate, or None before any observation"""
+        if not self.heights:
+            return None
+        if len(self.heights) < 5:
+            return self.heights[min(len(self.heights) - 1, int(self.p * len(self.heights)))]
+        return self.heights[2]
+
+
+class CategoryStats:
+    """
+    Running statistics of one category's expense amounts
+
+    Args:
+        state (dict): Persisted statistics from `expense_stats.<category>`
+    """
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.count = state.get("n", 0)
+        self.mean = state.get("mean", 0.0)
+        self.m2 = state.get("m2", 0.0)
+        self.quantiles = {key: P2Quantile(p, state.get(key)) for key, p in QUANTILES.items()}
+
+    def state(self):
+        """Compact dict for Firestore"""
+        state = {"n": self.count, "mean": self.mean, "m2": self.m2}
+        for key, sketch in self.quantiles.items():
+            state[key] = sketch.state()
+        return state
+
+    def std(self):
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(max(0.0, self.m2 / (self.count - 1)))
+
+    def add(self, amount):
+        """Fold an amount into the statistics"""
+        x = math.log1p(max(0.0, amount))
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        for sketch in self.quantiles.values():
+            sketch.add(amount)
+
+    def remove(self, amount):
+        """
+        Take a deleted amount back out of the mean and variance
+
+        The quantile sketches can't forget values and keep it; one deleted
+        expense barely moves them.
+        """
+        if self.count <= 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        x = math.log1p(max(0.0, amount))
+        self.count -= 1
+        delta = x - self.mean
+        self.mean -= delta / self.count
+        self.m2 = max(0.0, self.m2 - delta * (x - self.mean))
+
+    def score(self, amount):
+        """
+        Score an amount against the statistics so far
+
+        Returns:
+            dict: anomaly_score (z-score, None without enough history),
+                  anomaly flag and the category's typical (median) amount
+        """
+        typical = self.quantiles["p50"].value()
+        if self.count < MIN_HISTORY:
+            return {"anomaly_score": None, "anomaly": False, "typical": typical}
+
+        z = (math.log1p(max(0.0, amount)) - self.mean) / max(self.std(), MIN_STD)
+        p90 = self.quantiles["p90"].value()
+        return {
+            "anomaly_score": round(z, 2),
+            "anomaly": z >= ANOMALY_Z_SCORE and p90 is not None and amount > p90,
+            "typical": typical
+        }
+
+
+def stats_field(category):
+    """Firestore field path of a category's statistics, quoted for names like 'Food & Dining'"""
+    return firestore.FieldPath("expense_stats", category).to_api_repr()
+
+
+def assess_expense(user_data, category, amount):
+    """
+    Score a new expense and fold it into its category's statistics
+
+    Updates user_data in place so several expenses in one run see each
+    other, and returns the fields to persist.
+
+    Returns:
+        tuple: (score dict from CategoryStats.score,
+                {field path: stats} update for the user document)
+    """
+    all_stats = user_data.setdefault("expense_stats", {})
+    stats = CategoryStats(all_stats.get(category))
+    result = stats.score(amount)
+    stats.add(amount)
+    all_stats[category] = stats.state()
+    return result, {stats_field(category): all_stats[category]}
+
+
+def forget_expense(user_data, category, amount):
+    """
+    Remove a deleted expense from its category's statistics
+
+    Returns:
+        dict: {field path: stats} update for the user document
+    """
+    all_stats = user_data.setdefault("expense_stats", {})
+    stats = CategoryStats(all_stats.get(category))
+    stats.remove(amount)
+    all_stats[category] = stats.state()
+    return {stats_field(category): all_stats[category]}
@@ -0,0 +1,329 @@
+"""
+Headless batch job that regenerates AI budget recommendations for every user.
+
+Streams user documents page by page, builds recommendation inputs from the
+stored profile, calls the recommendation engine from a thread pool behind a
+shared rate limiter and writes results back to each user's
+`ai_recommendation` field in batched updates. Progress is checkpointed after
+every page so an interrupted run resumes where it stopped.
+
+Users whose inputs (income, categories, preferences, savings goal) and model
+are unchanged since their last recommendation are skipped unless --force.
+
+Usage:
+    python batch_recommendations.py --workers 8 --rate 4
+    python batch_recommendations.py --checkpoint run.json --no-fallback
+    python batch_recommendations.py --reset --dry-run
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from firebase_admin import firestore
+
+from budget_ai import BUDGET_MODEL_NAME, generate_simulated_ai_response, get_gemini_recommendation
+from category_registry import canonical_categories
+from data_layer import iter_user_pages, user_ref
+from load_harness import percentile
+from shared import db
+
+DEFAULT_CHECKPOINT = "batch_recommendations.checkpoint.json"
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+# Failed user ids kept in the checkpoint for follow-up
+MAX_RECORDED_FAILURES = 200
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting calls per second across workers
+
+    Args:
+        rate (float): Tokens added per second
+        burst (int): Maximum tokens that can accumulate
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def recommendation_inputs(user_data):
+    """
+    Build get_ai_budget_recommendation arguments from a stored user profile
+
+    Preferences saved from the budget setup form (`ai_preferences`) are used
+    when present; otherwise the form defaults apply.
+
+    Returns:
+        dict: Keyword arguments, or None if the user has no income set
+    """
+    income = user_data.get("income", 0)
+    if not income:
+        return None
+
+    categories = canonical_categories(user_data.get("categories", []))
+    preferences = user_data.get("ai_preferences", {})
+    goal = user_data.get("savings_goal") or {}
+
+    purchase_deadline = None
+    if goal.get("target_date"):
+        try:
+            purchase_deadline = date.fromisoformat(goal["target_date"][:10])
+        except ValueError:
+            purchase_deadline = None
+    planning_major_purchase = bool(goal.get("item") and goal.get("total_cost") and purchase_deadline)
+
+    return {
+        "income": income,
+        "categories": categories,
+        "saving_preference": preferences.get("saving_preference", 20),
+        "has_debt": preferences.get("has_debt", False),
+        "planning_major_purchase": planning_major_purchase,
+        "purchase_item": goal.get("item", "") if planning_major_purchase else "",
+        "purchase_cost": goal.get("total_cost", 0) if planning_major_purchase else 0,
+        "purchase_deadline": purchase_deadline if planning_major_purchase else None,
+        "financial_goal": preferences.get("financial_goal", "Balance savings and lifestyle"),
+        "life_stage": preferences.get("life_stage", "Young professional"),
+        "currency_symbol": user_data.get("currency", "₹ INR").split()[0]
+    }
+
+
+def inputs_hash(inputs, model_version):
+    """Stable fingerprint of the inputs and model behind a recommendation"""
+    payload = json.dumps({"inputs": inputs, "model": model_version}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def load_checkpoint(path):
+    """Load the checkpoint for a run, or a fresh one if there is none"""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"last_user_id": None, "processed": 0, "written": 0, "skipped": 0,
+                "fallbacks": 0, "failed": 0, "failed_user_ids": []}
+
+
+def save_checkpoint(path, checkpoint):
+    """Atomically write the checkpoint so a crash never leaves it half written"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def generate_recommendation(inputs, allow_fallback=True):
+    """
+    Call the recommendation engine for one user
+
+    Returns:
+        tuple: (recommendation dict or None, source) where source is
+               "gemini", "simulated" or "failed"
+    """
+    try:
+        recommendation = get_gemini_recommendation(**inputs)
+        if recommendation:
+            return recommendation, "gemini"
+    except Exception as e:
+        print(f"Error calling Gemini API: {str(e)}")
+
+    if not allow_fallback:
+        return None, "failed"
+
+    simulated_inputs = {k: v for k, v in inputs.items() if k != "currency_symbol"}
+    return generate_simulated_ai_response(**simulated_inputs), "simulated"
+
+
+class BatchRunner:
+    """
+    Regenerate recommendations for all users with bounded concurrency
+
+    Args:
+        workers (int): Concurrent recommendation calls
+        rate (float): Maximum recommendation calls per second
+        burst (int): Calls allowed back to back before rate limiting applies
+        page_size (int): Users read per Firestore query
+        checkpoint_path (str): File recording progress between runs
+        model_version (str): Model tag stored with each result
+        force (bool): Regenerate even when inputs are unchanged
+        allow_fallback (bool): Store simulated recommendations when Gemini fails
+        dry_run (bool): Generate but do not write results or checkpoints
+    """
+
+    def __init__(self, workers=4, rate=2.0, burst=4, page_size=100, checkpoint_path=DEFAULT_CHECKPOINT,
+                 model_version=BUDGET_MODEL_NAME, force=False, allow_fallback=True, dry_run=False):
+        self.workers = workers
+        self.limiter = TokenBucket(rate, burst)
+        self.page_size = page_size
+        self.checkpoint_path = checkpoint_path
+        self.model_version = model_version
+        self.force = force
+        self.allow_fallback = allow_fallback
+        self.dry_run = dry_run
+        self.latencies = []
+
+    def _process_user(self, user_id, user_data):
+        """Generate one user's recommendation; returns (user_id, status, update)"""
+        inputs = recommendation_inputs(user_data)
+        if inputs is None:
+            return user_id, "skipped", None
+
+        fingerprint = inputs_hash(inputs, self.model_version)
+        previous = user_data.get("ai_recommendation") or {}
+        if not self.force and previous.get("input_hash") == fingerprint:
+            return user_id, "skipped", None
+
+        self.limiter.acquire()
+        start = time.perf_counter()
+        recommendation, source = generate_recommendation(inputs, self.allow_fallback)
+        self.latencies.append(time.perf_counter() - start)
+
+        if recommendation is None:
+            return user_id, "failed", None
+
+        update = {
+            "ai_recommendation": {
+                "allocations": recommendation["allocations"],
+                "explanations": recommendation["explanations"],
+                "tips": recommendation["tips"],
+                "savings_plan": recommendation["savings_plan"],
+                "summary": recommendation["summary"],
+                "source": source,
+                "model_version": self.model_version,
+                "input_hash": fingerprint,
+                "generated_at": firestore.SERVER_TIMESTAMP
+            }
+        }
+        return user_id, source, update
+
+    def _write_updates(self, updates):
+        """Write (user_id, update) pairs in batches of at most MAX_BATCH_WRITES"""
+        for i in range(0, len(updates), MAX_BATCH_WRITES):
+            batch = db.batch()
+            for user_id, update in updates[i:i + MAX_BATCH_WRITES]:
+                batch.update(user_ref(user_id), update)
+            batch.commit()
+
+    def run(self):
+        """
+        Process every user after the checkpoint
+
+        Returns:
+            dict: Final checkpoint counters plus elapsed seconds
+        """
+        checkpoint = load_checkpoint(self.checkpoint_path)
+        if checkpoint["last_user_id"]:
+            print(f"Resuming after user {checkpoint['last_user_id']} ({checkpoint['processed']} already processed)")
+
+        start = time.perf_counter()
+        processed_this_run = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for page in iter_user_pages(self.page_size, checkpoint["last_user_id"]):
+                results = list(pool.map(lambda item: self._process_user(*item), page))
+
+                updates = [(user_id, update) for user_id, _, update in results if update]
+                if updates and not self.dry_run:
+                    self._write_updates(updates)
+
+                for user_id, status, _ in results:
+                    checkpoint["processed"] += 1
+                    if status == "skipped":
+                        checkpoint["skipped"] += 1
+                    elif status == "failed":
+                        checkpoint["failed"] += 1
+                        if len(checkpoint["failed_user_ids"]) < MAX_RECORDED_FAILURES:
+                            checkpoint["failed_user_ids"].append(user_id)
+                    else:
+                        checkpoint["written"] += 1
+                        checkpoint["fallbacks"] += 1 if status == "simulated" else 0
+
+                # Only advance once the page's writes are committed
+                checkpoint["last_user_id"] = page[-1][0]
+                if not self.dry_run:
+                    save_checkpoint(self.checkpoint_path, checkpoint)
+
+                processed_this_run += len(page)
+                elapsed = time.perf_counter() - start
+                print(f"[batch] {checkpoint['processed']} users processed, "
+                      f"{processed_this_run / elapsed if elapsed else 0:.1f} users/s, "
+                      f"{checkpoint['failed']} failed")
+
+        checkpoint["elapsed_seconds"] = time.perf_counter() - start
+        checkpoint["processed_this_run"] = processed_this_run
+        return checkpoint
+
+    def format_report(self, result):
+        """Render a summary of the run"""
+        latencies = sorted(self.latencies)
+        elapsed = result["elapsed_seconds"]
+        calls = len(latencies)
+        return "\n".join([
+            f"Processed:   {result['processed']} users ({result['processed_this_run']} this run)",
+            f"Written:     {result['written']} ({result['fallbacks']} simulated fallbacks)",
+            f"Skipped:     {result['skipped']} (no income or unchanged inputs)",
+            f"Failed:      {result['failed']}" + (f" e.g. {', '.join(result['failed_user_ids'][:5])}" if result["failed_user_ids"] else ""),
+            f"Throughput:  {result['processed_this_run'] / elapsed if elapsed else 0:.1f} users/s, "
+            f"{calls / elapsed if elapsed else 0:.2f} model calls/s",
+            f"Latency:     p50 {percentile(latencies, 50) * 1000:.0f} ms, p95 {percentile(latencies, 95) * 1000:.0f} ms",
+            f"Wall time:   {elapsed:.1f}s"
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate AI budget recommendations for all users")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent recommendation calls")
+    parser.add_argument("--rate", type=float, default=2.0, help="Maximum model calls per second")
+    parser.add_argument("--burst", type=int, default=4, help="Calls allowed back to back")
+    parser.add_argument("--page-size", type=int, default=100, help="Users read per query")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Checkpoint file for resuming")
+    parser.add_argument("--reset", action="store_true", help="Ignore and overwrite an existing checkpoint")
+    parser.add_argument("--model-version", default=BUDGET_MODEL_NAME, help="Model tag stored with results")
+    parser.add_argument("--force", action="store_true", help="Regenerate even if inputs are unchanged")
+    parser.add_argument("--no-fallback", action="store_true",
+                        help="Count Gemini failures as failed instead of storing a simulated budget")
+    parser.add_argument("--dry-run", action="store_true", help="Generate without writing anything")
+    args = parser.parse_args()
+
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    runner = BatchRunner(
+        workers=args.workers,
+        rate=args.rate,
+        burst=args.burst,
+        page_size=args.page_size,
+        checkpoint_path=args.checkpoint,
+        model_version=args.model_version,
+        force=args.force,
+        allow_fallback=not args.no_fallback,
+        dry_run=args.dry_run
+    )
+    print(runner.format_report(runner.run()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,60 @@
 import os
 import json
+import re
 import time
 from datetime import timedelta, datetime
 import requests
+from allocation_engine import allocate, goal_group_weights, to_percentages
+from cache import get_cache
+from partial_json import IncrementalJSONParser
+from prompt_builder import PromptBuilder
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 
+DEFAULT_GEMINI_API_BASE = "https://generativelanguage.googleapis.com"
+
+# Model used for budget recommendations; stored with batch results so they
+# can be regenerated when it changes
+BUDGET_MODEL_NAME = "gemini-1.5-pro"
+
+# Share of the requested categories a truncated answer must cover to be kept
+MIN_SALVAGED_CATEGORY_SHARE = 0.5
+
+# Token budget for the recommendation prompt and cap on free-text notes in it
+BUDGET_PROMPT_TOKEN_BUDGET = 900
+MAX_CUSTOM_NOTES_CHARS = 600
+
+# Identical budget requests reuse a model answer for a day, across workers
+BUDGET_CACHE_TTL = 24 * 3600
+
+
+def get_gemini_api_base():
+    """
+    Get the base URL of the Gemini API
+
+    Set GEMINI_API_BASE to point the app at another server, for example the
+    local stub in gemini_stub_server.py when load testing.
+
+    Returns:
+        str: Base URL without a trailing slash
+    """
+    return os.environ.get("GEMINI_API_BASE", DEFAULT_GEMINI_API_BASE).rstrip("/")
+
+
+def gemini_configure_kwargs():
+    """
+    Extra keyword arguments for genai.configure
+
+    Returns:
+        dict: REST transport and endpoint override when GEMINI_API_BASE is set,
+              otherwise an empty dict so the SDK defaults are used
+    """
+    api_base = get_gemini_api_base()
+    if api_base == DEFAULT_GEMINI_API_BASE:
+        return {}
+    return {"transport": "rest", "client_options": {"api_endpoint": api_base}}
+
+
 def get_ai_budget_recommendation(income, categories, saving_preference, has_debt, 
                                planning_major_purchase, purchase_item="", purchase_cost=0, 
                                purchase_deadline=None, financial_goal="", life_stage="", custom_notes="",
@@ -31,20 +80,28 @@ def get_ai_budget_recommendation(income, categories, saving_preference, has_debt
         dict: Budget recommendation data
     """
     try:
-        # First try using Gemini API
-        api_response = get_gemini_recommendation(
-            income=income,
-            categories=categories,
-            saving_preference=saving_preference,
-            has_debt=has_debt,
-            planning_major_purchase=planning_major_purchase,
-            purchase_item=purchase_item,
-            purchase_cost=purchase_cost,
-            purchase_deadline=purchase_deadline,
-            financial_goal=financial_goal,
-            life_stage=life_stage,
-            custom_notes=custom_notes,
-            currency_symbol=currency_symbol
+        # First try using Gemini API; only real model answers are cached
+        cache_key = (income, tuple(categories), saving_preference, has_debt, planning_major_purchase, purchase_item,
+                     purchase_cost, purchase_deadline, financial_goal, life_stage, custom_notes, currency_symbol)
+        api_response = get_cache().get_or_set(
+            "budget_ai",
+            cache_key,
+            lambda: get_gemini_recommendation(
+                income=income,
+                categories=categories,
+                saving_preference=saving_preference,
+                has_debt=has_debt,
+                planning_major_purchase=planning_major_purchase,
+                purchase_item=purchase_item,
+                purchase_cost=purchase_cost,
+                purchase_deadline=purchase_deadline,
+                financial_goal=financial_goal,
+                life_stage=life_stage,
+                custom_notes=custom_notes,
+                currency_symbol=currency_symbol
+            ),
+            ttl=BUDGET_CACHE_TTL,
+            cache_if=bool
         )
         
         # If successful, return the Gemini response
@@ -97,7 +154,7 @@ def get_gemini_recommendation(income, categories, saving_preference, has_debt,
 
     # Initialize Gemini client
     try:
-        genai.configure(api_key=api_key)
+        genai.configure(api_key=api_key, **gemini_configure_kwargs())
     except Exception as e:
         print(f"Failed to initialize Gemini client: {str(e)}")
         # If Gemini client initialization fails, try direct API call with requests
@@ -134,12 +191,14 @@ def get_gemini_recommendation(income, categories, saving_preference, has_debt,
     )
     
     try:
-        # Configure the model
+        # Configure the model to answer with JSON matching the recommendation schema
         generation_config = {
             "temperature": 0.1,
             "top_p": 0.9,
             "top_k": 40,
             "max_output_tokens": 2048,
+            "response_mime_type": "application/json",
+            "response_schema": build_budget_response_schema(categories),
         }
         
         safety_settings = {
@@ -150,7 +209,7 @@ def get_gemini_recommendation(income, categories, saving_preference, has_debt,
         }
         
         model = genai.GenerativeModel(
-            model_name="gemini-1.5-pro",
+            model_name=BUDGET_MODEL_NAME,
             generation_config=generation_config,
             safety_settings=safety_settings
         )
@@ -163,34 +222,24 @@ def get_gemini_recommendation(income, categories, saving_preference, has_debt,
             {"role": "model", "parts": ["I'm ready to provide expert financial advice and budgeting guidance."]}
         ])
         
-        # Send the prompt
-        response = convo.send_message(prompt)
-        response_text = response.text
-        
-        # Extract JSON from response text
+        # Stream the answer into the incremental parser so a dropped stream
+        # still leaves us with everything generated up to that point
+        parser = IncrementalJSONParser()
         try:
-            # Find JSON within response (between triple backticks or just the JSON)
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_text = response_text[json_start:json_end]
-                ai_response = json.loads(json_text)
-                
-                # Ensure the AI response has all required keys
-                return validate_and_fix_ai_response(
-                    ai_response=ai_response,
-                    categories=categories,
-                    income=income,
-                    planning_major_purchase=planning_major_purchase,
-                    purchase_item=purchase_item,
-                    purchase_cost=purchase_cost,
-                    purchase_deadline=purchase_deadline
-                )
-                
+            for chunk in convo.send_message(prompt, stream=True):
+                parser.feed(chunk.text)
         except Exception as e:
-            print(f"Error parsing Gemini response: {e}")
-            print(f"Response text: {response_text[:300]}...")
-            return None
+            print(f"Gemini stream interrupted, salvaging partial response: {str(e)}")
+        
+        return parse_budget_recommendation(
+            parser=parser,
+            categories=categories,
+            income=income,
+            planning_major_purchase=planning_major_purchase,
+            purchase_item=purchase_item,
+            purchase_cost=purchase_cost,
+            purchase_deadline=purchase_deadline
+        )
             
     except Exception as e:
         print(f"Gemini API call error: {str(e)}")
@@ -249,43 +298,38 @@ def get_gemini_api_fallback(api_key, income, categories, saving_preference, has_
             "topP": 0.9,
             "topK": 40,
             "maxOutputTokens": 2048,
+            "responseMimeType": "application/json",
+            "responseSchema": build_budget_response_schema(categories),
         }
     }
     
     try:
         response = requests.post(
-            f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-pro:generateContent?key={api_key}",
+            f"{get_gemini_api_base()}/v1beta/models/{BUDGET_MODEL_NAME}:generateContent?key={api_key}",
             headers=headers,
             json=payload,
             timeout=30  # Add timeout to prevent hanging
         )
         
         if response.status_code == 200:
-            response_data = response.json()
-            response_text = response_data["candidates"][0]["content"]["parts"][0]["text"]
-            
-            # Extract JSON from response text
+            # Salvage what we can even if the body itself was cut short
             try:
-                json_start = response_text.find('{')
-                json_end = response_text.rfind('}') + 1
-                if json_start >= 0 and json_end > json_start:
-                    json_text = response_text[json_start:json_end]
-                    ai_response = json.loads(json_text)
-                    
-                    # Ensure the AI response has all required keys
-                    return validate_and_fix_ai_response(
-                        ai_response=ai_response,
-                        categories=categories,
-                        income=income,
-                        planning_major_purchase=planning_major_purchase,
-                        purchase_item=purchase_item,
-                        purchase_cost=purchase_cost,
-                        purchase_deadline=purchase_deadline
-                    )
-                    
-            except Exception as e:
-                print(f"Error parsing direct API response: {e}")
-                return None
+                response_data = response.json()
+                parts = response_data["candidates"][0]["content"]["parts"]
+                response_text = "".join(part.get("text", "") for part in parts)
+            except (ValueError, KeyError, IndexError) as e:
+                print(f"Malformed direct API response body, salvaging: {e}")
+                response_text = extract_text_from_partial_body(response.text)
+            
+            return parse_budget_recommendation(
+                parser=IncrementalJSONParser().feed(response_text),
+                categories=categories,
+                income=income,
+                planning_major_purchase=planning_major_purchase,
+                purchase_item=purchase_item,
+                purchase_cost=purchase_cost,
+                purchase_deadline=purchase_deadline
+            )
         else:
             print(f"Direct API call failed with status code {response.status_code}: {response.text}")
             return None
@@ -300,7 +344,7 @@ def create_budget_prompt(income, categories, saving_preference, has_debt,
                        purchase_deadline, financial_goal, life_stage, custom_notes="",
                        currency_symbol="₹"):
     """
-    Create a well-formatted prompt for the AI
+    Create a well-formatted prompt for the AI, metered against BUDGET_PROMPT_TOKEN_BUDGET
     
     Args:
         Same as get_ai_budget_recommendation
@@ -308,81 +352,205 @@ def create_budget_prompt(income, categories, saving_preference, has_debt,
     Returns:
         str: Formatted prompt for AI
     """
-   
     formatted_income = f"{income:,.2f}"
+    builder = PromptBuilder("budget_recommendation", BUDGET_PROMPT_TOKEN_BUDGET)
+    
+    builder.add_section("profile", [
+        "As a financial advisor, create a monthly budget allocation for a person with the following profile:",
+        f"- Monthly income: {currency_symbol} {formatted_income}",
+        f"- Primary financial goal: {financial_goal}",
+        f"- Life stage: {life_stage}",
+        f"- Desired savings rate: {saving_preference}%",
+        f"- Has significant debt: {'Yes' if has_debt else 'No'}",
+        f"- Planning major purchase soon: {'Yes' if planning_major_purchase else 'No'}"
+    ], required=True)
     
-    prompt = f"""
-As a financial advisor, create a monthly budget allocation for a person with the following profile:
-- Monthly income: {currency_symbol} {formatted_income}
-- Primary financial goal: {financial_goal}
-- Life stage: {life_stage}
-- Desired savings rate: {saving_preference}%
-- Has significant debt: {"Yes" if has_debt else "No"}
-- Planning major purchase soon: {"Yes" if planning_major_purchase else "No"}
-"""
-
     # Add purchase details if applicable
-    if planning_major_purchase and purchase_item and purchase_cost > 0 and purchase_deadline:
+    has_purchase_goal = planning_major_purchase and purchase_item and purchase_cost > 0 and purchase_deadline
+    if has_purchase_goal:
         days_until_goal = (purchase_deadline - datetime.now().date()).days
         months_until = max(1, round(days_until_goal / 30))
         formatted_cost = f"{purchase_cost:,.2f}"
-        prompt += f"""
-- Saving for: {purchase_item}
-- Estimated cost: {currency_symbol} {formatted_cost}
-- Target date: {purchase_deadline.strftime('%Y-%m-%d')} ({days_until_goal} days from now)
-- Timeline: Approximately {months_until} months
-"""
-
+        builder.add_section("purchase", [
+            f"- Saving for: {purchase_item}",
+            f"- Estimated cost: {currency_symbol} {formatted_cost}",
+            f"- Target date: {purchase_deadline.strftime('%Y-%m-%d')} ({days_until_goal} days from now)",
+            f"- Timeline: Approximately {months_until} months"
+        ], required=True)
+    
     if custom_notes:
-        prompt += f"- Additional context: {custom_notes}\n"
-
-    prompt += """
-Allocate the monthly income ONLY across these specific user-selected categories:
-""" + ", ".join(categories) + """
-
-For each category:
+        notes = " ".join(custom_notes.split())
+        if len(notes) > MAX_CUSTOM_NOTES_CHARS:
+            notes = notes[:MAX_CUSTOM_NOTES_CHARS - 1].rstrip() + "…"
+        builder.add_section("notes", f"- Additional context: {notes}", priority=1)
+    
+    builder.add_section("categories", [
+        "Allocate the monthly income ONLY across these specific user-selected categories:",
+        ", ".join(categories)
+    ], required=True)
+    
+    builder.add_section("category_instructions", """For each category:
 - Provide the recommended allocation as both a percentage and an absolute amount
 - Give a brief explanation of the reasoning based on the user's situation
-- Provide 1-2 tips for optimizing spending in this category
-
-If the user is saving for a specific purchase, create a dedicated savings plan that shows:
+- Provide 1-2 tips for optimizing spending in this category""", required=True)
+    
+    # Only ask for a savings plan analysis when there is a purchase to plan for
+    if has_purchase_goal:
+        builder.add_section("savings_plan_instructions", """Create a dedicated savings plan for the purchase that shows:
 - Monthly amount needed to reach the goal by the deadline
 - Percentage of income this represents
 - Whether this saving goal is realistic given their income and other expenses
-- Suggestions for adjusting the timeline if the goal is not realistic
-
-Return the response ONLY as a valid JSON object with this exact structure:
-```json
-{
-    "allocations": {
-        "Category1": {"percentage": 10, "amount": 1000},
-        "Category2": {"percentage": 20, "amount": 2000}
-    },
-    "explanations": {
-        "Category1": "Explanation text...",
-        "Category2": "Explanation text..."
-    },
-    "tips": {
-        "Category1": ["Tip 1", "Tip 2"],
-        "Category2": ["Tip 1", "Tip 2"]
-    },
-    "savings_plan": {
-        "item": "Name of item or empty if none",
-        "total_cost": 10000,
-        "monthly_amount": 500,
-        "timeline_months": 20,
-        "percentage_of_income": 10,
-        "is_realistic": true,
-        "recommendation": "Recommendation text if adjustment needed"
-    },
-    "summary": "Overall budget strategy summary..."
-}
-```
-
-Make sure all budget allocations correctly add up to 100% of income (or very close to it), and that you include ALL the categories I listed above in your response.
-"""
-    
-    return prompt
+- Suggestions for adjusting the timeline if the goal is not realistic""", required=True)
+    
+    builder.add_section("output_format", """Return the response as JSON matching the provided response schema: allocations (percentage and amount),
+explanations and tips keyed by category, a savings_plan (empty item if none) and an overall summary.
+
+Make sure all budget allocations correctly add up to 100% of income (or very close to it), and that you include ALL the categories I listed above in your response.""", required=True)
+    
+    return builder.build(financial_goal)
+
+
+def build_budget_response_schema(categories):
+    """
+    Build the response schema for structured budget recommendations
+    
+    Categories are spelled out as required properties so the model cannot
+    skip or rename any of the user's categories.
+    
+    Args:
+        categories (list): Budget categories
+        
+    Returns:
+        dict: Schema in the OpenAPI subset accepted by Gemini
+    """
+    def keyed_by_category(value_schema):
+        return {
+            "type": "OBJECT",
+            "properties": {category: value_schema for category in categories},
+            "required": list(categories)
+        }
+    
+    allocation_schema = {
+        "type": "OBJECT",
+        "properties": {
+            "percentage": {"type": "NUMBER"},
+            "amount": {"type": "NUMBER"}
+        },
+        "required": ["percentage", "amount"]
+    }
+    
+    savings_plan_schema = {
+        "type": "OBJECT",
+        "properties": {
+            "item": {"type": "STRING"},
+            "total_cost": {"type": "NUMBER"},
+            "monthly_amount": {"type": "NUMBER"},
+            "timeline_months": {"type": "INTEGER"},
+            "percentage_of_income": {"type": "NUMBER"},
+            "is_realistic": {"type": "BOOLEAN"},
+            "recommendation": {"type": "STRING"}
+        },
+        "required": ["item", "total_cost", "monthly_amount", "timeline_months",
+                     "percentage_of_income", "is_realistic", "recommendation"]
+    }
+    
+    # Allocations come first so a truncated answer still carries the numbers
+    return {
+        "type": "OBJECT",
+        "properties": {
+            "allocations": keyed_by_category(allocation_schema),
+            "explanations": keyed_by_category({"type": "STRING"}),
+            "tips": keyed_by_category({"type": "ARRAY", "items": {"type": "STRING"}}),
+            "savings_plan": savings_plan_schema,
+            "summary": {"type": "STRING"}
+        },
+        "required": ["allocations", "explanations", "tips", "savings_plan", "summary"]
+    }
+
+
+def extract_text_from_partial_body(body):
+    """
+    Pull the candidate text out of a generateContent body that was cut short
+    
+    Args:
+        body (str): Raw HTTP response body
+        
+    Returns:
+        str: Decoded text of the first part, possibly truncated
+    """
+    match = re.search(r'"text"\s*:\s*"', body or "")
+    if not match:
+        return ""
+    
+    raw = body[match.end():]
+    escape = False
+    for index, char in enumerate(raw):
+        if escape:
+            escape = False
+        elif char == "\\":
+            escape = True
+        elif char == '"':
+            raw = raw[:index]
+            break
+    
+    # Drop a dangling escape sequence left by the truncation
+    for trim in range(0, 7):
+        try:
+            return json.loads('"' + raw[:len(raw) - trim] + '"')
+        except ValueError:
+            continue
+    return ""
+
+
+def parse_budget_recommendation(parser, categories, income, planning_major_purchase=False,
+                                purchase_item="", purchase_cost=0, purchase_deadline=None):
+    """
+    Turn parsed (possibly truncated) model output into a validated recommendation
+    
+    Args:
+        parser (IncrementalJSONParser): Parser that has been fed the response text
+        Remaining args: Same as validate_and_fix_ai_response
+        
+    Returns:
+        dict: Validated recommendation, or None if too little was salvaged
+    """
+    ai_response = parser.result()
+    if not isinstance(ai_response, dict):
+        print("Gemini response contained no usable JSON")
+        return None
+    
+    allocations = ai_response.get("allocations")
+    covered = sum(1 for category in categories if isinstance(allocations, dict) and category in allocations)
+    if covered < len(categories) * MIN_SALVAGED_CATEGORY_SHARE:
+        print(f"Gemini response only covered {covered} of {len(categories)} categories")
+        return None
+    
+    if parser.truncated:
+        print(f"Salvaged truncated Gemini response covering {covered} of {len(categories)} categories")
+    
+    return validate_and_fix_ai_response(
+        ai_response=ai_response,
+        categories=categories,
+        income=income,
+        planning_major_purchase=planning_major_purchase,
+        purchase_item=purchase_item,
+        purchase_cost=purchase_cost,
+        purchase_deadline=purchase_deadline
+    )
+
+
+def _to_number(value):
+    """Coerce model output like 12, "12.5", "12%" or "1,200" to a float, or None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.replace(",", "").replace("%", "").strip())
+        except ValueError:
+            return None
+    return None
 
 
 def validate_and_fix_ai_response(ai_response, categories, income, planning_major_purchase=False,
@@ -390,6 +558,9 @@ def validate_and_fix_ai_response(ai_response, categories, income, planning_major
     """
     Validate and fix the AI response to ensure it has all required keys and data
     
+    Allocations, explanations and tips are coerced and filled in a single pass
+    over the categories; only the percentage normalization needs the total.
+    
     Args:
         ai_response (dict): Response from AI
         categories (list): Budget categories
@@ -402,54 +573,87 @@ def validate_and_fix_ai_response(ai_response, categories, income, planning_major
     Returns:
         dict: Validated and fixed AI response
     """
-    # Check for required keys
-    required_keys = ["allocations", "explanations", "tips", "summary"]
-    missing_keys = [key for key in required_keys if key not in ai_response]
-    
-    if missing_keys:
-        print(f"Missing keys in AI response: {missing_keys}")
-        for key in missing_keys:
-            if key == "allocations":
-                ai_response["allocations"] = {}
-            elif key == "explanations":
-                ai_response["explanations"] = {}
-            elif key == "tips":
-                ai_response["tips"] = {}
-            elif key == "summary":
-                ai_response["summary"] = "This budget is designed to balance your needs and financial goals."
-    
-    # Ensure all categories are covered
+    raw_allocations = ai_response.get("allocations")
+    raw_explanations = ai_response.get("explanations")
+    raw_tips = ai_response.get("tips")
+    raw_allocations = raw_allocations if isinstance(raw_allocations, dict) else {}
+    raw_explanations = raw_explanations if isinstance(raw_explanations, dict) else {}
+    raw_tips = raw_tips if isinstance(raw_tips, dict) else {}
+    
+    allocations = {}
+    explanations = {}
+    tips = {}
+    total_percentage = 0
+    
     for category in categories:
-        if category not in ai_response.get("allocations", {}):
+        allocation = raw_allocations.get(category)
+        if isinstance(allocation, dict):
+            percentage = _to_number(allocation.get("percentage"))
+            amount = _to_number(allocation.get("amount"))
+        else:
+            # A bare number is read as an amount
+            percentage = None
+            amount = _to_number(allocation)
+        
+        if percentage is None and amount is not None:
+            percentage = (amount / income * 100) if income > 0 else 0
+        elif percentage is None:
             # Default allocation of 5% for missing categories
-            ai_response.setdefault("allocations", {})[category] = {"percentage": 5, "amount": income * 0.05}
-            
-        if category not in ai_response.get("explanations", {}):
-            ai_response.setdefault("explanations", {})[category] = f"This allocation for {category} is based on your financial profile."
-            
-        if category not in ai_response.get("tips", {}):
-            ai_response.setdefault("tips", {})[category] = ["Track spending in this category", "Review periodically to ensure it aligns with your priorities"]
-    
-
-    total_percentage = sum(alloc.get("percentage", 0) for alloc in ai_response.get("allocations", {}).values())
+            percentage = 5
+        if amount is None:
+            amount = income * percentage / 100
+        
+        allocations[category] = {"percentage": percentage, "amount": amount}
+        total_percentage += percentage
+        
+        explanation = raw_explanations.get(category)
+        if not isinstance(explanation, str) or not explanation.strip():
+            explanation = f"This allocation for {category} is based on your financial profile."
+        explanations[category] = explanation
+        
+        category_tips = raw_tips.get(category)
+        if isinstance(category_tips, str):
+            category_tips = [category_tips]
+        if isinstance(category_tips, list):
+            category_tips = [tip for tip in category_tips if isinstance(tip, str) and tip.strip()]
+        if not category_tips:
+            category_tips = ["Track spending in this category", "Review periodically to ensure it aligns with your priorities"]
+        tips[category] = category_tips
     
     if abs(total_percentage - 100) > 5:  # If more than 5% off from 100%
         # Normalize the percentages
         factor = 100 / total_percentage if total_percentage > 0 else 1
-        for cat, alloc in ai_response.get("allocations", {}).items():
-            new_percentage = alloc.get("percentage", 0) * factor
+        for alloc in allocations.values():
+            new_percentage = alloc["percentage"] * factor
             alloc["percentage"] = round(new_percentage, 1)
             alloc["amount"] = round(income * new_percentage / 100, 2)
     
+    summary = ai_response.get("summary")
+    if not isinstance(summary, str) or not summary.strip():
+        summary = "This budget is designed to balance your needs and financial goals."
+    
+    savings_plan = ai_response.get("savings_plan")
+    if not isinstance(savings_plan, dict):
+        savings_plan = {}
+    savings_plan = {
+        "item": savings_plan.get("item") if isinstance(savings_plan.get("item"), str) else "",
+        "total_cost": _to_number(savings_plan.get("total_cost")) or 0,
+        "monthly_amount": _to_number(savings_plan.get("monthly_amount")) or 0,
+        "timeline_months": int(_to_number(savings_plan.get("timeline_months")) or 0),
+        "percentage_of_income": _to_number(savings_plan.get("percentage_of_income")) or 0,
+        "is_realistic": savings_plan.get("is_realistic") if isinstance(savings_plan.get("is_realistic"), bool) else True,
+        "recommendation": savings_plan.get("recommendation") if isinstance(savings_plan.get("recommendation"), str) else ""
+    }
+    
     # Add savings plan if needed
     if planning_major_purchase and purchase_item and purchase_cost > 0 and purchase_deadline:
-        if "savings_plan" not in ai_response or not ai_response.get("savings_plan", {}).get("item"):
+        if not savings_plan["item"]:
             days_until_goal = (purchase_deadline - datetime.now().date()).days
             months_until = max(1, round(days_until_goal / 30))
             monthly_amount = purchase_cost / months_until
-            percentage = (monthly_amount / income) * 100
+            percentage = (monthly_amount / income) * 100 if income > 0 else 0
             
-            ai_response["savings_plan"] = {
+            savings_plan = {
                 "item": purchase_item,
                 "total_cost": purchase_cost,
                 "monthly_amount": round(monthly_amount, 2),
@@ -459,7 +663,13 @@ def validate_and_fix_ai_response(ai_response, categories, income, planning_major
                 "recommendation": f"Save {monthly_amount:,.2f} monthly to reach your goal."
             }
     
-    return ai_response
+    return {
+        "allocations": allocations,
+        "explanations": explanations,
+        "tips": tips,
+        "savings_plan": savings_plan,
+        "summary": summary
+    }
 
 
 def generate_simulated_ai_response(income, categories, saving_preference, has_debt, 
@@ -471,80 +681,6 @@ def generate_simulated_ai_response(income, categories, saving_preference, has_de
     Returns:
         dict: Simulated budget recommendation
     """
-    
-    
-    if has_debt:
-        category_weights = {
-            "Essentials": 0.45,
-            "Lifestyle": 0.15,
-            "Savings & Investments": saving_preference / 100,
-            "Debt & EMIs": 0.25,
-            "Other / Subscriptions": 0.05
-        }
-    elif financial_goal in ["Save for emergency fund", "Save for major purchase"]:
-        category_weights = {
-            "Essentials": 0.45,
-            "Lifestyle": 0.2,
-            "Savings & Investments": saving_preference / 100,
-            "Debt & EMIs": 0.05,
-            "Other / Subscriptions": 0.05
-        }
-    elif financial_goal == "Build long-term wealth":
-        category_weights = {
-            "Essentials": 0.4,
-            "Lifestyle": 0.15,
-            "Savings & Investments": saving_preference / 100,
-            "Debt & EMIs": 0.05,
-            "Other / Subscriptions": 0.05
-        }
-    else:
-        category_weights = {
-            "Essentials": 0.4,
-            "Lifestyle": 0.3,
-            "Savings & Investments": saving_preference / 100,
-            "Debt & EMIs": 0.05,
-            "Other / Subscriptions": 0.05
-        }
-
-    
-    total_weight = sum(category_weights.values())
-    if total_weight != 1.0:
-        for cat in category_weights:
-            category_weights[cat] /= total_weight
-
-    
-    category_types = {
-        "Essentials": ["Essentials", "Food & Dining", "Transportation", "Health"],
-        "Lifestyle": ["Lifestyle", "Entertainment", "Shopping", "Travel"],
-        "Savings & Investments": ["Savings & Investments", "Investments"],
-        "Debt & EMIs": ["Debt & EMIs"],
-        "Other / Subscriptions": ["Other / Subscriptions", "Subscriptions", "Gifts & Donations", "Education"]
-    }
-
-    category_map = {}
-    for cat in categories:
-        for main_cat, sub_cats in category_types.items():
-            if cat in sub_cats:
-                category_map[cat] = main_cat
-                break
-        else:
-            category_map[cat] = "Other / Subscriptions"
-
-    # Count how many categories fall into each type
-    type_counts = {}
-    for cat_type in category_map.values():
-        type_counts[cat_type] = type_counts.get(cat_type, 0) + 1
-
-    # Calculate allocation per category
-    allocations = {}
-    for cat in categories:
-        main_type = category_map[cat]
-        weight = category_weights.get(main_type, 0) / max(1, type_counts.get(main_type, 1))
-        amount = round(income * weight, 2)
-        allocations[cat] = {
-            "percentage": round(weight * 100, 1),
-            "amount": amount
-        }
 
     # Savings plan setup
     savings_plan = {
@@ -556,6 +692,7 @@ def generate_simulated_ai_response(income, categories, saving_preference, has_de
         "is_realistic": True,
         "recommendation": ""
     }
+    goal_contribution = 0
 
     if planning_major_purchase and purchase_item and purchase_cost > 0 and purchase_deadline:
         days_until = (purchase_deadline - datetime.now().date()).days
@@ -581,22 +718,14 @@ def generate_simulated_ai_response(income, categories, saving_preference, has_de
             "is_realistic": is_realistic,
             "recommendation": recommendation
         }
+        goal_contribution = monthly_amount
 
-        # Adjust allocations
-        savings_cats = [cat for cat in categories if "Savings" in cat or "Investments" in cat]
-        if savings_cats:
-            savings_cat = max(savings_cats, key=lambda c: allocations.get(c, {"amount": 0})["amount"])
-            shortfall = monthly_amount - allocations[savings_cat]["amount"]
-            if shortfall > 0:
-                lifestyle_cats = [c for c in categories if c in category_types["Lifestyle"]]
-                total_lifestyle = sum([allocations[c]["amount"] for c in lifestyle_cats])
-                if total_lifestyle > shortfall:
-                    for c in lifestyle_cats:
-                        reduce_amt = (allocations[c]["amount"] / total_lifestyle) * shortfall
-                        allocations[c]["amount"] -= reduce_amt
-                        allocations[c]["percentage"] = round((allocations[c]["amount"] / income) * 100, 1)
-                    allocations[savings_cat]["amount"] = monthly_amount
-                    allocations[savings_cat]["percentage"] = round((monthly_amount / income) * 100, 1)
+    # Allocate income, moving the goal contribution from lifestyle into savings
+    allocations = to_percentages(
+        allocate(income, categories, goal_group_weights(financial_goal, saving_preference, has_debt),
+                 goal_contribution=goal_contribution),
+        income
+    )
 
     # Tips and explanations
     explanations = {}
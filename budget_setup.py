@@ -7,7 +7,21 @@ from firebase_admin import firestore
 from datetime import datetime, timedelta
 import numpy as np
 from budget_ai import get_ai_budget_recommendation
-def budget_setup(user_id):
+from allocation_engine import DEFAULT_GROUP_WEIGHTS, allocate
+from money import DEFAULT_CURRENCY, allocation_fields, minor_per_unit, stored_allocations
+from category_registry import LIFESTYLE, REGISTRY, SAVINGS, canonical_amounts, canonical_categories
+from savings_projection import add_months, project_goal
+from task_executor import DONE, FAILED, pop_finished, submit_task, watch_task
+from fragments import page_fragment
+from figure_cache import cached_figure
+from savings_goals import (DEFAULT_STRATEGY, STRATEGIES, add_contributions, create_goal, delete_goal, load_goals,
+                           monthly_savings_budget, schedule_contributions)
+import plotly.graph_objects as go
+
+# Categories whose allocation shouldn't drop below 20% of income
+CORE_NEEDS = frozenset({"Essentials", "Food & Dining"})
+
+def budget_setup(user_id, user_data=None):
     st.markdown("""
     <div class="header-banner">
         <h1>💸 Smart Budget Setup</h1>
@@ -15,45 +29,22 @@ def budget_setup(user_id):
     </div>
     """, unsafe_allow_html=True)
     
-    # Get user data
-    user_doc = db.collection("users").document(user_id).get()
-    user_data = user_doc.to_dict()
+    # Get user data, unless the caller already read it
+    if user_data is None:
+        user_data = db.collection("users").document(user_id).get().to_dict()
     
     income = user_data.get('income', 0)
     currency_symbol = user_data.get('currency', '₹ INR').split()[0]
     
     # Get user-selected categories from Firebase
     user_categories = user_data.get('categories', [])
-    # Clean category names (remove emojis)
-    clean_categories = [cat.split(" ", 1)[1] if " " in cat else cat for cat in user_categories]
-    
-    # If no categories are found, use default budget categories
-    if not clean_categories:
-        clean_categories = ["Essentials", "Lifestyle", "Savings & Investments", "Debt & EMIs", "Other / Subscriptions"]
+    # Canonical category names (emoji labels and aliases resolved)
+    clean_categories = canonical_categories(user_categories)
     
-    # Create budget categories dict with descriptions
     budget_categories = {}
-    category_descriptions = {
-        "Essentials": "Rent/mortgage, utilities, groceries, transportation",
-        "Food & Dining": "Groceries, restaurants, food delivery",
-        "Transportation": "Public transport, fuel, vehicle maintenance",
-        "Entertainment": "Movies, events, hobbies",
-        "Shopping": "Clothing, electronics, personal items",
-        "Health": "Medical expenses, insurance, fitness",
-        "Education": "Courses, books, tuition",
-        "Subscriptions": "Streaming services, memberships, apps",
-        "Investments": "Stocks, mutual funds, retirement",
-        "Gifts & Donations": "Presents, charitable donations",
-        "Travel": "Vacations, trips, accommodations",
-        "Lifestyle": "Dining out, entertainment, shopping, hobbies",
-        "Savings & Investments": "Emergency fund, retirement, investments",
-        "Debt & EMIs": "Loan payments, credit card debt, EMIs",
-        "Other / Subscriptions": "Streaming services, memberships, miscellaneous"
-    }
-    
     # Create budget categories dict with descriptions for user-selected categories
     for cat in clean_categories:
-        description = category_descriptions.get(cat, "Miscellaneous expenses")
+        description = REGISTRY.description(cat)
         budget_categories[cat] = description
     
     st.subheader(f"Your Monthly Income: {currency_symbol} {income:,}")
@@ -64,59 +55,16 @@ def budget_setup(user_id):
     # Initialize budget allocations in session state if not present
     if "budget_allocations" not in st.session_state:
         # Use existing allocations if available in user data
-        existing_allocations = user_data.get('budget_allocations', {})
+        existing_allocations = canonical_amounts(stored_allocations(user_data))
         if existing_allocations:
             st.session_state.budget_allocations = existing_allocations
         else:
             # Default allocations based on 50/30/20 rule (simplified)
-            # Distribute based on category types
-            essentials_cats = [c for c in clean_categories if c in ["Essentials", "Food & Dining", "Transportation", "Health"]]
-            lifestyle_cats = [c for c in clean_categories if c in ["Lifestyle", "Entertainment", "Shopping", "Travel"]]
-            savings_cats = [c for c in clean_categories if c in ["Savings & Investments", "Investments"]]
-            debt_cats = [c for c in clean_categories if c in ["Debt & EMIs"]]
-            other_cats = [c for c in clean_categories if c not in essentials_cats + lifestyle_cats + savings_cats + debt_cats]
-            
-            # Calculate default allocations
-            st.session_state.budget_allocations = {}
-            
-            # Distribute essentials (50%)
-            if essentials_cats:
-                per_essential = (income * 0.5) / len(essentials_cats)
-                for cat in essentials_cats:
-                    st.session_state.budget_allocations[cat] = per_essential
-                    
-            # Distribute lifestyle (30%)
-            if lifestyle_cats:
-                per_lifestyle = (income * 0.3) / len(lifestyle_cats)
-                for cat in lifestyle_cats:
-                    st.session_state.budget_allocations[cat] = per_lifestyle
-                    
-            # Distribute savings (15%)
-            if savings_cats:
-                per_savings = (income * 0.15) / len(savings_cats)
-                for cat in savings_cats:
-                    st.session_state.budget_allocations[cat] = per_savings
-                    
-            # Distribute debt (5%)
-            if debt_cats:
-                per_debt = (income * 0.05) / len(debt_cats)
-                for cat in debt_cats:
-                    st.session_state.budget_allocations[cat] = per_debt
-                    
-            # Distribute other
-            if other_cats:
-                remaining = income - sum(st.session_state.budget_allocations.values())
-                per_other = max(0, remaining) / len(other_cats)
-                for cat in other_cats:
-                    st.session_state.budget_allocations[cat] = per_other
-            
-            # Ensure all categories are covered
-            for cat in clean_categories:
-                if cat not in st.session_state.budget_allocations:
-                    st.session_state.budget_allocations[cat] = 0
+            st.session_state.budget_allocations = allocate(income, clean_categories, DEFAULT_GROUP_WEIGHTS)
     
-    # MANUAL SETUP TAB
-    with tab1:
+    # MANUAL SETUP TAB; moving a slider reruns only this tab
+    @page_fragment("budget_setup.manual")
+    def manual_setup():
         st.write("Adjust the sliders to allocate your monthly income across categories:")
         
         # For storing updated values
@@ -124,7 +72,7 @@ def budget_setup(user_id):
         
         # Create sliders for each category
         for category in clean_categories:
-            description = category_descriptions.get(category, "")
+            description = REGISTRY.description(category)
             col1, col2 = st.columns([3, 1])
             with col1:
                 # Calculate percentage of income
@@ -144,11 +92,12 @@ def budget_setup(user_id):
                 updated_values[category] = new_amount
                 
                 # Add warning if allocation seems excessive based on category
-                if category in ["Entertainment", "Shopping", "Travel", "Lifestyle"] and new_percentage > 30:
+                group = REGISTRY.group(category)
+                if group == LIFESTYLE and new_percentage > 30:
                     st.warning(f"⚠️ Your allocation for {category} seems high at {new_percentage:.1f}%. Consider reducing it.")
-                elif category in ["Essentials", "Food & Dining"] and new_percentage < 20:
+                elif category in CORE_NEEDS and new_percentage < 20:
                     st.warning(f"⚠️ Your allocation for {category} seems low at {new_percentage:.1f}%. Make sure it's sufficient.")
-                elif category in ["Savings & Investments", "Investments"] and new_percentage < 10:
+                elif group == SAVINGS and new_percentage < 10:
                     st.warning(f"⚠️ Consider allocating at least 10% to savings/investments for financial security.")
             
             with col2:
@@ -182,11 +131,18 @@ def budget_setup(user_id):
                 
                 # Save to Firestore
                 db.collection("users").document(user_id).update({
-                    "budget_allocations": updated_values,
+                    **allocation_fields(updated_values, user_data.get('currency')),
                     "budget_updated_at": firestore.SERVER_TIMESTAMP
                 })
                 
-                st.success("Budget updated successfully!")
+                # The allocation chart below the tabs shows the new budget after a full rerun
+                st.session_state.budget_notice = "Budget updated successfully!"
+                st.rerun()
+    
+    with tab1:
+        if st.session_state.get("budget_notice"):
+            st.success(st.session_state.pop("budget_notice"))
+        manual_setup()
     
     # AI ASSISTANT TAB
     with tab2:
@@ -248,329 +204,377 @@ def budget_setup(user_id):
                                        placeholder="E.g., I'm saving for a wedding next year, I need to pay medical bills, etc.")
             
             if st.button("Generate AI Budget Recommendation"):
-                with st.spinner("AI is creating your personalized budget plan..."):
-                    try:
-                        # Create prompt for AI that includes user-selected categories
-                        prompt = f"""
-                        As a financial advisor, create a monthly budget allocation for a person with the following profile:
-                        - Monthly income: {currency_symbol} {income:,}
-                        - Primary financial goal: {financial_goal}
-                        - Life stage: {life_stage}
-                        - Risk tolerance: {risk_tolerance}
-                        - Desired savings rate: {saving_preference}%
-                        - Has significant debt: {"Yes" if has_debt else "No"}
-                        - Has dependents: {"Yes" if has_dependents else "No"}
-                        - Planning major purchase soon: {"Yes" if planning_major_purchase else "No"}
-                        """
-                        
-                        # Add purchase details if applicable
-                        if planning_major_purchase:
-                            days_until_goal = (purchase_deadline - datetime.now().date()).days
-                            prompt += f"""
-                            - Saving for: {purchase_item}
-                            - Estimated cost: {currency_symbol} {purchase_cost:,}
-                            - Target date: {purchase_deadline.strftime('%Y-%m-%d')} ({days_until_goal} days from now)
-                            """
-                        
-                        prompt += f"""
-                        Allocate the monthly income ONLY across these specific user-selected categories:
-                        {", ".join(clean_categories)}
-                        
-                        For each category:
-                        - Provide the recommended allocation as both a percentage and an absolute amount
-                        - Give a brief explanation of the reasoning based on the user's situation
-                        - Provide 1-2 tips for optimizing spending in this category
-                        
-                        If the user is saving for a specific purchase, create a dedicated savings plan that shows:
-                        - Monthly amount needed to reach the goal by the deadline
-                        - Percentage of income this represents
-                        - Whether this saving goal is realistic given their income and other expenses
-                        - Suggestions for adjusting the timeline if the goal is not realistic
-                        
-                        Return the response as a valid JSON object with allocations, explanations, tips, savings_plan and summary fields.
-                        """
-                        
-                        # In a real implementation, this would call OpenAI's API
-                        # For demo purposes, we'll create a sample response
-                        
-                        # Simulated AI response (in production, replace with actual API call)
-                        # Example with OpenAI:
-                        # response = openai.chat.completions.create(
-                        #     model="gpt-3.5-turbo",
-                        #     messages=[{"role": "system", "content": "You are a financial advisor."},
-                        #               {"role": "user", "content": prompt}]
-                        # )
-                        # ai_response = json.loads(response.choices[0].message.content)
-                        
-                        # Simulated response based on inputs
-                        ai_response = get_ai_budget_recommendation(
-                            income=income,
-                            categories=clean_categories,
-                            saving_preference=saving_preference,
-                            has_debt=has_debt,
-                            planning_major_purchase=planning_major_purchase,
-                            purchase_item=purchase_item,
-                            purchase_cost=purchase_cost,
-                            purchase_deadline=purchase_deadline,
-                            financial_goal=financial_goal,
-                            life_stage=life_stage
-                        )
+                # Remember the form answers so batch regeneration uses the same inputs
+                db.collection("users").document(user_id).update({
+                    "ai_preferences": {
+                        "financial_goal": financial_goal,
+                        "life_stage": life_stage,
+                        "saving_preference": saving_preference,
+                        "has_debt": has_debt
+                    }
+                })
+                
+                # The prompt has no fields of its own for these, so they go in with the user's notes
+                notes = f"Risk tolerance for investments: {risk_tolerance}. Has dependents: {'Yes' if has_dependents else 'No'}."
+                if custom_notes:
+                    notes += f" {custom_notes}"
+                
+                # Generate in the background so a rerun doesn't cancel the request
+                submit_task(
+                    "ai_budget",
+                    get_ai_budget_recommendation,
+                    income=income,
+                    categories=clean_categories,
+                    saving_preference=saving_preference,
+                    has_debt=has_debt,
+                    planning_major_purchase=planning_major_purchase,
+                    purchase_item=purchase_item,
+                    purchase_cost=purchase_cost,
+                    purchase_deadline=purchase_deadline,
+                    financial_goal=financial_goal,
+                    life_stage=life_stage,
+                    custom_notes=notes,
+                    meta={"planning_major_purchase": planning_major_purchase, "purchase_deadline": purchase_deadline}
+                )
+            
+            watch_task("ai_budget", "AI is creating your personalized budget plan...")
+            budget_task = pop_finished("ai_budget")
+            
+            if budget_task and budget_task.status == FAILED:
+                st.error(f"Error generating budget recommendation: {budget_task.error}")
+            elif budget_task and budget_task.status == DONE:
+                # Apply a new recommendation once; after that it only seeds the sliders, which the user may change
+                ai_response = budget_task.result
+                planning_major_purchase = budget_task.meta["planning_major_purchase"]
+                purchase_deadline = budget_task.meta["purchase_deadline"]
+                try:
+                    # Update session state with AI recommendations
+                    st.session_state.budget_allocations = {
+                        category: allocation["amount"] for category, allocation in ai_response["allocations"].items()
+                    }
+                    st.session_state.budget_explanations = ai_response["explanations"]
+                    st.session_state.budget_tips = ai_response["tips"]
+                    st.session_state.budget_summary = ai_response["summary"]
+                    
+                    # Save savings goal if applicable
+                    if planning_major_purchase and ai_response["savings_plan"]["item"]:
+                        savings_plan = ai_response["savings_plan"]
                         
-                        # Update session state with AI recommendations
-                        updated_budget = {}
-                        for category, allocation in ai_response["allocations"].items():
-                            updated_budget[category] = allocation["amount"]
+                        st.session_state.savings_goal = {
+                            "item": savings_plan["item"],
+                            "total_cost": savings_plan["total_cost"],
+                            "monthly_amount": savings_plan["monthly_amount"],
+                            "timeline_months": savings_plan["timeline_months"],
+                            "target_date": purchase_deadline.isoformat(),
+                            "start_date": datetime.now().date().isoformat(),
+                            "percentage_of_income": savings_plan["percentage_of_income"]
+                        }
+                except Exception as e:
+                    st.error(f"Error generating budget recommendation: {str(e)}")
+                else:
+                    # Sliders start again from the recommendation, and the page above redraws with it
+                    for category in clean_categories:
+                        st.session_state.pop(f"slider_{category}", None)
+                    st.session_state.ai_budget_recommendation = {
+                        "response": ai_response,
+                        "planning_major_purchase": planning_major_purchase,
+                        "purchase_deadline": purchase_deadline
+                    }
+                    st.rerun()
+            
+            recommendation = st.session_state.get("ai_budget_recommendation")
+            if recommendation:
+                # Show the recommendation with the inputs it was generated from
+                ai_response = recommendation["response"]
+                planning_major_purchase = recommendation["planning_major_purchase"]
+                purchase_deadline = recommendation["purchase_deadline"]
+                try:
+                    updated_budget = {
+                        category: allocation["amount"] for category, allocation in ai_response["allocations"].items()
+                    }
+                    
+                    # Display the recommended budget
+                    st.success("AI has generated your personalized budget recommendation!")
+                    
+                    # Create visualization
+                    budget_df = pd.DataFrame({
+                        'Category': list(ai_response["allocations"].keys()),
+                        'Amount': [allocation["amount"] for allocation in ai_response["allocations"].values()],
+                        'Percentage': [allocation["percentage"] for allocation in ai_response["allocations"].values()]
+                    })
+                    
+                    # Create pie chart
+                    fig = cached_figure("recommended_budget", budget_df[['Category', 'Amount']], recommendation_pie)
+                    st.plotly_chart(fig, use_container_width=True)
+                    
+                    # Display explanations and tips
+                    st.subheader("Budget Strategy")
+                    st.write(ai_response["summary"])
+                    
+                    # If saving for specific purchase, show savings plan
+                    if planning_major_purchase and ai_response["savings_plan"]["item"]:
+                        savings_plan = ai_response["savings_plan"]
+                        st.subheader(f"Savings Plan: {savings_plan['item']}")
                         
-                        st.session_state.budget_allocations = updated_budget
-                        st.session_state.budget_explanations = ai_response["explanations"]
-                        st.session_state.budget_tips = ai_response["tips"]
-                        st.session_state.budget_summary = ai_response["summary"]
+                        savings_cols = st.columns(3)
+                        with savings_cols[0]:
+                            st.metric("Total Cost", f"{currency_symbol} {savings_plan['total_cost']:,.0f}")
+                        with savings_cols[1]:
+                            st.metric("Monthly Savings", f"{currency_symbol} {savings_plan['monthly_amount']:,.0f}")
+                        with savings_cols[2]:
+                            st.metric("Timeline", f"{savings_plan['timeline_months']} months")
                         
-                        # Save savings goal if applicable
-                        if planning_major_purchase and ai_response["savings_plan"]["item"]:
-                            savings_plan = ai_response["savings_plan"]
-                            
-                            st.session_state.savings_goal = {
-                                "item": savings_plan["item"],
-                                "total_cost": savings_plan["total_cost"],
-                                "monthly_amount": savings_plan["monthly_amount"],
-                                "timeline_months": savings_plan["timeline_months"],
-                                "target_date": purchase_deadline.isoformat(),
-                                "start_date": datetime.now().date().isoformat(),
-                                "percentage_of_income": savings_plan["percentage_of_income"]
+                        if savings_plan["is_realistic"]:
+                            st.success(f"This savings goal is achievable with your current income!")
+                        else:
+                            st.warning(f"{savings_plan['recommendation']}")
+                    
+                    st.subheader("Category Breakdown")
+                    for category in budget_df['Category']:
+                        allocation = ai_response["allocations"][category]
+                        with st.expander(f"{category} - {allocation['percentage']}% ({currency_symbol} {allocation['amount']:,.2f})"):
+                            st.write(ai_response["explanations"][category])
+                            st.subheader("Tips:")
+                            for tip in ai_response["tips"][category]:
+                                st.write(f"• {tip}")
+                    
+                    # Save button
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        if st.button("Apply This Budget"):
+                            # Save budget to Firestore
+                            update_data = {
+                                **allocation_fields(updated_budget, user_data.get('currency')),
+                                "budget_updated_at": firestore.SERVER_TIMESTAMP
                             }
-                        
-                        # Display the recommended budget
-                        st.success("AI has generated your personalized budget recommendation!")
-                        
-                        # Create visualization
-                        budget_df = pd.DataFrame({
-                            'Category': list(ai_response["allocations"].keys()),
-                            'Amount': [allocation["amount"] for allocation in ai_response["allocations"].values()],
-                            'Percentage': [allocation["percentage"] for allocation in ai_response["allocations"].values()]
-                        })
-                        
-                        # Create pie chart
-                        fig = px.pie(
-                            budget_df, 
-                            values='Amount', 
-                            names='Category',
-                            color_discrete_sequence=px.colors.sequential.Bluyl, 
-                            hole=0.4
-                        )
-                        
-                        fig.update_layout(
-                            margin=dict(l=20, r=20, t=30, b=20),
-                            height=300
-                        )
-                        
-                        st.plotly_chart(fig, use_container_width=True)
-                        
-                        # Display explanations and tips
-                        st.subheader("Budget Strategy")
-                        st.write(ai_response["summary"])
-                        
-                        # If saving for specific purchase, show savings plan
-                        if planning_major_purchase and ai_response["savings_plan"]["item"]:
-                            savings_plan = ai_response["savings_plan"]
-                            st.subheader(f"Savings Plan: {savings_plan['item']}")
                             
-                            savings_cols = st.columns(3)
-                            with savings_cols[0]:
-                                st.metric("Total Cost", f"{currency_symbol} {savings_plan['total_cost']:,.0f}")
-                            with savings_cols[1]:
-                                st.metric("Monthly Savings", f"{currency_symbol} {savings_plan['monthly_amount']:,.0f}")
-                            with savings_cols[2]:
-                                st.metric("Timeline", f"{savings_plan['timeline_months']} months")
+                            db.collection("users").document(user_id).update(update_data)
                             
-                            if savings_plan["is_realistic"]:
-                                st.success(f"This savings goal is achievable with your current income!")
-                            else:
-                                st.warning(f"{savings_plan['recommendation']}")
-                        
-                        st.subheader("Category Breakdown")
-                        for category in budget_df['Category']:
-                            allocation = ai_response["allocations"][category]
-                            with st.expander(f"{category} - {allocation['percentage']}% ({currency_symbol} {allocation['amount']:,.2f})"):
-                                st.write(ai_response["explanations"][category])
-                                st.subheader("Tips:")
-                                for tip in ai_response["tips"][category]:
-                                    st.write(f"• {tip}")
-                        
-                        # Save button
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            if st.button("Apply This Budget"):
-                                # Save budget to Firestore
-                                update_data = {
-                                    "budget_allocations": updated_budget,
-                                    "budget_updated_at": firestore.SERVER_TIMESTAMP
-                                }
-                                
-                                # Save savings goal if applicable
-                                if planning_major_purchase and ai_response["savings_plan"]["item"]:
-                                    savings_goal = {
-                                        "item": savings_plan["item"],
-                                        "total_cost": savings_plan["total_cost"], 
-                                        "monthly_amount": savings_plan["monthly_amount"],
-                                        "timeline_months": savings_plan["timeline_months"],
-                                        "target_date": purchase_deadline.isoformat(),
-                                        "start_date": datetime.now().date().isoformat(),
-                                        "current_savings": 0,
-                                        "percentage_of_income": savings_plan["percentage_of_income"]
-                                    }
-                                    
-                                    update_data["savings_goal"] = savings_goal
-                                
-                                db.collection("users").document(user_id).update(update_data)
-                                st.success("Budget and savings plan saved successfully!")
-                        
-                        with col2:
-                            if st.button("Adjust Manually"):
-                                st.session_state.active_tab = "Manual Setup"
-                                st.rerun()
+                            # Save savings goal if applicable
+                            if planning_major_purchase and ai_response["savings_plan"]["item"]:
+                                create_goal(user_id, user_data, savings_plan["item"], savings_plan["total_cost"],
+                                            purchase_deadline.isoformat(), priority=1)
+                            
+                            st.success("Budget and savings plan saved successfully!")
                     
-                    except Exception as e:
-                        st.error(f"Error generating budget recommendation: {str(e)}")
+                    with col2:
+                        if st.button("Adjust Manually"):
+                            st.session_state.active_tab = "Manual Setup"
+                            st.rerun()
+                    
+                except Exception as e:
+                    st.error(f"Error generating budget recommendation: {str(e)}")
         else:
             st.info("Enable AI assistance to get personalized budget recommendations based on your financial situation.")
     
-    # SAVINGS GOALS TAB
-    with tab3:
+    # SAVINGS GOALS TAB; its forms and controls rerun only this tab
+    @page_fragment("budget_setup.goals")
+    def goals_tab():
         st.subheader("Set and Track Savings Goals")
         
-        # Get existing savings goal if any
-        existing_goal = user_data.get('savings_goal', None)
+        # Goals and their rollups: one read per goal, however many contributions
+        goals = load_goals(user_id, user_data)
+        currency = user_data.get('currency', DEFAULT_CURRENCY)
+        today = datetime.now().date()
         
-        if existing_goal:
-            # Display existing goal
-            st.write("### Current Savings Goal")
+        if goals:
+            # Split this month's savings budget across the goals
+            st.write("### Monthly Contribution Plan")
+            monthly_savings = monthly_savings_budget(user_data)
+            strategy_keys = list(STRATEGIES)
+            saved_strategy = user_data.get('goal_strategy', DEFAULT_STRATEGY)
+            strategy = st.radio(
+                "Split monthly savings",
+                strategy_keys,
+                index=strategy_keys.index(saved_strategy) if saved_strategy in strategy_keys else 0,
+                format_func=STRATEGIES.get,
+                horizontal=True,
+                help="Deadline-weighted gives more to goals that need a faster pace; waterfall fills the top priority goal first."
+            )
+            if strategy != saved_strategy:
+                db.collection("users").document(user_id).update({"goal_strategy": strategy})
+                # Fragment reruns reuse this run's user_data
+                user_data['goal_strategy'] = strategy
             
-            # Calculate progress
-            goal_item = existing_goal.get('item', 'Goal')
-            goal_cost = existing_goal.get('total_cost', 0)
-            goal_monthly = existing_goal.get('monthly_amount', 0)
-            goal_timeline = existing_goal.get('timeline_months', 0)
-            goal_start = existing_goal.get('start_date', datetime.now().date().isoformat())
-            goal_target = existing_goal.get('target_date', datetime.now().date().isoformat())
-            current_savings = existing_goal.get('current_savings', 0)
+            plan = schedule_contributions(goals, monthly_savings, strategy, today, minor_per_unit(currency))
+            unallocated = plan.pop(None, 0)
+            planned_total = sum(plan.values())
             
-            # Convert dates
-            try:
-                start_date = datetime.fromisoformat(goal_start).date()
-            except:
-                start_date = datetime.now().date()
+            if monthly_savings > 0:
+                plan_df = pd.DataFrame([
+                    {
+                        "Goal": goal['item'],
+                        "Priority": goal.get('priority', 1),
+                        "Target Date": goal.get('target_date', ''),
+                        "Remaining": goal['remaining'],
+                        "This Month": plan.get(goal['id'], 0)
+                    }
+                    for goal in goals
+                ])
+                st.dataframe(plan_df, hide_index=True, use_container_width=True)
+                caption = f"{currency_symbol} {monthly_savings:,.2f} budgeted for savings this month."
+                if unallocated > 0:
+                    caption += f" {currency_symbol} {unallocated:,.2f} is left over once every goal is covered."
+                st.caption(caption)
                 
-            try:
-                target_date = datetime.fromisoformat(goal_target).date()
-            except:
-                target_date = datetime.now().date() + timedelta(days=365)
-            
-            # Calculate progress
-            progress_percent = (current_savings / goal_cost) * 100 if goal_cost > 0 else 0
-            days_elapsed = (datetime.now().date() - start_date).days
-            days_total = (target_date - start_date).days
-            time_progress = (days_elapsed / days_total) * 100 if days_total > 0 else 0
-            
-            # Display goal info
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("Saving for", goal_item)
-                st.metric("Total Cost", f"{currency_symbol} {goal_cost:,.2f}")
-                st.metric("Monthly Contribution", f"{currency_symbol} {goal_monthly:,.2f}")
-            
-            with col2:
-                st.metric("Current Savings", f"{currency_symbol} {current_savings:,.2f}")
-                st.metric("Target Date", target_date.strftime("%Y-%m-%d"))
-                st.metric("Days Remaining", f"{max(0, (target_date - datetime.now().date()).days)} days")
-            
-            # Display progress bars
-            st.subheader("Savings Progress")
-            st.progress(min(progress_percent / 100, 1.0))
-            st.write(f"{progress_percent:.1f}% saved ({currency_symbol} {current_savings:,.2f} of {currency_symbol} {goal_cost:,.2f})")
-            
-            st.subheader("Time Progress")
-            st.progress(min(time_progress / 100, 1.0))
-            st.write(f"{time_progress:.1f}% of time elapsed")
-            
-            # Compare savings vs time progress
-            if progress_percent > time_progress + 5:
-                st.success(f"You're ahead of schedule by {progress_percent - time_progress:.1f}%!")
-            elif time_progress > progress_percent + 5:
-                st.warning(f"You're behind schedule by {time_progress - progress_percent:.1f}%. Consider increasing your monthly contributions.")
+                # At most one scheduled contribution per goal per month
+                this_month = today.strftime("%Y-%m")
+                if user_data.get('last_scheduled_month') == this_month:
+                    st.info("This month's plan has already been added to your goals.")
+                elif plan and st.button("Add This Month's Contributions"):
+                    add_contributions(user_id, user_data, goals, plan, source="schedule",
+                                      user_updates={"last_scheduled_month": this_month})
+                    st.success(f"Added {currency_symbol} {planned_total:,.2f} across {len(plan)} goals!")
+                    st.rerun()
             else:
-                st.info("You're on track to meet your savings goal!")
-            
-            # Update savings
-            with st.form("update_savings"):
-                st.subheader("Update Your Progress")
-                new_savings = st.number_input("Current Savings Amount", min_value=0.0, value=float(current_savings))
-                submit_update = st.form_submit_button("Update Progress")
-                
-                if submit_update:
-                    # Update savings in Firestore
-                    existing_goal['current_savings'] = new_savings
-                    db.collection("users").document(user_id).update({
-                        "savings_goal.current_savings": new_savings
-                    })
-                    st.success(f"Savings progress updated to {currency_symbol} {new_savings:,.2f}!")
-            
-            # Option to delete goal
-            if st.button("Remove This Goal", type="secondary"):
-                db.collection("users").document(user_id).update({
-                    "savings_goal": firestore.DELETE_FIELD
-                })
-                st.success("Savings goal removed successfully!")
-                st.rerun()
-                
-        else:
-            # Create new goal
-            st.write("### Create a New Savings Goal")
+                st.info("Add a savings category to your budget to plan monthly contributions to your goals.")
             
-            with st.form("create_goal"):
-                col1, col2 = st.columns(2)
+            st.write("### Your Goals")
+            open_goals = [goal for goal in goals if goal['remaining'] > 0]
+            for goal in goals:
+                goal_item = goal.get('item', 'Goal')
+                goal_cost = goal.get('total_cost', 0)
+                current_savings = goal['saved']
                 
-                with col1:
-                    goal_item = st.text_input("What are you saving for?", placeholder="e.g., Car, Vacation, House")
-                    goal_amount = st.number_input("Total amount needed", min_value=0, step=1000)
-                
-                with col2:
-                    goal_date = st.date_input("Target date", value=datetime.now().date() + timedelta(days=365))
-                    current_amount = st.number_input("Amount already saved", min_value=0.0, step=100.0)
+                try:
+                    start_date = datetime.fromisoformat(goal.get('start_date', '')).date()
+                except ValueError:
+                    start_date = today
+                try:
+                    target_date = datetime.fromisoformat(goal.get('target_date', '')).date()
+                except ValueError:
+                    target_date = today + timedelta(days=365)
                 
-                submit_goal = st.form_submit_button("Create Savings Goal")
+                progress_percent = goal['progress'] * 100
+                days_elapsed = (today - start_date).days
+                days_total = (target_date - start_date).days
+                time_progress = (days_elapsed / days_total) * 100 if days_total > 0 else 0
                 
-                if submit_goal:
-                    if not goal_item:
-                        st.error("Please enter what you're saving for.")
-                    elif goal_amount <= 0:
-                        st.error("Please enter a valid savings amount.")
+                with st.expander(f"#{goal.get('priority', 1)} {goal_item} - {progress_percent:.0f}% saved", expanded=len(goals) == 1):
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        st.metric("Total Cost", f"{currency_symbol} {goal_cost:,.2f}")
+                        st.metric("This Month's Contribution", f"{currency_symbol} {plan.get(goal['id'], 0):,.2f}")
+                        st.metric("Contributions", goal.get('contribution_count', 0))
+                    
+                    with col2:
+                        st.metric("Current Savings", f"{currency_symbol} {current_savings:,.2f}")
+                        st.metric("Target Date", target_date.strftime("%Y-%m-%d"))
+                        st.metric("Days Remaining", f"{max(0, (target_date - today).days)} days")
+                    
+                    st.progress(min(progress_percent / 100, 1.0))
+                    st.write(f"{progress_percent:.1f}% saved ({currency_symbol} {current_savings:,.2f} of {currency_symbol} {goal_cost:,.2f}), "
+                             f"{time_progress:.1f}% of time elapsed")
+                    
+                    # Compare savings vs time progress
+                    if goal['remaining'] <= 0:
+                        st.success("Goal reached!")
+                    elif progress_percent > time_progress + 5:
+                        st.success(f"You're ahead of schedule by {progress_percent - time_progress:.1f}%!")
+                    elif time_progress > progress_percent + 5:
+                        st.warning(f"You're behind schedule by {time_progress - progress_percent:.1f}%. Consider moving this goal up in priority.")
                     else:
-                        # Calculate months and monthly contribution
-                        days_until = (goal_date - datetime.now().date()).days
-                        months_until = max(1, round(days_until / 30))
-                        amount_needed = goal_amount - current_amount
-                        monthly_amount = amount_needed / months_until if months_until > 0 else amount_needed
+                        st.info("You're on track to meet this goal!")
+                    
+                    if goal['remaining'] > 0:
+                        # Project completion from this goal's share of the user's actual monthly savings
+                        if planned_total > 0:
+                            share = plan.get(goal['id'], 0) / planned_total
+                        else:
+                            share = 1 / len(open_goals)
+                        months_left = max(1, (target_date - today).days / 30)
+                        projection = project_goal(
+                            user_id,
+                            user_data.get('expenses_version', 0),
+                            income,
+                            current_savings,
+                            goal_cost,
+                            target_date.isoformat(),
+                            fallback_monthly=plan.get(goal['id']) or goal['remaining'] / months_left,
+                            today_iso=today.isoformat(),
+                            currency=currency,
+                            share=round(share, 4)
+                        )
                         
-                        # Create savings goal object
-                        savings_goal = {
-                            "item": goal_item,
-                            "total_cost": goal_amount,
-                            "monthly_amount": monthly_amount,
-                            "timeline_months": months_until,
-                            "target_date": goal_date.isoformat(),
-                            "start_date": datetime.now().date().isoformat(),
-                            "current_savings": current_amount,
-                            "percentage_of_income": (monthly_amount / income) * 100 if income > 0 else 0
-                        }
+                        def format_completion(pct):
+                            completion_date = projection["dates"][pct]
+                            return completion_date.strftime("%b %Y") if completion_date else "Not reached"
+                        
+                        col1, col2, col3, col4 = st.columns(4)
+                        col1.metric("Chance by target date", f"{projection['probability'] * 100:.0f}%")
+                        col2.metric("Optimistic (P10)", format_completion(10))
+                        col3.metric("Likely (P50)", format_completion(50))
+                        col4.metric("Cautious (P90)", format_completion(90))
+                        
+                        if projection["history_months"]:
+                            st.caption(f"Based on {share * 100:.0f}% of {projection['history_months']} months of your income minus spending, resampled over 10,000 simulations.")
+                        else:
+                            st.caption("No complete months of spending yet, so this assumes this month's planned contribution.")
                         
-                        # Save to Firestore
-                        db.collection("users").document(user_id).update({
-                            "savings_goal": savings_goal
-                        })
+                        fan = projection["fan"]
+                        if fan.shape[1] > 1:
+                            fan_df = pd.DataFrame({
+                                "Month": [add_months(today, i + 1).strftime("%b %Y") for i in range(fan.shape[1])],
+                                "P10": fan[0],
+                                "P50": fan[1],
+                                "P90": fan[2]
+                            })
+                            fig = cached_figure("goal_fan", fan_df, goal_fan_chart, goal_cost=goal_cost,
+                                                currency_symbol=currency_symbol)
+                            st.plotly_chart(fig, use_container_width=True, key=f"goal_fan_{goal['id']}")
+                    
+                    # Record a contribution in the goal's ledger
+                    with st.form(f"contribute_{goal['id']}"):
+                        contribution = st.number_input("Contribution (negative to withdraw)", value=0.0, step=100.0)
+                        submit_contribution = st.form_submit_button("Add Contribution")
                         
-                        st.success(f"Savings goal created! You'll need to save {currency_symbol} {monthly_amount:,.2f} per month to reach your goal by {goal_date.strftime('%Y-%m-%d')}.")
+                        if submit_contribution and contribution:
+                            add_contributions(user_id, user_data, goals, {goal['id']: contribution})
+                            st.success(f"Recorded {currency_symbol} {contribution:,.2f} for {goal_item}!")
+                            st.rerun()
+                    
+                    # Option to delete goal
+                    if st.button("Remove This Goal", type="secondary", key=f"remove_{goal['id']}"):
+                        delete_goal(user_id, goals, goal['id'])
+                        st.success("Savings goal removed successfully!")
                         st.rerun()
+        
+        # Create new goal
+        st.write("### Add a Savings Goal" if goals else "### Create a New Savings Goal")
+        
+        with st.form("create_goal"):
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                goal_item = st.text_input("What are you saving for?", placeholder="e.g., Car, Vacation, House")
+                goal_amount = st.number_input("Total amount needed", min_value=0, step=1000)
+                goal_priority = st.number_input("Priority (1 is highest)", min_value=1, value=len(goals) + 1, step=1)
+            
+            with col2:
+                goal_date = st.date_input("Target date", value=today + timedelta(days=365))
+                current_amount = st.number_input("Amount already saved", min_value=0.0, step=100.0)
+            
+            submit_goal = st.form_submit_button("Create Savings Goal")
+            
+            if submit_goal:
+                if not goal_item:
+                    st.error("Please enter what you're saving for.")
+                elif goal_amount <= 0:
+                    st.error("Please enter a valid savings amount.")
+                else:
+                    # Calculate months and monthly contribution
+                    days_until = (goal_date - today).days
+                    months_until = max(1, round(days_until / 30))
+                    monthly_amount = (goal_amount - current_amount) / months_until
+                    
+                    create_goal(user_id, user_data, goal_item, goal_amount, goal_date.isoformat(),
+                                priority=goal_priority, opening_balance=current_amount)
+                    
+                    st.success(f"Savings goal created! You'll need to save {currency_symbol} {monthly_amount:,.2f} per month to reach it by {goal_date.strftime('%Y-%m-%d')}.")
+                    st.rerun()
+    
+    with tab3:
+        goals_tab()
     
     # Display the current allocation (if already set)
     if any(st.session_state.budget_allocations.values()):
@@ -586,232 +590,51 @@ def budget_setup(user_id):
         current_df['Percentage'] = current_df['Amount'] / current_df['Amount'].sum() * 100
         
         # Create horizontal bar chart
-        fig = px.bar(
-            current_df,
-            y='Category',
-            x='Amount',
-            orientation='h',
-            text=[f"{p:.1f}%" for p in current_df['Percentage']],
-            color='Category',
-            color_discrete_sequence=px.colors.qualitative.Pastel
-        )
-        
-        fig.update_layout(
-            margin=dict(l=20, r=20, t=30, b=20),
-            height=300,
-            xaxis_title="Amount",
-            yaxis_title=""
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(cached_figure("current_allocation", current_df, allocation_bar), use_container_width=True)
 
 
-def generate_simulated_ai_response(income, categories, saving_preference, has_debt, 
-                                  planning_major_purchase, purchase_item, purchase_cost, 
-                                  purchase_deadline, financial_goal, life_stage):
-    """Generate a simulated AI response based on user inputs"""
-   
-    if has_debt:
-        category_weights = {
-            "Essentials": 0.45,
-            "Lifestyle": 0.15,
-            "Savings & Investments": saving_preference/100,
-            "Debt & EMIs": 0.25,
-            "Other / Subscriptions": 0.05
-        }
-    elif financial_goal == "Save for emergency fund" or financial_goal == "Save for major purchase":
-        category_weights = {
-            "Essentials": 0.45,
-            "Lifestyle": 0.2,
-            "Savings & Investments": saving_preference/100,
-            "Debt & EMIs": 0.05,
-            "Other / Subscriptions": 0.05
-        }
-    elif financial_goal == "Build long-term wealth":
-        category_weights = {
-            "Essentials": 0.4,
-            "Lifestyle": 0.15,
-            "Savings & Investments": saving_preference/100,
-            "Debt & EMIs": 0.05,
-            "Other / Subscriptions": 0.05
-        }
-    else:  # Enjoy life now or Balance
-        category_weights = {
-            "Essentials": 0.4,
-            "Lifestyle": 0.3,
-            "Savings & Investments": saving_preference/100,
-            "Debt & EMIs": 0.05,
-            "Other / Subscriptions": 0.05
-        }
-    
-    # Normalize weights to ensure they sum to 1
-    total_weight = sum(category_weights.values())
-    if total_weight != 1.0:
-        for cat in category_weights:
-            category_weights[cat] /= total_weight
-    
-    # Map categories to generic types
-    category_types = {
-        "Essentials": ["Essentials", "Food & Dining", "Transportation", "Health"],
-        "Lifestyle": ["Lifestyle", "Entertainment", "Shopping", "Travel"],
-        "Savings & Investments": ["Savings & Investments", "Investments"],
-        "Debt & EMIs": ["Debt & EMIs"],
-        "Other / Subscriptions": ["Other / Subscriptions", "Subscriptions", "Gifts & Donations", "Education"]
-    }
-    
-    # Create category mapping
-    category_map = {}
-    for cat in categories:
-        matched = False
-        for main_cat, sub_cats in category_types.items():
-            if cat in sub_cats:
-                category_map[cat] = main_cat
-                matched = True
-                break
-        if not matched:
-            # Default to Other if no match found
-            category_map[cat] = "Other / Subscriptions"
-    
-    # Count categories in each type
-    type_counts = {}
-    for cat, cat_type in category_map.items():
-        type_counts[cat_type] = type_counts.get(cat_type, 0) + 1
-    
-    # Allocate budget
-    allocations = {}
-    for cat in categories:
-        cat_type = category_map.get(cat, "Other / Subscriptions")
-        # Distribute the type's budget among its categories
-        weight = category_weights.get(cat_type, 0.05) / max(1, type_counts.get(cat_type, 1))
-        allocations[cat] = {"percentage": round(weight * 100, 1), "amount": round(income * weight, 2)}
-    
-    # Adjust for savings goal if applicable
-    savings_plan = {
-        "item": "",
-        "total_cost": 0,
-        "monthly_amount": 0,
-        "timeline_months": 0,
-        "percentage_of_income": 0,
-        "is_realistic": True,
-        "recommendation": ""
-    }
-    
-    if planning_major_purchase and purchase_item and purchase_cost > 0 and purchase_deadline:
-        # Calculate months until deadline
-        days_until = (purchase_deadline - datetime.now().date()).days
-        months_until = max(1, round(days_until / 30))
-        
-        # Calculate required monthly contribution
-        monthly_amount = purchase_cost / months_until
-        percentage_of_income = (monthly_amount / income) * 100 if income > 0 else 0
-        
-        # Check if savings goal is realistic
-        is_realistic = percentage_of_income <= 25  # Consider unrealistic if >25% of income
-        
-        recommendation = ""
-        if not is_realistic:
-            if days_until < 365:
-                new_timeline = round(purchase_cost / (income * 0.25))  # 25% of income
-                recommendation = f"This goal requires {percentage_of_income:.1f}% of your income, which is high. Consider extending your timeline to {new_timeline} months."
-            else:
-                recommendation = f"This goal requires {percentage_of_income:.1f}% of your income. Consider reducing your target amount or extending your timeline."
-        
-        savings_plan = {
-            "item": purchase_item,
-            "total_cost": purchase_cost,
-            "monthly_amount": monthly_amount,
-            "timeline_months": months_until,
-            "percentage_of_income": percentage_of_income,
-            "is_realistic": is_realistic,
-            "recommendation": recommendation
-        }
-        
-        # Adjust budget allocations for savings goal
-        savings_cats = [cat for cat in categories if "Savings" in cat or "Investments" in cat]
-        if savings_cats:
-            # Find savings category with highest allocation
-            savings_cat = max(savings_cats, key=lambda cat: allocations.get(cat, {"amount": 0})["amount"])
-            # Ensure it has enough for the savings goal
-            if allocations[savings_cat]["amount"] < monthly_amount:
-                # Find amount to reallocate
-                shortfall = monthly_amount - allocations[savings_cat]["amount"]
-                # Take from lifestyle categories proportionally
-                lifestyle_cats = [cat for cat in categories if cat in category_types["Lifestyle"]]
-                total_lifestyle = sum([allocations[cat]["amount"] for cat in lifestyle_cats])
-                
-                if total_lifestyle > shortfall:
-                    for cat in lifestyle_cats:
-                        reduction = (allocations[cat]["amount"] / total_lifestyle) * shortfall
-                        allocations[cat]["amount"] -= reduction
-                        allocations[cat]["percentage"] = (allocations[cat]["amount"] / income) * 100
-                    
-                    # Increase savings category
-                    allocations[savings_cat]["amount"] = monthly_amount
-                    allocations[savings_cat]["percentage"] = (monthly_amount / income) * 100
+def recommendation_pie(df):
+    fig = px.pie(
+        df, 
+        values='Amount', 
+        names='Category',
+        color_discrete_sequence=px.colors.sequential.Bluyl, 
+        hole=0.4
+    )
     
-    # Create explanations and tips
-    explanations = {}
-    tips = {}
-    
-    # Common explanations and tips
-    category_explanations = {
-        "Essentials": f"This allocation covers your basic needs based on your {life_stage} life stage.",
-        "Food & Dining": "This covers groceries and occasional dining out, balancing nutrition with budget.",
-        "Transportation": "This covers your regular transportation costs while allowing for some flexibility.",
-        "Health": "Health is a priority investment that shouldn't be compromised.",
-        "Lifestyle": "This balanced allocation lets you enjoy life while working toward your financial goals.",
-        "Entertainment": "This provides for entertainment while staying aligned with your financial goals.",
-        "Shopping": "This allows for purchases while encouraging mindful spending.",
-        "Travel": "This allocation lets you enjoy travel experiences within your budget.",
-        "Savings & Investments": f"This {saving_preference}% savings rate helps you build wealth over time.",
-        "Investments": "This allocation helps grow your wealth through strategic investments.",
-        "Debt & EMIs": "Prioritizing debt reduction improves your long-term financial health.",
-        "Other / Subscriptions": "This covers miscellaneous expenses and subscriptions.",
-        "Subscriptions": "This covers digital services while ensuring they provide good value.",
-        "Gifts & Donations": "This allows you to be generous while staying within your means.",
-        "Education": "Investing in education can provide long-term returns."
-    }
-    
-    category_tips = {
-        "Essentials": ["Look for bundled services to reduce utilities cost", "Buy staples in bulk when on sale"],
-        "Food & Dining": ["Meal plan weekly to reduce food waste", "Limit takeout to once a week"],
-        "Transportation": ["Consider carpooling or public transport", "Keep up with vehicle maintenance to avoid costly repairs"],
-        "Health": ["Use preventive care to avoid larger costs later", "Check for employer health benefits and discounts"],
-        "Lifestyle": ["Create a 'fun money' allowance to avoid impulse spending", "Look for free or low-cost entertainment options"],
-        "Entertainment": ["Use streaming services instead of cable", "Look for free community events"],
-        "Shopping": ["Implement a 24-hour rule before making non-essential purchases", "Keep a wish list rather than buying immediately"],
-        "Travel": ["Book travel during off-peak times", "Use travel rewards programs"],
-        "Savings & Investments": ["Set up automatic transfers to savings on payday", "Consider tax-advantaged investment accounts"],
-        "Investments": ["Diversify your investments to reduce risk", "Consider low-cost index funds for long-term growth"],
-        "Debt & EMIs": ["Focus on highest-interest debt first", "Consider refinancing options for better rates"],
-        "Other / Subscriptions": ["Audit your subscriptions quarterly", "Share subscription costs with family/friends"],
-        "Subscriptions": ["Review all subscriptions quarterly and cancel unused ones", "Look for annual subscription options for better rates"],
-        "Gifts & Donations": ["Set a gift budget at the beginning of the year", "Consider thoughtful homemade gifts"],
-        "Education": ["Look for free or low-cost learning resources", "Check if your employer offers education reimbursement"]
-    }
-    
-    # Apply explanations and tips to each category
-    for cat in categories:
-        explanations[cat] = category_explanations.get(cat, f"This allocation is appropriate for your {life_stage} life stage.")
-        tips[cat] = category_tips.get(cat, ["Track spending in this category to identify savings opportunities", "Review this category monthly to ensure it aligns with your goals"])
-    
-    # Create summary
-    if has_debt:
-        summary = f"This budget prioritizes debt reduction while maintaining a {saving_preference}% savings rate. It ensures essential needs are covered while limiting discretionary spending to accelerate your financial freedom."
-    elif planning_major_purchase:
-        summary = f"This budget is designed to help you save for your {purchase_item} within {savings_plan['timeline_months']} months while maintaining a balanced lifestyle and covering your essential needs."
-    elif financial_goal == "Save for emergency fund":
-        summary = f"This budget focuses on building your emergency fund with a {saving_preference}% savings rate while ensuring your day-to-day needs are covered."
-    elif financial_goal == "Build long-term wealth":
-        summary = f"This budget emphasizes wealth building with a {saving_preference}% allocation to savings and investments, balanced with your current lifestyle needs."
-    else:
-        summary = f"This balanced budget allocates {saving_preference}% to savings while ensuring you can enjoy your current lifestyle and meet all essential obligations."
+    fig.update_layout(
+        margin=dict(l=20, r=20, t=30, b=20),
+        height=300
+    )
+    return fig
+
+
+def goal_fan_chart(df, goal_cost, currency_symbol):
+    """Projected savings by month: the P10-P90 band, the median and the goal line"""
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=df["Month"], y=df["P90"], line=dict(width=0), showlegend=False, hoverinfo="skip"))
+    fig.add_trace(go.Scatter(x=df["Month"], y=df["P10"], fill="tonexty", line=dict(width=0), name="P10-P90 range"))
+    fig.add_trace(go.Scatter(x=df["Month"], y=df["P50"], name="Median"))
+    fig.add_hline(y=goal_cost, line_dash="dash", annotation_text="Goal")
+    fig.update_layout(height=300, margin=dict(l=0, r=0, t=20, b=0), yaxis_title=f"Savings ({currency_symbol})")
+    return fig
+
+
+def allocation_bar(df):
+    fig = px.bar(
+        df,
+        y='Category',
+        x='Amount',
+        orientation='h',
+        text=[f"{p:.1f}%" for p in df['Percentage']],
+        color='Category',
+        color_discrete_sequence=px.colors.qualitative.Pastel
+    )
     
-    # Create final response
-    return {
-        "allocations": allocations,
-        "explanations": explanations,
-        "tips": tips,
-        "savings_plan": savings_plan,
-        "summary": summary
-    }
\ No newline at end of file
+    fig.update_layout(
+        margin=dict(l=20, r=20, t=30, b=20),
+        height=300,
+        xaxis_title="Amount",
+        yaxis_title=""
+    )
+    return fig
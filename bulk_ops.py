@@ -0,0 +1,160 @@
+"""
+Bulk changes to many expenses at once: delete, recategorize, and set the
+date or amount.
+
+Expenses are written in chunks of BULK_BATCH_SIZE per WriteBatch. The user
+document updates the changes imply, the category statistics (anomaly.py)
+and expenses_version, go into the same batch as the expense writes, so a
+chunk lands or fails as a whole and the counters always match the
+expenses. A failed chunk stops the operation; the chunks before it stay
+written. Those two are the only stored aggregates of expenses: monthly
+totals are summed from the expenses themselves, and the caches holding
+them (query results, the spend forecast) are keyed on expenses_version.
+
+An edit counts as removing the old expense and adding the new one, so it
+bumps expenses_version by EDIT_VERSION_BUMPS and the cached spend forecast
+sees the same two changes.
+"""
+from anomaly import CategoryStats, forget_expense, stats_field
+from data_layer import bump_expenses_version, expenses_ref
+from money import DEFAULT_CURRENCY, amount_fields, base_amount, expense_currency
+from shared import db
+from spend_forecast import record_expense_change
+
+# Expense writes per batch; Firestore allows 500 writes and one goes to the user document
+BULK_BATCH_SIZE = 400
+
+EDIT_VERSION_BUMPS = 2
+
+
+def _fold(user_data, category, amount):
+    """Add an amount to a category's statistics without scoring it, returning the field update"""
+    all_stats = user_data.setdefault("expense_stats", {})
+    stats = CategoryStats(all_stats.get(category))
+    stats.add(amount)
+    all_stats[category] = stats.state()
+    return {stats_field(category): all_stats[category]}
+
+
+def _run(user_id, user_data, expenses, write, bumps, progress=None):
+    """
+    Write expenses chunk by chunk
+
+    Args:
+        write (callable): write(batch, expense, user_data) queues one expense's
+                          write and returns its user document updates
+        bumps (int): expenses_version increments per expense
+        progress (callable): Called with (written, total) after each chunk
+
+    Returns:
+        dict: ids of the expenses written and the error that stopped the rest, if any
+    """
+    # Counters are worked out on a copy, committed chunk by chunk
+    working = dict(user_data)
+    working["expense_stats"] = dict(user_data.get("expense_stats", {}))
+    written = []
+    for start in range(0, len(expenses), BULK_BATCH_SIZE):
+        chunk = expenses[start:start + BULK_BATCH_SIZE]
+        try:
+            batch = db.batch()
+            updates = {}
+            for expense in chunk:
+                updates.update(write(batch, expense, working))
+            bump_expenses_version(user_id, updates, batch=batch, count=len(chunk) * bumps)
+            batch.commit()
+        except Exception as e:
+            print(f"Error in bulk change of {len(chunk)} expenses for {user_id}: {str(e)}")
+            return {"written": written, "error": str(e)}
+        written.extend(expense["id"] for expense in chunk)
+        if progress:
+            progress(len(written), len(expenses))
+    return {"written": written, "error": None}
+
+
+def delete_expenses(user_id, user_data, expenses, progress=None):
+    """
+    Delete expenses, taking them out of their categories' statistics
+
+    Args:
+        user_id (str): User id
+        user_data (dict): User document, for the category statistics and currency
+        expenses (list): Expense dicts with their ids; only written expenses, not pending ones
+        progress (callable): Called with (deleted, total) after each chunk
+
+    Returns:
+        dict: {"written": ids deleted, "error": message or None}
+    """
+    currency = user_data.get("currency", DEFAULT_CURRENCY)
+
+    def write(batch, expense, working):
+        batch.delete(expenses_ref(user_id).document(expense["id"]))
+        return forget_expense(working, expense.get("category", "Other"), base_amount(expense, currency))
+
+    result = _run(user_id, user_data, expenses, write, 1, progress)
+    written = set(result["written"])
+    for expense in expenses:
+        if expense["id"] in written:
+            record_expense_change(user_id, {**expense, "amount": base_amount(expense, currency)}, removed=True)
+    return result
+
+
+def edited_fields(expense, category=None, date=None, amount=None, currency=DEFAULT_CURRENCY):
+    """
+    Expense fields an edit changes
+
+    Args:
+        expense (dict): The expense as it is
+        category (str): New category
+        date (str): New ISO date
+        amount (float): New amount in the expense's own currency
+        currency (str): The user's base currency
+
+    Returns:
+        dict: Fields to update on the expense document
+    """
+    fields = {}
+    if category is not None:
+        fields["category"] = category
+    if date is not None:
+        fields["date"] = date
+    if amount is not None:
+        fields.update(amount_fields(amount, expense_currency(expense, currency)))
+    return fields
+
+
+def update_expenses(user_id, user_data, expenses, category=None, date=None, amount=None, progress=None):
+    """
+    Set the category, date or amount of expenses, moving them between categories' statistics
+
+    Args:
+        user_id (str): User id
+        user_data (dict): User document, for the category statistics and currency
+        expenses (list): Expense dicts with their ids; only written expenses, not pending ones
+        category (str): New category
+        date (str): New ISO date
+        amount (float): New amount, in each expense's own currency
+        progress (callable): Called with (updated, total) after each chunk
+
+    Returns:
+        dict: {"written": ids updated, "error": message or None, "fields": {id: changed fields}}
+    """
+    currency = user_data.get("currency", DEFAULT_CURRENCY)
+    changes = {expense["id"]: edited_fields(expense, category, date, amount, currency) for expense in expenses}
+
+    def write(batch, expense, working):
+        fields = changes[expense["id"]]
+        batch.update(expenses_ref(user_id).document(expense["id"]), fields)
+        updates = forget_expense(working, expense.get("category", "Other"), base_amount(expense, currency))
+        edited = {**expense, **fields}
+        updates.update(_fold(working, edited.get("category", "Other"), base_amount(edited, currency)))
+        return updates
+
+    result = _run(user_id, user_data, expenses, write, EDIT_VERSION_BUMPS, progress)
+    written = set(result["written"])
+    for expense in expenses:
+        if expense["id"] in written:
+            edited = {**expense, **changes[expense["id"]]}
+            record_expense_change(user_id, {**expense, "amount": base_amount(expense, currency)}, removed=True)
+            record_expense_change(user_id, {**edited, "amount": base_amount(edited, currency)})
+    result["fields"] = {expense_id: changes[expense_id] for expense_id in result["written"]}
+    return result
@@ -0,0 +1,423 @@
+"""
+Two-tier cache shared by every server process on a host.
+
+Several Streamlit processes run behind the load balancer, so a cache held
+only in one process is cold on the others. Lookups go through:
+
+1. a small in-process LRU, for repeat reads within one worker
+2. a shared tier every worker sees: a SQLite file (CACHE_PATH) by default,
+   or a Redis-protocol server when REDIS_URL is set and the `redis` package
+   is installed
+
+Keys are namespaced ("budget_ai", "chat", "expenses", ...) and every entry
+has a TTL. A namespace can be invalidated as a whole by bumping its version
+in the shared tier, and callers can also fold their own version, such as a
+user's expenses_version, into the key. Each tier counts hits and misses.
+
+Set CACHE_BACKEND=none to disable the shared tier. Both tiers store values
+as JSON (local_store.dumps), so they must be JSON data, datetimes included;
+tuples come back as lists. Every lookup returns a new copy, never an object
+another session holds. The SQLite file defaults to a directory only the
+app's user can open.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from local_store import CACHE_HOME, dumps, loads, private_dir, private_file
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(CACHE_HOME, "cache.sqlite3"))
+REDIS_URL = os.getenv("REDIS_URL")
+
+LOCAL_MAX_ENTRIES = 2048
+DEFAULT_TTL = 3600
+
+# How long a worker trusts its copy of a namespace version before rereading it
+NAMESPACE_VERSION_TTL = 1.0
+
+# Local lifetime of entries copied from the shared tier, bounding how long a
+# delete on another worker can go unseen here
+PROMOTED_TTL = 30
+
+_CACHE = None
+_LOCK = threading.Lock()
+
+
+class TierStats:
+    """Hit and miss counters for one tier, safe to update from any thread"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+
+    def add(self, hits=0, misses=0, writes=0):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+            self.writes += writes
+
+    def as_dict(self):
+        with self.lock:
+            hits, misses, writes = self.hits, self.misses, self.writes
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "writes": writes,
+            "hit_ratio": hits / lookups if lookups else 0.0
+        }
+
+
+class LRUTier:
+    """
+    In-process LRU of (expires_at, JSON text) pairs
+
+    The process's sessions share it, so values are kept serialized and each
+    get decodes a fresh copy a caller can change without touching the entry.
+
+    Args:
+        max_entries (int): Entries kept before the least recently used is dropped
+    """
+
+    name = "local"
+
+    def __init__(self, max_entries=LOCAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = TierStats()
+
+    def get(self, key):
+        """Returns (found, value)"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self.entries[key]
+                self.stats.add(misses=1)
+                return False, None
+            self.entries.move_to_end(key)
+            self.stats.add(hits=1)
+            text = entry[1]
+        return True, loads(text)
+
+    def set(self, key, value, ttl):
+        text = dumps(value)
+        with self.lock:
+            self.entries[key] = (time.time() + ttl, text)
+            self.entries.move_to_end(key)
+            self.stats.add(writes=1)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SQLiteTier:
+    """
+    Shared tier in a SQLite file, safe for several processes on one host
+
+    WAL mode lets readers in other processes proceed while one writes. Each
+    thread gets its own connection.
+
+    Args:
+        path (str): Database file
+    """
+
+    name = "sqlite"
+
+    # Expired rows are swept after this many writes
+    PRUNE_EVERY = 500
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.local = threading.local()
+        self.stats = TierStats()
+        self.writes_since_prune = 0
+        # The default directory is the app's own; a CACHE_PATH elsewhere may share its directory
+        if os.path.dirname(path) == CACHE_HOME:
+            private_dir(CACHE_HOME)
+        private_file(path)
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        # Values pickled by older versions are never unpickled, only expired
+        if row is None or not isinstance(row[0], str):
+            self.stats.add(misses=1)
+            return False, None
+        self.stats.add(hits=1)
+        return True, loads(row[0])
+
+    def set(self, key, value, ttl):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                         (key, dumps(value), time.time() + ttl))
+        self.stats.add(writes=1)
+        self.writes_since_prune += 1
+        if self.writes_since_prune >= self.PRUNE_EVERY:
+            self.prune()
+
+    def delete(self, key):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def incr(self, key):
+        """Atomically increment an integer counter, returning the new value"""
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, 1e18) "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+                (key, 1)
+            )
+            return int(conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()[0])
+
+    def counter(self, key):
+        row = self._connection().execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        return int(row[0]) if row else 0
+
+    def prune(self):
+        """Delete expired entries"""
+        self.writes_since_prune = 0
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache")
+
+
+class RedisTier:
+    """
+    Shared tier on any Redis-protocol server
+
+    Args:
+        client: A redis.Redis client, or anything with the same get, set,
+                delete and incr methods
+    """
+
+    name = "redis"
+
+    def __init__(self, client):
+        self.client = client
+        self.stats = TierStats()
+
+    @classmethod
+    def from_url(cls, url=REDIS_URL):
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key):
+        raw = self.client.get(key)
+        if raw is None:
+            self.stats.add(misses=1)
+            return False, None
+        self.stats.add(hits=1)
+        return True, loads(raw)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, dumps(value), ex=max(1, int(ttl)))
+        self.stats.add(writes=1)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def incr(self, key):
+        return int(self.client.incr(key))
+
+    def counter(self, key):
+        raw = self.client.get(key)
+        return int(raw) if raw is not None else 0
+
+    def clear(self):
+        self.client.flushdb()
+
+
+def make_key(*parts):
+    """Stable key for arbitrary hashable arguments; long keys are hashed"""
+    text = "|".join(repr(part) for part in parts)
+    if len(text) <= 200:
+        return text
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class Cache:
+    """
+    LRU tier in front of an optional shared tier
+
+    Shared tier errors are logged and treated as misses, so an unavailable
+    cache only makes requests slower.
+
+    Args:
+        local (LRUTier): In-process tier
+        shared (SQLiteTier or RedisTier): Cross-process tier, or None
+    """
+
+    def __init__(self, local=None, shared=None):
+        self.local = local or LRUTier()
+        self.shared = shared
+        self.namespace_versions = {}
+        self.lock = threading.Lock()
+
+    def _note_version(self, namespace, version):
+        """Record a namespace version just read or set; versions only go up, so an older read never wins"""
+        with self.lock:
+            known = self.namespace_versions.get(namespace, (0, 0))[0]
+            version = max(version, known)
+            self.namespace_versions[namespace] = (version, time.time())
+        return version
+
+    def namespace_version(self, namespace):
+        """Current version of a namespace, reread from the shared tier at most every NAMESPACE_VERSION_TTL"""
+        with self.lock:
+            version, checked_at = self.namespace_versions.get(namespace, (0, 0))
+        if self.shared is None or time.time() - checked_at <= NAMESPACE_VERSION_TTL:
+            return version
+        try:
+            version = self.shared.counter(f"__version__:{namespace}")
+        except Exception as e:
+            print(f"Error reading cache version for {namespace}: {str(e)}")
+        return self._note_version(namespace, version)
+
+    def _key(self, namespace, key, version):
+        return f"{namespace}:{self.namespace_version(namespace)}:{version}:{make_key(key)}"
+
+    def get(self, namespace, key, version=None):
+        """
+        Look a value up in each tier in turn
+
+        Returns:
+            tuple: (found, value)
+        """
+        full_key = self._key(namespace, key, version)
+        found, value = self.local.get(full_key)
+        if found or self.shared is None:
+            return found, value
+        try:
+            found, value = self.shared.get(full_key)
+        except Exception as e:
+            print(f"Error reading shared cache: {str(e)}")
+            return False, None
+        if found:
+            self.local.set(full_key, value, PROMOTED_TTL)
+        return found, value
+
+    def set(self, namespace, key, value, ttl=DEFAULT_TTL, version=None):
+        full_key = self._key(namespace, key, version)
+        try:
+            self.local.set(full_key, value, ttl)
+        except TypeError as e:
+            print(f"Error caching a {namespace} value: {str(e)}")
+            return
+        if self.shared is not None:
+            try:
+                self.shared.set(full_key, value, ttl)
+            except Exception as e:
+                print(f"Error writing shared cache: {str(e)}")
+
+    def delete(self, namespace, key, version=None):
+        full_key = self._key(namespace, key, version)
+        self.local.delete(full_key)
+        if self.shared is not None:
+            try:
+                self.shared.delete(full_key)
+            except Exception as e:
+                print(f"Error deleting from shared cache: {str(e)}")
+
+    def invalidate(self, namespace):
+        """Drop every entry in a namespace, on all workers, by bumping its version"""
+        if self.shared is not None:
+            try:
+                self._note_version(namespace, self.shared.incr(f"__version__:{namespace}"))
+                return
+            except Exception as e:
+                print(f"Error invalidating cache namespace {namespace}: {str(e)}")
+        with self.lock:
+            version = self.namespace_versions.get(namespace, (0, 0))[0] + 1
+            self.namespace_versions[namespace] = (version, time.time())
+
+    def get_or_set(self, namespace, key, compute, ttl=DEFAULT_TTL, version=None, cache_if=None):
+        """
+        Cached value, computing and storing it on a miss
+
+        Args:
+            namespace (str): Key namespace
+            key: Hashable key, e.g. a tuple of the arguments
+            compute (callable): Produces the value on a miss
+            ttl (float): Seconds to keep the value
+            version: Optional version folded into the key, e.g. expenses_version
+            cache_if (callable): Only store values for which this returns True
+
+        Returns:
+            The cached or computed value
+        """
+        found, value = self.get(namespace, key, version)
+        if found:
+            return value
+        value = compute()
+        if cache_if is None or cache_if(value):
+            self.set(namespace, key, value, ttl, version)
+        return value
+
+    def metrics(self):
+        """Hit and miss counts and hit ratio per tier"""
+        tiers = {self.local.name: self.local.stats.as_dict()}
+        if self.shared is not None:
+            tiers[self.shared.name] = self.shared.stats.as_dict()
+        return tiers
+
+
+def create_shared_tier(backend=CACHE_BACKEND):
+    """Shared tier for a backend name: "sqlite", "redis" or "none" """
+    if backend == "none":
+        return None
+    if backend == "redis" or REDIS_URL:
+        if redis is None:
+            print("redis package not installed; falling back to the SQLite cache")
+        elif REDIS_URL:
+            return RedisTier.from_url(REDIS_URL)
+        else:
+            print("REDIS_URL not set; falling back to the SQLite cache")
+    try:
+        return SQLiteTier(CACHE_PATH)
+    except sqlite3.Error as e:
+        print(f"Error opening cache at {CACHE_PATH}: {str(e)}; using the in-process cache only")
+        return None
+
+
+def get_cache():
+    """Process-wide cache, created on first use"""
+    global _CACHE
+    if _CACHE is None:
+        with _LOCK:
+            if _CACHE is None:
+                _CACHE = Cache(LRUTier(), create_shared_tier())
+    return _CACHE
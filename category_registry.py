@@ -0,0 +1,170 @@
+"""
+Registry of spending categories.
+
+Every category has a canonical name, a small integer id, an emoji, a group
+(essentials, lifestyle, savings, debt, other) and a description. Emoji
+labels from onboarding ("🍔 Food & Dining"), older labels
+("Essentials (Rent, Utilities)") and aliases ("Groceries") all resolve to
+the same id through one dict lookup, so pages, storage, aggregation and the
+allocation engine agree on names without string munging.
+
+The registry is built once per process. Unknown categories (users' custom
+ones) are interned on first sight in the OTHER group.
+"""
+import threading
+
+ESSENTIALS = "Essentials"
+LIFESTYLE = "Lifestyle"
+SAVINGS = "Savings & Investments"
+DEBT = "Debt & EMIs"
+OTHER = "Other / Subscriptions"
+
+GROUPS = (ESSENTIALS, LIFESTYLE, SAVINGS, DEBT, OTHER)
+GROUP_IDS = {group: i for i, group in enumerate(GROUPS)}
+
+# Categories offered when a user hasn't picked any
+DEFAULT_CATEGORIES = [ESSENTIALS, LIFESTYLE, SAVINGS, DEBT, OTHER]
+
+# Categories offered in expense forms when a user has neither a budget nor categories
+DEFAULT_EXPENSE_CATEGORIES = ["Essentials", "Food & Dining", "Entertainment", "Transportation"]
+
+
+class CategoryRegistry:
+    """
+    Interned categories with O(1) lookup by name, label or alias
+    """
+
+    def __init__(self):
+        self.names = []
+        self.emojis = []
+        self.labels = []
+        self.groups = []
+        self.group_ids = []
+        self.descriptions = []
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, emoji="", group=OTHER, description="", label=None, aliases=()):
+        """
+        Add a category
+
+        Args:
+            name (str): Canonical name, as stored on expenses and budgets
+            emoji (str): Emoji shown before the name
+            group (str): One of GROUPS
+            description (str): What the category covers
+            label (str): Display label; "<emoji> <name>" if omitted
+            aliases (list): Other names that mean this category
+
+        Returns:
+            int: Category id
+        """
+        with self._lock:
+            category_id = self._ids.get(name)
+            if category_id is None:
+                category_id = len(self.names)
+                self.names.append(name)
+                self.emojis.append(emoji)
+                self.labels.append(label or (f"{emoji} {name}" if emoji else name))
+                self.groups.append(group)
+                self.group_ids.append(GROUP_IDS[group])
+                self.descriptions.append(description)
+            for key in (name, self.labels[category_id], *aliases):
+                self._ids[key] = category_id
+                self._ids[key.lower()] = category_id
+                # The label text without its emoji, as older pages stored it
+                if " " in key and not key[0].isalnum():
+                    self._ids[key.split(" ", 1)[1]] = category_id
+                    self._ids[key.split(" ", 1)[1].lower()] = category_id
+            return category_id
+
+    def id(self, category):
+        """Id of a category name, label or alias, interning unknown ones"""
+        category_id = self._ids.get(category)
+        if category_id is not None:
+            return category_id
+
+        text = str(category or "").strip()
+        if " " in text and not text[0].isalnum():
+            text = text.split(" ", 1)[1].strip()
+        category_id = self._ids.get(text, self._ids.get(text.lower()))
+        if category_id is None:
+            category_id = self.register(text or OTHER)
+        self._ids[category] = category_id
+        return category_id
+
+    def canonical(self, category):
+        """Canonical name of a category name, label or alias"""
+        return self.names[self.id(category)]
+
+    def group(self, category):
+        return self.groups[self.id(category)]
+
+    def group_id(self, category):
+        return self.group_ids[self.id(category)]
+
+    def label(self, category):
+        return self.labels[self.id(category)]
+
+    def description(self, category, default="Miscellaneous expenses"):
+        return self.descriptions[self.id(category)] or default
+
+
+REGISTRY = CategoryRegistry()
+
+REGISTRY.register("Essentials", "🏠", ESSENTIALS, "Rent/mortgage, utilities, groceries, transportation",
+                  label="🏠 Essentials (Rent, Utilities)", aliases=["Rent", "Utilities", "Needs", "Housing"])
+for _name, _emoji, _group, _description, _aliases in [
+    ("Transportation", "🚌", ESSENTIALS, "Public transport, fuel, vehicle maintenance", ["Transport", "Fuel"]),
+    ("Food & Dining", "🍔", ESSENTIALS, "Groceries, restaurants, food delivery", ["Food", "Groceries", "Dining"]),
+    ("Health", "💊", ESSENTIALS, "Medical expenses, insurance, fitness", ["Healthcare", "Medical"]),
+    ("Entertainment", "🎬", LIFESTYLE, "Movies, events, hobbies", []),
+    ("Shopping", "🛍️", LIFESTYLE, "Clothing, electronics, personal items", []),
+    ("Travel", "✈️", LIFESTYLE, "Vacations, trips, accommodations", []),
+    ("Lifestyle", "🎉", LIFESTYLE, "Dining out, entertainment, shopping, hobbies", ["Wants"]),
+    ("Education", "📚", OTHER, "Courses, books, tuition", []),
+    ("Subscriptions", "📱", OTHER, "Streaming services, memberships, apps", []),
+    ("Investments", "💸", SAVINGS, "Stocks, mutual funds, retirement", []),
+    ("Gifts & Donations", "🎁", OTHER, "Presents, charitable donations", ["Gifts", "Donations"]),
+    ("Savings & Investments", "💰", SAVINGS, "Emergency fund, retirement, investments", ["Savings"]),
+    ("Debt & EMIs", "💳", DEBT, "Loan payments, credit card debt, EMIs", ["Debt", "EMIs", "Loans"]),
+    ("Other / Subscriptions", "📦", OTHER, "Streaming services, memberships, miscellaneous", ["Other"]),
+]:
+    REGISTRY.register(_name, _emoji, _group, _description, aliases=_aliases)
+
+# Labels offered in onboarding, in display order
+ONBOARDING_LABELS = [REGISTRY.label(name) for name in [
+    "Essentials", "Transportation", "Food & Dining", "Entertainment", "Shopping", "Health",
+    "Education", "Subscriptions", "Investments", "Gifts & Donations", "Travel"
+]]
+
+
+def canonical_category(category):
+    """Canonical name of a category name, label or alias"""
+    return REGISTRY.canonical(category)
+
+
+def category_group(category):
+    """Group a category belongs to"""
+    return REGISTRY.group(category)
+
+
+def canonical_categories(categories, default=None):
+    """
+    Canonical names of a list of labels, deduplicated in order
+
+    Args:
+        categories (list): Category names or emoji labels
+        default (list): Returned when categories is empty; DEFAULT_CATEGORIES if omitted
+    """
+    names = list(dict.fromkeys(REGISTRY.canonical(cat) for cat in categories))
+    return names or list(DEFAULT_CATEGORIES if default is None else default)
+
+
+def canonical_amounts(amounts):
+    """Re-key a category -> amount dict by canonical name, merging aliases"""
+    merged = {}
+    for category, amount in (amounts or {}).items():
+        name = REGISTRY.canonical(category)
+        merged[name] = merged.get(name, 0) + amount
+    return merged
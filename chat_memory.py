@@ -0,0 +1,145 @@
+"""
+Bounded conversation memory for the financial assistant.
+
+Keeps a sliding window of the most recent messages verbatim and folds older
+messages into a rolling summary of fixed maximum size, so the transcript held
+in session state stays constant no matter how long the chat runs. The window
+and summary are rendered into the model prompt within a token budget.
+"""
+import re
+from collections import deque
+
+from prompt_builder import CHARS_PER_TOKEN, estimate_tokens
+
+# Longest run of unanswered questions kept for one summary line
+MAX_PENDING_CHARS = 240
+
+
+def _first_sentence(text, max_chars):
+    """Collapse whitespace and keep the first sentence, capped at max_chars"""
+    text = re.sub(r"\s+", " ", text or "").strip()
+    match = re.match(r"(.+?[.!?])(\s|$)", text)
+    if match:
+        text = match.group(1)
+    if len(text) > max_chars:
+        text = text[:max_chars - 1].rstrip() + "…"
+    return text
+
+
+class ConversationMemory:
+    """
+    Sliding window of recent messages plus a rolling summary of older ones
+
+    Args:
+        window_messages (int): Number of most recent messages kept verbatim
+        max_summary_chars (int): Upper bound on the size of the rolling summary
+        greeting (str): Optional assistant message to start the conversation with
+    """
+
+    def __init__(self, window_messages=8, max_summary_chars=1200, greeting=None):
+        self.window_messages = window_messages
+        self.max_summary_chars = max_summary_chars
+        self.recent = deque()
+        self.summary_lines = deque()
+        self._summary_chars = 0
+        self._pending_question = None
+        self.total_messages = 0
+
+        if greeting:
+            self.add("assistant", greeting)
+
+    def add(self, role, content):
+        """Append a message, folding the oldest one into the summary if the window is full"""
+        self.recent.append({"role": role, "content": content})
+        self.total_messages += 1
+        while len(self.recent) > self.window_messages:
+            self._fold(self.recent.popleft())
+
+    def _fold(self, message):
+        """Fold an evicted message into the rolling summary"""
+        if message["role"] == "user":
+            # Wait for the answer so question and answer share one summary line;
+            # questions asked back to back are kept together
+            question = _first_sentence(message["content"], 120)
+            if self._pending_question:
+                question = f"{self._pending_question} {question}"
+                if len(question) > MAX_PENDING_CHARS:
+                    question = question[:MAX_PENDING_CHARS - 1].rstrip() + "…"
+            self._pending_question = question
+            return
+
+        answer = _first_sentence(message["content"], 160)
+        if self._pending_question:
+            line = f"User asked: {self._pending_question} Assistant: {answer}"
+            self._pending_question = None
+        else:
+            line = f"Assistant: {answer}"
+
+        self.summary_lines.append(line)
+        self._summary_chars += len(line) + 1
+        while self._summary_chars > self.max_summary_chars and self.summary_lines:
+            dropped = self.summary_lines.popleft()
+            self._summary_chars -= len(dropped) + 1
+
+    @property
+    def summary(self):
+        """Rolling summary of messages that left the window"""
+        lines = list(self.summary_lines)
+        if self._pending_question:
+            lines.append(f"User asked: {self._pending_question}")
+        return "\n".join(lines)
+
+    def messages(self):
+        """Messages currently in the window, oldest first"""
+        return list(self.recent)
+
+    def to_prompt(self, token_budget):
+        """
+        Render summary and recent messages for the model within a token budget
+
+        Recent messages win over the summary; the oldest content is dropped
+        first when the budget is tight.
+
+        Args:
+            token_budget (int): Maximum estimated tokens for the rendered text
+
+        Returns:
+            str: Conversation context, or an empty string if there is none
+        """
+        if token_budget <= 12:
+            return ""
+
+        # Leave room for the two section headers
+        remaining = token_budget - 12
+        recent_lines = []
+        for message in reversed(self.recent):
+            speaker = "User" if message["role"] == "user" else "Assistant"
+            content = re.sub(r"[ \t]+", " ", message["content"]).strip()
+            line = f"{speaker}: {content}"
+            cost = estimate_tokens(line) + 1
+            if cost > remaining:
+                if not recent_lines:
+                    # Always keep a shortened version of the latest message
+                    line = line[:max(0, remaining * CHARS_PER_TOKEN - 2)] + "…"
+                    recent_lines.append(line)
+                    remaining = 0
+                break
+            recent_lines.append(line)
+            remaining -= cost
+        recent_lines.reverse()
+
+        summary_lines = []
+        for line in reversed(self.summary.split("\n") if self.summary else []):
+            cost = estimate_tokens(line) + 1
+            if cost > remaining:
+                break
+            summary_lines.append(line)
+            remaining -= cost
+        summary_lines.reverse()
+
+        sections = []
+        if summary_lines:
+            sections.append("Earlier in the conversation:\n" + "\n".join(summary_lines))
+        if recent_lines:
+            sections.append("Recent messages:\n" + "\n".join(recent_lines))
+        return "\n\n".join(sections)
@@ -0,0 +1,448 @@
+"""
+Firestore data access shared by the pages, the chatbot tools and batch jobs.
+
+Expenses live in users/{user_id}/expenses with an ISO formatted `date`
+string, so date windows are expressed as string range filters on that field.
+"""
+import contextvars
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import numpy as np
+from firebase_admin import firestore
+
+from cache import get_cache
+from category_registry import canonical_category
+from money import (DEFAULT_CURRENCY, convert_minor, currency_code, expense_currency, expense_minor, from_minor,
+                   minor_array, minor_per_unit)
+from shared import db
+
+# Cached expense queries are keyed on expenses_version, so this only bounds memory
+EXPENSE_QUERY_TTL = 3600
+
+# Expense fields each kind of read needs; select() leaves the rest of the document on the server
+TOTAL_FIELDS = ("amount", "amount_minor", "currency", "category", "date")
+FRAME_FIELDS = TOTAL_FIELDS + ("notes",)
+LIST_FIELDS = FRAME_FIELDS + ("anomaly",)
+
+# How stale a cached user document may be for read-only callers
+USER_SNAPSHOT_TTL = 30
+
+# Seconds a page waits for its reads together before rendering without the slow ones
+PAGE_LOAD_TIMEOUT = float(os.getenv("PAGE_LOAD_TIMEOUT", "10"))
+PAGE_LOAD_THREADS = 16
+
+_READ_POOL = None
+_READ_POOL_LOCK = threading.Lock()
+
+# Documents read in the current track_reads() block, as a one-item list
+_READS = contextvars.ContextVar("firestore_reads", default=None)
+
+
+def count_reads(count=1):
+    """Note documents read from Firestore, for the enclosing track_reads() block"""
+    counter = _READS.get()
+    if counter is not None:
+        counter[0] += count
+
+
+@contextmanager
+def track_reads():
+    """
+    Count the Firestore documents read inside the block
+
+    Reads made by load_concurrently() workers count too. Nested blocks add
+    their count to the enclosing one when they end.
+
+    Yields:
+        list: One-item list holding the count so far
+    """
+    outer = _READS.get()
+    counter = [0]
+    token = _READS.set(counter)
+    try:
+        yield counter
+    finally:
+        _READS.reset(token)
+        if outer is not None:
+            outer[0] += counter[0]
+
+
+def user_ref(user_id):
+    """Document reference for a user"""
+    return db.collection("users").document(user_id)
+
+
+def expenses_ref(user_id):
+    """Collection reference for a user's expenses"""
+    return user_ref(user_id).collection("expenses")
+
+
+def get_user_data(user_id, cached=False):
+    """
+    Load a user's profile document
+
+    Args:
+        user_id (str): User id
+        cached (bool): Accept a snapshot up to USER_SNAPSHOT_TTL seconds old from
+                       the shared cache; only for callers that don't write it back
+
+    Returns:
+        dict: User data, empty if the document does not exist
+    """
+    def load():
+        user_doc = user_ref(user_id).get()
+        count_reads()
+        if not user_doc.exists:
+            return {}
+        return user_doc.to_dict() or {}
+
+    if not cached:
+        return load()
+    return dict(get_cache().get_or_set("user", user_id, load, ttl=USER_SNAPSHOT_TTL))
+
+
+def _read_pool():
+    """Thread pool for concurrent reads, created on first use"""
+    global _READ_POOL
+    with _READ_POOL_LOCK:
+        if _READ_POOL is None:
+            _READ_POOL = ThreadPoolExecutor(max_workers=PAGE_LOAD_THREADS, thread_name_prefix="read")
+        return _READ_POOL
+
+
+def load_concurrently(loaders, timeout=PAGE_LOAD_TIMEOUT):
+    """
+    Run independent reads at the same time
+
+    A page declares every read it needs up front, so loading it takes as
+    long as the slowest read rather than the sum of them. Reads still
+    running when the timeout runs out are reported as errors; they finish
+    in the background and their results are dropped.
+
+    Args:
+        loaders (dict): Name -> zero-argument callable doing one read
+        timeout (float): Seconds to wait for all of the reads together
+
+    Returns:
+        tuple: (results, errors) dicts keyed by name; errors hold the exceptions
+    """
+    # Each worker runs in a copy of this context, so track_reads() sees its reads
+    futures = {name: _read_pool().submit(contextvars.copy_context().run, loader) for name, loader in loaders.items()}
+    done, _ = wait(futures.values(), timeout=timeout)
+    results, errors = {}, {}
+    for name, future in futures.items():
+        if future not in done:
+            future.cancel()
+            errors[name] = TimeoutError(f"{name} took longer than {timeout:g}s")
+        elif future.exception() is not None:
+            errors[name] = future.exception()
+        else:
+            results[name] = future.result()
+    return results, errors
+
+
+def bump_expenses_version(user_id, updates=None, batch=None, count=1):
+    """
+    Mark a user's expenses as changed
+
+    Call after adding, editing or deleting expenses; caches derived from the
+    expense history are keyed on the `expenses_version` counter.
+
+    Args:
+        user_id (str): User id
+        updates (dict): Other user document fields to write in the same update
+        batch: Optional write batch to add the update to instead of writing it now
+        count (int): Number of expense changes the update covers
+    """
+    fields = {**(updates or {}), "expenses_version": firestore.Increment(count)}
+    if batch is not None:
+        batch.update(user_ref(user_id), fields)
+    else:
+        user_ref(user_id).update(fields)
+    get_cache().delete("user", user_id)
+
+
+def iter_user_pages(page_size=200, start_after=None):
+    """
+    Stream user documents in pages ordered by document id
+
+    Ordering by id makes the last id of a page a stable resume point.
+
+    Args:
+        page_size (int): Documents per query
+        start_after (str): Only return users whose id sorts after this one
+
+    Yields:
+        list: (user_id, user_data) tuples for one page
+    """
+    last_id = start_after
+    while True:
+        query = db.collection("users").order_by(firestore.FieldPath.document_id()).limit(page_size)
+        if last_id:
+            query = query.start_after({firestore.FieldPath.document_id(): last_id})
+        page = [(doc.id, doc.to_dict() or {}) for doc in query.stream()]
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        last_id = page[-1][0]
+
+
+def _iso(value):
+    """Normalize a date, datetime or ISO string to an ISO string"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def get_expense(user_id, expense_id):
+    """
+    One expense document with all of its fields
+
+    Returns:
+        dict: The expense with its id under 'id', or None if it doesn't exist
+    """
+    expense_doc = expenses_ref(user_id).document(expense_id).get()
+    count_reads()
+    if not expense_doc.exists:
+        return None
+    return {**expense_doc.to_dict(), "id": expense_doc.id}
+
+
+def query_expenses(user_id, start_date=None, end_date=None, category=None, limit=None, newest_first=False,
+                   version=None, fields=None):
+    """
+    Query a user's expenses within an optional date window
+
+    Args:
+        user_id (str): User id
+        start_date (date or str): Inclusive lower bound on the expense date
+        end_date (date or str): Exclusive upper bound on the expense date
+        category (str): Only return expenses in this category
+        limit (int): Maximum number of expenses to return
+        newest_first (bool): Order by date descending
+        version (int): The user's expenses_version; when given, results are
+                       shared through the cache until the version changes
+        fields (tuple): Only download these fields, e.g. TOTAL_FIELDS; all
+                        fields when None
+
+    Returns:
+        list: Expense dicts with their document id under 'id'
+    """
+    if version is not None:
+        key = (user_id, _iso(start_date), _iso(end_date), canonical_category(category) if category else None,
+               limit, newest_first, fields)
+        expenses = get_cache().get_or_set(
+            "expenses", key,
+            lambda: query_expenses(user_id, start_date, end_date, category, limit, newest_first, fields=fields),
+            ttl=EXPENSE_QUERY_TTL, version=version
+        )
+        # Callers may annotate the dicts, so never hand out the cached ones
+        return [dict(expense) for expense in expenses]
+
+    query = expenses_ref(user_id)
+    if fields is not None:
+        # Date and category are needed below for filtering
+        query = query.select(list(dict.fromkeys((*fields, "date", "category"))))
+    if start_date:
+        query = query.where("date", ">=", _iso(start_date))
+    if end_date:
+        query = query.where("date", "<", _iso(end_date))
+    if newest_first or limit:
+        query = query.order_by("date", direction="DESCENDING" if newest_first else "ASCENDING")
+    if limit and not category:
+        query = query.limit(limit)
+
+    expenses = []
+    for doc in query.stream():
+        count_reads()
+        expense = doc.to_dict()
+        # Category is filtered here so the date range does not need a composite index
+        if category and canonical_category(expense.get("category")) != canonical_category(category):
+            continue
+        expense["id"] = doc.id
+        expenses.append(expense)
+        if limit and len(expenses) >= limit:
+            break
+    return expenses
+
+
+def sum_by_category(expenses, currency=DEFAULT_CURRENCY):
+    """
+    Total expense amounts per canonical category, summed exactly in minor units
+
+    Args:
+        expenses (list): Expense dicts
+        currency (str): Base currency; foreign expenses are converted to it
+
+    Returns:
+        dict: category -> total amount
+    """
+    totals = {}
+    for expense, minor in zip(expenses, minor_array(expenses, currency).tolist()):
+        category = canonical_category(expense.get("category", "Other"))
+        totals[category] = totals.get(category, 0) + minor
+    return {category: from_minor(minor, currency) for category, minor in totals.items()}
+
+
+_MONTH_WORDS = {"jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+                "january", "february", "march", "april", "june", "july", "august", "september",
+                "october", "november", "december"}
+
+
+def note_key(notes):
+    """
+    Normalize expense notes for matching the same payee across expenses
+
+    Lowercases and drops digits, punctuation and month names, so
+    "Netflix #4411 (Oct)" and "netflix - nov" give the same key.
+    """
+    words = re.sub(r"[^a-z]+", " ", str(notes or "").lower()).split()
+    return " ".join(word for word in words if word not in _MONTH_WORDS)
+
+
+def _parse_day(day):
+    try:
+        return np.datetime64(day, "D")
+    except ValueError:
+        return np.datetime64("NaT")
+
+
+class ExpenseFrame:
+    """
+    Columnar view of expenses for vectorized analysis
+
+    Dates, amounts, interned category codes and interned note keys are held
+    in parallel NumPy arrays, so per-category aggregates are single
+    bincount/add.at calls instead of loops over expense dicts. Amounts are
+    kept as exact int64 minor units of the base currency (`minor`) with a
+    float view (`amounts`); foreign-currency expenses keep their original
+    amounts in `original_minor` and are converted per currency in one
+    vectorized step as they are appended.
+
+    Args:
+        categories (list): Known category names; new ones are added as seen
+        currency (str): Base currency the amounts are converted to
+    """
+
+    def __init__(self, categories=(), currency=DEFAULT_CURRENCY):
+        self.currency = currency_code(currency)
+        self.scale = minor_per_unit(currency)
+        self.currencies = []
+        self._currency_index = {}
+        self.currency_codes = np.array([], dtype=np.int32)
+        self.original_minor = np.array([], dtype=np.int64)
+        self.categories = []
+        self._codes = {}
+        for category in categories:
+            self.category_code(category)
+        self.dates = np.array([], dtype="datetime64[D]")
+        self.minor = np.array([], dtype=np.int64)
+        self.amounts = np.array([], dtype=float)
+        self.codes = np.array([], dtype=np.int32)
+        self.notes = []
+        self._note_codes = {}
+        self.note_codes = np.array([], dtype=np.int32)
+        self.ids = []
+
+    @classmethod
+    def from_expenses(cls, expenses, categories=(), currency=DEFAULT_CURRENCY):
+        frame = cls(categories, currency)
+        frame.append(expenses)
+        return frame
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def category_code(self, category):
+        """Integer code for a category name or label, interning its canonical name if new"""
+        code = self._codes.get(category)
+        if code is None:
+            name = canonical_category(category)
+            code = self._codes.get(name)
+            if code is None:
+                code = len(self.categories)
+                self._codes[name] = code
+                self.categories.append(name)
+            self._codes[category] = code
+        return code
+
+    def currency_index(self, currency):
+        """Integer code for a currency, interning it if new"""
+        code = self._currency_index.get(currency)
+        if code is None:
+            code = len(self.currencies)
+            self._currency_index[currency] = code
+            self.currencies.append(currency)
+        return code
+
+    def note_code(self, notes):
+        """Integer code for the normalized key of some notes, interning it if new"""
+        key = note_key(notes)
+        code = self._note_codes.get(key)
+        if code is None:
+            code = len(self.notes)
+            self._note_codes[key] = code
+            self.notes.append(key)
+        return code
+
+    def append(self, expenses):
+        """Add expense dicts; rows without a parseable date are skipped"""
+        expenses = [e for e in expenses if isinstance(e.get("date"), (str, date))]
+        if not expenses:
+            return
+        day_strings = [str(e["date"])[:10] for e in expenses]
+        try:
+            dates = np.array(day_strings, dtype="datetime64[D]")
+        except ValueError:
+            # Parse row by row so one malformed date only drops its own row
+            dates = np.array([_parse_day(day) for day in day_strings], dtype="datetime64[D]")
+        valid = ~np.isnat(dates)
+        if not valid.all():
+            expenses = [e for e, ok in zip(expenses, valid) if ok]
+            dates = dates[valid]
+            if not expenses:
+                return
+
+        self.dates = np.concatenate([self.dates, dates])
+        original = np.array([expense_minor(e, self.currency) for e in expenses], dtype=np.int64)
+        currency_codes = np.array([self.currency_index(expense_currency(e, self.currency)) for e in expenses],
+                                  dtype=np.int32)
+        minor = convert_minor(original, currency_codes, self.currencies, dates, self.currency)
+        self.original_minor = np.concatenate([self.original_minor, original])
+        self.currency_codes = np.concatenate([self.currency_codes, currency_codes])
+        self.minor = np.concatenate([self.minor, minor])
+        self.amounts = np.concatenate([self.amounts, minor / self.scale])
+        codes = [self.category_code(e.get("category", "Other")) for e in expenses]
+        self.codes = np.concatenate([self.codes, np.array(codes, dtype=np.int32)])
+        note_codes = [self.note_code(e.get("notes")) for e in expenses]
+        self.note_codes = np.concatenate([self.note_codes, np.array(note_codes, dtype=np.int32)])
+        self.ids.extend(e.get("id") for e in expenses)
+
+    def between(self, start=None, end=None):
+        """Boolean mask of rows with start <= date < end"""
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= self.dates >= np.datetime64(_iso(start)[:10], "D")
+        if end is not None:
+            mask &= self.dates < np.datetime64(_iso(end)[:10], "D")
+        return mask
+
+    def totals_minor_by_category(self, mask=None):
+        """Exact int64 sum of minor units per category code, optionally over a row mask"""
+        totals = np.zeros(len(self.categories), dtype=np.int64)
+        if mask is None:
+            np.add.at(totals, self.codes, self.minor)
+        else:
+            np.add.at(totals, self.codes[mask], self.minor[mask])
+        return totals
+
+    def totals_by_category(self, mask=None):
+        """Sum of amounts per category code, optionally over a row mask"""
+        return self.totals_minor_by_category(mask) / self.scale
@@ -0,0 +1,236 @@
+"""
+Local write-ahead journal of expense entries, one SQLite file per user.
+
+New expenses land here before anything is sent to Firestore, so entry keeps
+working while the backend is slow or unreachable and nothing typed in is
+lost if the process restarts. The journal runs in WAL mode with
+synchronous=NORMAL: appends are durable against process crashes and the
+fsyncs are batched at WAL checkpoints rather than paid on every entry.
+
+Each entry is keyed by the Firestore document id it will be written under,
+which doubles as its idempotency key. Replay workers (ExpenseQueue.flush)
+claim entries with a lease so two sessions never send the same entry at
+once, and mark them done when they land. Claims are counted, so a worker
+can tell an entry an earlier worker may already have written, even one
+that died between its commit and marking the entry done. Done entries
+stay until the next full read of the user's expenses includes them.
+
+The journal also keeps the last user document and expense list read from
+Firestore, as JSON, so pages can still render during an outage. Journal
+files live in a directory only the app's user can open (local_store).
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from firebase_admin import firestore
+
+from local_store import DATA_HOME, dumps, loads, private_dir
+
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", os.path.join(DATA_HOME, "journal"))
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+# How long a replay worker owns the entries it claimed
+LEASE_SECONDS = 60
+
+_LOCK = threading.Lock()
+
+_SENTINEL = type(firestore.SERVER_TIMESTAMP)
+
+
+def _encode(value):
+    """JSON form of user document updates, with Increment transforms spelled out"""
+    if isinstance(value, firestore.Increment):
+        return {"$increment": value.value}
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    return value
+
+
+def _has_sentinel(value):
+    """Whether a value holds a Firestore sentinel such as SERVER_TIMESTAMP, which can't be journaled"""
+    if isinstance(value, _SENTINEL):
+        return True
+    if isinstance(value, dict):
+        return any(_has_sentinel(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_sentinel(item) for item in value)
+    return False
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if set(value) == {"$increment"}:
+            return firestore.Increment(value["$increment"])
+        return {key: _decode(item) for key, item in value.items()}
+    return value
+
+
+class ExpenseJournal:
+    """
+    Append-only journal for one user
+
+    Args:
+        user_id (str): User id
+        directory (str): Where journal files live
+    """
+
+    def __init__(self, user_id, directory=JOURNAL_DIR):
+        private_dir(directory)
+        self.path = os.path.join(directory, re.sub(r"[^A-Za-z0-9_-]", "_", user_id) + ".sqlite3")
+        self.local = threading.local()
+        with self._connection() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT UNIQUE,
+                payload TEXT,
+                state TEXT,
+                attempts INTEGER DEFAULT 0,
+                claims INTEGER DEFAULT 0,
+                error TEXT,
+                lease_until REAL DEFAULT 0,
+                done_at REAL
+            )""")
+            conn.execute("CREATE TABLE IF NOT EXISTS snapshots (name TEXT PRIMARY KEY, value TEXT)")
+            # Journals from before claims were counted
+            if "claims" not in [row[1] for row in conn.execute("PRAGMA table_info(entries)")]:
+                conn.execute("ALTER TABLE entries ADD COLUMN claims INTEGER DEFAULT 0")
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _entries(self, rows):
+        entries = []
+        for key, payload, attempts, claims, error in rows:
+            entry = {"key": key, **loads(payload), "attempts": attempts, "claims": claims, "error": error}
+            entry["user_updates"] = _decode(entry["user_updates"])
+            entries.append(entry)
+        return entries
+
+    def append(self, key, expense, user_updates, change):
+        """
+        Record a new expense
+
+        Args:
+            key (str): Firestore document id for the expense
+            expense (dict): Expense document, without server timestamps
+            user_updates (dict): User document fields to write with it
+            change (dict): The expense as passed to record_expense_change
+
+        Raises:
+            ValueError: If any of them holds a server timestamp or other Firestore sentinel
+        """
+        if _has_sentinel([expense, user_updates, change]):
+            raise ValueError(f"Expense {key} holds a Firestore sentinel; the write sets server timestamps itself")
+        payload = dumps({"expense": expense, "user_updates": _encode(user_updates), "change": change})
+        with self._connection() as conn:
+            conn.execute("INSERT OR IGNORE INTO entries (key, payload, state) VALUES (?, ?, ?)",
+                         (key, payload, PENDING))
+
+    def entries(self, *states):
+        """Entries in the given states, oldest first, with their user updates decoded"""
+        placeholders = ", ".join("?" for _ in states)
+        rows = self._connection().execute(
+            f"SELECT key, payload, attempts, claims, error FROM entries WHERE state IN ({placeholders}) ORDER BY seq",
+            states
+        ).fetchall()
+        return self._entries(rows)
+
+    def claim(self, limit, lease=LEASE_SECONDS):
+        """
+        Take up to limit pending entries nobody else is replaying
+
+        Returns:
+            list: The claimed entries, oldest first; `claims` includes this claim,
+                  so above 1 means an earlier worker may have written the entry
+        """
+        now = time.time()
+        conn = self._connection()
+        with _LOCK:
+            # IMMEDIATE takes the write lock before reading, so other processes can't claim the same rows
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT key, payload, attempts, claims, error FROM entries WHERE state = ? AND lease_until < ? "
+                    "ORDER BY seq LIMIT ?", (PENDING, now, limit)
+                ).fetchall()
+                conn.executemany("UPDATE entries SET lease_until = ?, claims = claims + 1 WHERE key = ?",
+                                 [(now + lease, row[0]) for row in rows])
+                rows = [(key, payload, attempts, claims + 1, error) for key, payload, attempts, claims, error in rows]
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return self._entries(rows)
+
+    def in_flight(self):
+        """Number of pending entries currently claimed by a replay worker"""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM entries WHERE state = ? AND lease_until >= ?", (PENDING, time.time())
+        ).fetchone()[0]
+
+    def mark_done(self, keys):
+        with self._connection() as conn:
+            conn.executemany("UPDATE entries SET state = ?, done_at = ?, lease_until = 0 WHERE key = ?",
+                             [(DONE, time.time(), key) for key in keys])
+
+    def release(self, keys, error):
+        """Return claimed entries to the queue after a failed attempt"""
+        with self._connection() as conn:
+            conn.executemany("UPDATE entries SET attempts = attempts + 1, error = ?, lease_until = 0 WHERE key = ?",
+                             [(error, key) for key in keys])
+
+    def mark_failed(self, keys, error):
+        with self._connection() as conn:
+            conn.executemany("UPDATE entries SET state = ?, error = ?, lease_until = 0 WHERE key = ?",
+                             [(FAILED, error, key) for key in keys])
+
+    def pop_failed(self):
+        """Failed entries, removed from the journal"""
+        failed = self.entries(FAILED)
+        if failed:
+            with self._connection() as conn:
+                conn.executemany("DELETE FROM entries WHERE key = ?", [(entry["key"],) for entry in failed])
+        return failed
+
+    def claimable(self):
+        """Number of pending entries no replay worker holds"""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM entries WHERE state = ? AND lease_until < ?", (PENDING, time.time())
+        ).fetchone()[0]
+
+    def done_since(self, since):
+        """Number of entries that landed at or after a time"""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM entries WHERE state = ? AND done_at >= ?", (DONE, since)
+        ).fetchone()[0]
+
+    def purge_done(self, before):
+        """Forget entries that landed before a full reread, which now includes them"""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM entries WHERE state = ? AND done_at < ?", (DONE, before))
+        self._connection().execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def save_snapshot(self, name, value):
+        """Keep the last value read from Firestore, for use during outages"""
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO snapshots (name, value) VALUES (?, ?)",
+                         (name, dumps(value)))
+
+    def snapshot(self, name, default=None):
+        row = self._connection().execute("SELECT value FROM snapshots WHERE name = ?", (name,)).fetchone()
+        # Snapshots pickled by older versions are never unpickled, only replaced
+        if row is None or not isinstance(row[0], str):
+            return default
+        return loads(row[0])
@@ -0,0 +1,379 @@
+"""
+Write-behind queue for new expenses, backed by a local journal.
+
+Saving an expense used to write it, rerun the page and reread every
+expense just to show the new row, and a Firestore outage lost the entry.
+Instead, each session keeps a snapshot of the user's expenses and new
+expenses go through the user's ExpenseJournal (expense_journal.py):
+
+- enqueue() appends the expense to the journal, so it shows up straight
+  away and survives restarts, and starts a background replay (task_executor)
+- the replay claims up to FLUSH_BATCH_SIZE journaled expenses per batch
+  and commits them together with their user document updates (category
+  statistics, recurring series, expenses_version)
+- connection problems leave entries in the journal, to be retried with
+  backoff and resumed on the next page load; other errors are retried
+  MAX_ATTEMPTS times before the entry is dropped and reported by pop_failures()
+
+Document ids are chosen when the expense is journaled and serve as
+idempotency keys: an entry claimed before, by this or a session that died,
+first checks whether its document already landed, so a batch whose
+acknowledgement was lost is not written twice. Pages apply the journaled
+user document updates with overlay() so statistics and versions already
+include them. The snapshot is reloaded when expenses_version shows another
+session (or a delete elsewhere) changed the expenses. While Firestore
+can't be reached, read_user() and expenses() fall back to the last copies
+kept in the journal and set `offline`; those copies are only rewritten
+when the user document or expenses_version has changed.
+"""
+import copy
+import threading
+import time
+
+import streamlit as st
+from firebase_admin import firestore
+from google.api_core import exceptions as api_exceptions
+
+from data_layer import LIST_FIELDS, bump_expenses_version, count_reads, expenses_ref, get_user_data, user_ref
+from expense_journal import DONE, PENDING, ExpenseJournal
+from shared import db
+from spend_forecast import record_expense_change
+from task_executor import submit_task
+
+FLUSH_BATCH_SIZE = 20
+MAX_ATTEMPTS = 3
+# Seconds before the first retry; doubled for each later attempt
+RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 30
+# Retries of a replay that can't reach Firestore before it waits for the next page load
+MAX_OUTAGE_RETRIES = 5
+
+# Errors that mean Firestore couldn't be reached, rather than that the write is bad
+TRANSIENT_ERRORS = (
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.InternalServerError,
+    api_exceptions.TooManyRequests,
+    api_exceptions.Aborted,
+    ConnectionError,
+    TimeoutError
+)
+
+
+def _split_path(path):
+    """Field names of a dotted Firestore field path, with `quoted` names unquoted"""
+    names, current, quoted, escaped = [], [], False, False
+    for char in path:
+        if escaped:
+            current.append(char)
+            escaped = False
+        elif char == "\\" and quoted:
+            escaped = True
+        elif char == "`":
+            quoted = not quoted
+        elif char == "." and not quoted:
+            names.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    names.append("".join(current))
+    return names
+
+
+def apply_updates(data, updates):
+    """
+    A copy of a document with Firestore update fields applied locally
+
+    Handles dotted field paths and Increment transforms; nested maps are
+    copied on the way down so the original document is left unchanged.
+    """
+    data = dict(data)
+    for path, value in updates.items():
+        names = _split_path(path)
+        target = data
+        for name in names[:-1]:
+            child = target.get(name)
+            target[name] = dict(child) if isinstance(child, dict) else {}
+            target = target[name]
+        if isinstance(value, firestore.Increment):
+            target[names[-1]] = (target.get(names[-1]) or 0) + value.value
+        elif value is firestore.DELETE_FIELD:
+            target.pop(names[-1], None)
+        else:
+            target[names[-1]] = value
+    return data
+
+
+def merge_updates(updates_list):
+    """Combine several user document updates into one, summing increments to the same field"""
+    merged = {}
+    for updates in updates_list:
+        for path, value in updates.items():
+            previous = merged.get(path)
+            if isinstance(previous, firestore.Increment) and isinstance(value, firestore.Increment):
+                value = firestore.Increment(previous.value + value.value)
+            merged[path] = value
+    return merged
+
+
+class ExpenseQueue:
+    """
+    One user's expense snapshot and journaled expense writes
+
+    Args:
+        user_id (str): User id
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.journal = ExpenseJournal(user_id)
+        self.lock = threading.Lock()
+        self.rows = None
+        # expenses_version the snapshot was read at, and when the read started
+        self.version = None
+        self.loaded_at = 0
+        self.flushing = False
+        self.offline = False
+        # The user document as last kept in the journal, so unchanged reads aren't written again
+        self.saved_user = None
+
+    def read_user(self):
+        """
+        The user document, or the last copy read if Firestore can't be reached
+
+        Returns:
+            dict: User data, before overlay()
+        """
+        try:
+            user_data = get_user_data(self.user_id)
+        except Exception as e:
+            print(f"Error reading user {self.user_id}, using the journal copy: {str(e)}")
+            return self.last_user()
+        self.offline = False
+        if self.saved_user is None:
+            self.saved_user = self.journal.snapshot("user", {})
+        if user_data != self.saved_user:
+            self.journal.save_snapshot("user", user_data)
+            self.saved_user = copy.deepcopy(user_data)
+        return user_data
+
+    def last_user(self):
+        """The last user document read_user() got, for when Firestore can't be reached"""
+        self.offline = True
+        return self.journal.snapshot("user", {})
+
+    def _rows(self, entries):
+        return [{**entry["expense"], "id": entry["key"], "pending": True} for entry in reversed(entries)]
+
+    def _stream(self):
+        """Every written expense's LIST_FIELDS, newest first"""
+        rows = []
+        query = expenses_ref(self.user_id).select(list(LIST_FIELDS))
+        for doc in query.order_by("date", direction="DESCENDING").stream():
+            expense = doc.to_dict()
+            expense["id"] = doc.id
+            rows.append(expense)
+        count_reads(len(rows))
+        return rows
+
+    def prefetch(self):
+        """
+        Read the expense list for a session that has none yet, alongside the user document read
+
+        For load_page_data to run with read_user(). The list's expenses_version
+        is read just before it, so expenses() only takes the list when it
+        matches the user document the page read.
+
+        Returns:
+            dict: {"rows", "version", "started"}, or None when the session already has a list
+        """
+        if self.rows is not None:
+            return None
+        started = time.time()
+        version_doc = user_ref(self.user_id).get(field_paths=["expenses_version"])
+        count_reads()
+        version = (version_doc.to_dict() or {}).get("expenses_version", 0) if version_doc.exists else 0
+        return {"rows": self._stream(), "version": version, "started": started}
+
+    def expenses(self, server_version, prefetched=None):
+        """
+        All of the user's expenses, journaled ones included
+
+        Args:
+            server_version (int): expenses_version from the user document as read
+                                  by read_user(), before overlay()
+            prefetched (dict): What prefetch() returned for this run, if anything
+
+        Returns:
+            list: Expense dicts with the LIST_FIELDS of written expenses (get_expense
+                  reads the rest); ones not yet written are complete and have `pending` set
+        """
+        self.resume()
+        with self.lock:
+            # Writes that landed since the read each bumped the version once; more means someone else wrote
+            current = False
+            if self.rows is not None:
+                expected = self.version + self.journal.done_since(self.loaded_at)
+                current = expected <= server_version <= expected + self.journal.in_flight()
+            if not current and not self.offline:
+                started = time.time()
+                try:
+                    # A list read at another version may miss a write the user document counts
+                    if prefetched is not None and prefetched["version"] == server_version:
+                        rows, started = prefetched["rows"], prefetched["started"]
+                    else:
+                        rows = self._stream()
+                except Exception as e:
+                    print(f"Error reading expenses for {self.user_id}, using the journal copy: {str(e)}")
+                    self.offline = True
+                else:
+                    self.rows, self.version, self.loaded_at = rows, server_version, started
+                    self.journal.purge_done(before=started)
+                    # A session's first read usually finds the list the journal already has
+                    if self.journal.snapshot("expenses_version") != server_version:
+                        self.journal.save_snapshot("expenses", rows)
+                        self.journal.save_snapshot("expenses_version", server_version)
+            if self.rows is None:
+                self.rows = self.journal.snapshot("expenses", [])
+                self.version, self.loaded_at = server_version, 0
+
+            known = {row.get("id") for row in self.rows}
+            landed = [row for row in self._rows(self.journal.entries(DONE)) if row["id"] not in known]
+            for row in landed:
+                row.pop("pending")
+            return self._rows(self.journal.entries(PENDING)) + landed + self.rows
+
+    def overlay(self, user_data):
+        """The user document with the updates of every journaled expense not yet written applied"""
+        for entry in self.journal.entries(PENDING):
+            user_data = apply_updates(user_data, {**entry["user_updates"], "expenses_version": firestore.Increment(1)})
+        return user_data
+
+    def pending_changes(self):
+        """Every journaled expense not yet written, as passed to record_expense_change"""
+        return [entry["change"] for entry in self.journal.entries(PENDING)]
+
+    def enqueue(self, expense, user_updates=None, amount_in_base=None):
+        """
+        Journal an expense and write it in the background
+
+        The cached spend forecast is updated now and reverted if the write fails.
+
+        Args:
+            expense (dict): Expense document to store; created_at is set when it is written
+            user_updates (dict): User document fields to write with it, e.g.
+                                 category statistics; expenses_version is bumped separately
+            amount_in_base (float): Amount in the user's currency, if the expense is in another
+
+        Returns:
+            dict: The expense as shown until the write lands
+        """
+        key = expenses_ref(self.user_id).document().id
+        stored = {name: value for name, value in expense.items() if name != "created_at"}
+        change = {**stored, "id": key, "amount": expense.get("amount", 0) if amount_in_base is None else amount_in_base}
+        self.journal.append(key, stored, user_updates or {}, change)
+        record_expense_change(self.user_id, change)
+        self.resume()
+        return {**stored, "id": key, "pending": True}
+
+    def resume(self):
+        """Start a background replay if journaled expenses are waiting and none is running"""
+        with self.lock:
+            start = not self.flushing and self.journal.claimable() > 0
+            if start:
+                self.flushing = True
+        if start:
+            submit_task("expense_flush", self.flush, unique=False)
+
+    def forget(self, expense_id):
+        """Drop an expense deleted by this session, whose delete bumped expenses_version"""
+        with self.lock:
+            if self.rows is not None:
+                self.rows = [row for row in self.rows if row.get("id") != expense_id]
+                self.version += 1
+
+    def amend(self, expense_id, fields, bumps=1):
+        """
+        Apply an edit made by this session to the snapshot
+
+        Args:
+            expense_id (str): Expense id
+            fields (dict): Changed fields
+            bumps (int): How much the edit incremented expenses_version
+        """
+        with self.lock:
+            if self.rows is not None:
+                self.rows = [{**row, **fields} if row.get("id") == expense_id else row for row in self.rows]
+                self.version += bumps
+
+    def pop_failures(self):
+        """Expenses whose writes were given up on since the last call"""
+        return [{**entry["expense"], "error": entry["error"]} for entry in self.journal.pop_failed()]
+
+    def flush(self):
+        """Replay journaled expenses until none are left or Firestore stays unreachable; runs on the task executor"""
+        outage_retries = 0
+        try:
+            while True:
+                entries = self.journal.claim(FLUSH_BATCH_SIZE)
+                if not entries:
+                    return
+                try:
+                    self._write(entries)
+                    outage_retries = 0
+                except TRANSIENT_ERRORS as e:
+                    self.journal.release([entry["key"] for entry in entries], str(e))
+                    outage_retries += 1
+                    if outage_retries >= MAX_OUTAGE_RETRIES:
+                        print(f"Firestore unreachable, {len(entries)}+ expenses left in the journal: {str(e)}")
+                        return
+                    time.sleep(min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (outage_retries - 1)))
+                except Exception as e:
+                    attempts = entries[0]["attempts"] + 1
+                    if attempts < MAX_ATTEMPTS:
+                        print(f"Error writing {len(entries)} expenses, retrying: {str(e)}")
+                        self.journal.release([entry["key"] for entry in entries], str(e))
+                        time.sleep(RETRY_DELAY * 2 ** (attempts - 1))
+                    else:
+                        self._give_up(entries, e)
+        finally:
+            with self.lock:
+                self.flushing = False
+
+    def _write(self, entries):
+        """Commit one batch of journal entries, skipping any an earlier attempt already wrote"""
+        refs = {entry["key"]: expenses_ref(self.user_id).document(entry["key"]) for entry in entries}
+        # Claimed before means an earlier worker may have committed it, even without recording a failure
+        retried = [refs[entry["key"]] for entry in entries if entry["claims"] > 1]
+        if retried:
+            written = [snapshot.id for snapshot in db.get_all(retried) if snapshot.exists]
+            if written:
+                self.journal.mark_done(written)
+                entries = [entry for entry in entries if entry["key"] not in written]
+                if not entries:
+                    return
+
+        batch = db.batch()
+        for entry in entries:
+            batch.set(refs[entry["key"]], {**entry["expense"], "created_at": firestore.SERVER_TIMESTAMP})
+        bump_expenses_version(self.user_id, merge_updates(entry["user_updates"] for entry in entries),
+                              batch=batch, count=len(entries))
+        batch.commit()
+        self.journal.mark_done([entry["key"] for entry in entries])
+
+    def _give_up(self, entries, error):
+        """Move expenses that could not be written out of the journal's queue and undo their forecast change"""
+        print(f"Giving up on {len(entries)} expenses: {str(error)}")
+        self.journal.mark_failed([entry["key"] for entry in entries], str(error))
+        for entry in entries:
+            record_expense_change(self.user_id, entry["change"], removed=True)
+
+
+def get_expense_queue(user_id):
+    """This session's expense queue for a user"""
+    if "expense_queues" not in st.session_state:
+        st.session_state.expense_queues = {}
+    queues = st.session_state.expense_queues
+    if user_id not in queues:
+        queues[user_id] = ExpenseQueue(user_id)
+    return queues[user_id]
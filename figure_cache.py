@@ -0,0 +1,140 @@
+"""
+Process-wide cache of Plotly figures, keyed by their input data and chart parameters.
+
+Building a figure with plotly.express and serializing it takes tens of
+milliseconds, and the pages build the same charts from unchanged data on
+most reruns. cached_figure() hashes the input data frame together with
+the chart's name and parameters, and keeps the built figure:
+
+    fig = cached_figure("budget_pie", budget_df, build_budget_pie, hole=0.5)
+
+The builder must depend only on the data frame and the parameters, since
+those are all the key covers. A hit hands out the cached Figure object
+itself, with no rebuilding or validation; st.plotly_chart only reads it.
+The same object goes to every session, so callers must not change it
+(update_layout and the like) after it comes out of the cache.
+
+Each figure's size is taken as the length of its JSON when it is cached.
+Entries are evicted least recently used first once their total size
+passes FIGURE_CACHE_BYTES. metrics() reports hits, misses and the size
+held.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from cache import TierStats
+
+FIGURE_CACHE_BYTES = int(os.getenv("FIGURE_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+_CACHE = None
+_LOCK = threading.Lock()
+
+
+def frame_hash(frame):
+    """Content hash of a data frame: its values, index, column names and dtypes"""
+    digest = hashlib.sha1()
+    digest.update(repr([(str(column), str(dtype)) for column, dtype in frame.dtypes.items()]).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(frame, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+def figure_key(name, frame, params):
+    """Cache key for a chart name, its input data and its parameters"""
+    text = f"{name}|{frame_hash(frame)}|{sorted(params.items())!r}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class FigureCache:
+    """
+    LRU of figures, bounded by the total size of their JSON
+
+    Args:
+        max_bytes (int): Size of figure JSON kept before the least recently used is dropped
+    """
+
+    def __init__(self, max_bytes=FIGURE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats = TierStats()
+
+    def get(self, key):
+        """The cached figure, or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats.add(misses=1)
+                return None
+            self.entries.move_to_end(key)
+            self.stats.add(hits=1)
+            return entry[0]
+
+    def set(self, key, figure, size):
+        """
+        Keep a figure
+
+        Args:
+            figure: The figure
+            size (int): Length of its JSON
+        """
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            # A figure bigger than the whole cache is not kept
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (figure, size)
+            self.size += size
+            self.stats.add(writes=1)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def metrics(self):
+        """Hits, misses, hit ratio, entries and bytes held"""
+        with self.lock:
+            return {**self.stats.as_dict(), "entries": len(self.entries), "bytes": self.size,
+                    "max_bytes": self.max_bytes}
+
+
+def get_figure_cache():
+    """Process-wide figure cache, created on first use"""
+    global _CACHE
+    if _CACHE is None:
+        with _LOCK:
+            if _CACHE is None:
+                _CACHE = FigureCache()
+    return _CACHE
+
+
+def cached_figure(name, frame, build, **params):
+    """
+    A figure from the cache, or built and cached on a miss
+
+    Args:
+        name (str): Chart name, so different charts of the same data don't collide
+        frame (pandas.DataFrame): The chart's input data
+        build (callable): build(frame, **params) returning a plotly Figure
+        **params: Everything else the chart depends on, e.g. titles and sizes
+
+    Returns:
+        plotly.graph_objects.Figure: The figure, shared with other sessions; don't modify it
+    """
+    cache = get_figure_cache()
+    key = figure_key(name, frame, params)
+    figure = cache.get(key)
+    if figure is not None:
+        return figure
+    figure = build(frame, **params)
+    cache.set(key, figure, len(figure.to_json()))
+    return figure
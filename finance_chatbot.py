@@ -1,9 +1,27 @@
 import os
+from datetime import date
 import google.generativeai as genai
+from budget_ai import gemini_configure_kwargs
+from cache import get_cache
+from finance_tools import ToolContext, run_tool, tool_declarations
+from prompt_builder import PromptBuilder
 
+# Token budget for each chatbot prompt, and the share of it for prior conversation
+FINANCIAL_PROMPT_TOKEN_BUDGET = 1200
+CONVERSATION_TOKEN_BUDGET = 400
 
-def setup_gemini():
-    """Setup the Gemini API"""
+# Prompt budget when the model looks data up through tools instead
+TOOL_PROMPT_TOKEN_BUDGET = 600
+
+# Maximum model turns spent on tool calls before giving up on a question
+MAX_TOOL_ROUNDS = 4
+
+# How long an answer is reused for the same prompt and data
+ANSWER_CACHE_TTL = 600
+
+
+def setup_gemini(tools=None):
+    """Setup the Gemini API, optionally with function declarations the model may call"""
     try:
         # Get API key from environment variable
         api_key = os.getenv("GEMINI_API_KEY")
@@ -23,7 +41,7 @@ def setup_gemini():
             return None
             
         # Configure the Gemini API
-        genai.configure(api_key=api_key)
+        genai.configure(api_key=api_key, **gemini_configure_kwargs())
         
         # Get available models
         models = [m for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
@@ -32,6 +50,8 @@ def setup_gemini():
             return None
             
         # Use the first suitable model (usually the most powerful one)
+        if tools:
+            return genai.GenerativeModel("gemini-1.5-pro", tools=[{"function_declarations": tools}])
         model = genai.GenerativeModel("gemini-1.5-pro")
         return model
         
@@ -39,92 +59,213 @@ def setup_gemini():
         print(f"Error setting up Gemini: {e}")
         return None
 
-def get_financial_advice_with_gemini(query, context):
+def get_financial_advice_with_gemini(query, context, memory=None):
     """Get financial advice using Gemini"""
     try:
-        model = setup_gemini()
-        
-        if not model:
-            # Fallback to rule-based responses if Gemini isn't available
-            return None
-        
         # Format the financial context for the prompt
-        prompt = create_financial_prompt(query, context)
-        
-        # Generate the response
-        response = model.generate_content(prompt)
+        conversation = memory.to_prompt(CONVERSATION_TOKEN_BUDGET) if memory else ""
+        prompt = create_financial_prompt(query, context, conversation)
         
-        if response and hasattr(response, 'text'):
-            return response.text
+        # The prompt carries all of the user's data, so it is the whole cache key
+        def generate():
+            model = setup_gemini()
+            if not model:
+                # Fallback to rule-based responses if Gemini isn't available
+                return None
+            response = model.generate_content(prompt)
+            if response and hasattr(response, 'text'):
+                return response.text
+            return None
         
-        return None
+        return get_cache().get_or_set("chat", prompt, generate, ttl=ANSWER_CACHE_TTL, cache_if=bool)
     except Exception as e:
         print(f"Error with Gemini: {e}")
         return None
 
-def create_financial_prompt(query, context):
-    """Create a prompt for Gemini based on the user's financial data"""
+def create_financial_prompt(query, context, conversation=""):
+    """Create a token-budgeted prompt for Gemini based on the user's financial data and the conversation so far"""
     # Extract key information from context
     user_name = context.get('user_name', 'User')
     income = context.get('income', 0)
     currency = context.get('currency', '$')
-    
-    # Format budget data
     budget_allocations = context.get('budget_allocations', {})
-    budget_text = ""
-    for category, amount in budget_allocations.items():
+    expenses_by_category = context.get('category_breakdown', {})
+    
+    builder = PromptBuilder("financial_chat", FINANCIAL_PROMPT_TOKEN_BUDGET)
+    
+    builder.add_section("intro", f"""You are a helpful, friendly financial assistant for a personal budgeting app called Smart Budget.
+You're speaking with {user_name} and should provide personalized advice based on their financial data.""", required=True)
+    
+    builder.add_section("overview", [
+        f"- Monthly Income: {currency} {income:,.0f}",
+        f"- Total Monthly Budget: {currency} {context.get('total_budget', 0):,.0f}",
+        f"- This Month's Expenses (so far): {currency} {context.get('monthly_expenses', 0):,.0f}",
+        f"- Last 30 Days Total Expenses: {currency} {context.get('expenses_last_30_days', 0):,.0f}",
+        f"- Top Spending Category: {context.get('top_spending_category', 'Unknown')} ({currency} {context.get('top_spending_amount', 0):,.0f})"
+    ], header="USER'S FINANCIAL DATA:", required=True)
+    
+    # Format budget data, largest allocations first so condensing keeps them
+    budget_items = sorted(budget_allocations.items(), key=lambda x: x[1], reverse=True)
+    budget_lines = []
+    for category, amount in budget_items:
         percentage = (amount / income * 100) if income > 0 else 0
-        budget_text += f"- {category}: {currency} {amount:,.0f} ({percentage:.1f}% of income)\n"
+        budget_lines.append(f"- {category}: {currency} {amount:,.0f} ({percentage:.1f}% of income)")
     
-    # Format expense data
-    expenses_by_category = context.get('category_breakdown', {})
-    expense_text = ""
-    for category, amount in expenses_by_category.items():
+    def budget_overflow(omitted):
+        total = sum(budget_items[i][1] for i in omitted)
+        return f"- {len(omitted)} other categories: {currency} {total:,.0f} combined"
+    
+    builder.add_section(
+        "budget",
+        budget_lines or ["No budget allocations set"],
+        header="BUDGET ALLOCATIONS:",
+        keywords=["budget", "allocation", "allocated", "split", "breakdown", "remaining", "left", "limit"],
+        priority=2,
+        overflow=budget_overflow
+    )
+    
+    # Format expense data, biggest spending first
+    expense_items = sorted(expenses_by_category.items(), key=lambda x: x[1], reverse=True)
+    expense_lines = []
+    for category, amount in expense_items:
         budget_for_cat = budget_allocations.get(category, 0)
         if budget_for_cat > 0:
             percentage = (amount / budget_for_cat * 100)
-            expense_text += f"- {category}: {currency} {amount:,.0f} spent ({percentage:.1f}% of category budget)\n"
+            expense_lines.append(f"- {category}: {currency} {amount:,.0f} spent ({percentage:.1f}% of category budget)")
         else:
-            expense_text += f"- {category}: {currency} {amount:,.0f} spent (no budget set)\n"
+            expense_lines.append(f"- {category}: {currency} {amount:,.0f} spent (no budget set)")
+    
+    def expense_overflow(omitted):
+        total = sum(expense_items[i][1] for i in omitted)
+        return f"- {len(omitted)} other categories: {currency} {total:,.0f} spent combined"
+    
+    builder.add_section(
+        "spending",
+        expense_lines or ["No expenses recorded"],
+        header="CURRENT MONTH SPENDING BY CATEGORY:",
+        keywords=["spent", "spend", "spending", "expense", "expenses", "category", "most", "top", "over"],
+        priority=3,
+        overflow=expense_overflow
+    )
     
     # Format savings goal
-    savings_text = ""
     if context.get('has_savings_goal'):
-        savings_text = f"""
-Savings Goal: {context.get('savings_goal_item', 'Goal')}
-Total Cost: {currency} {context.get('savings_goal_amount', 0):,.0f}
-Current Progress: {currency} {context.get('savings_goal_current', 0):,.0f} ({context.get('savings_goal_progress', 0):.1f}% complete)
-"""
-
-    # Build the prompt
-    prompt = f"""You are a helpful, friendly financial assistant for a personal budgeting app called Smart Budget.
-You're speaking with {user_name} and should provide personalized advice based on their financial data.
+        builder.add_section("savings_goal", [
+            f"Savings Goal: {context.get('savings_goal_item', 'Goal')}",
+            f"Total Cost: {currency} {context.get('savings_goal_amount', 0):,.0f}",
+            f"Current Progress: {currency} {context.get('savings_goal_current', 0):,.0f} ({context.get('savings_goal_progress', 0):.1f}% complete)"
+        ], keywords=["save", "saving", "savings", "goal", "target", "progress"], priority=1)
+    
+    # Prior conversation so follow-up questions keep their context
+    if conversation:
+        builder.add_section("conversation", conversation, header="CONVERSATION SO FAR:", priority=4)
+    
+    builder.add_section("question", f"""User's Question: {query}
 
-USER'S FINANCIAL DATA:
-- Monthly Income: {currency} {income:,.0f}
-- Total Monthly Budget: {currency} {context.get('total_budget', 0):,.0f}
-- This Month's Expenses (so far): {currency} {context.get('monthly_expenses', 0):,.0f}
-- Last 30 Days Total Expenses: {currency} {context.get('expenses_last_30_days', 0):,.0f}
-- Top Spending Category: {context.get('top_spending_category', 'Unknown')} ({currency} {context.get('top_spending_amount', 0):,.0f})
+Respond concisely as a helpful financial assistant. Provide specific advice based on their financial situation, but keep answers brief and actionable. If the question isn't about their finances, politely steer them back to financial topics.""", required=True)
+    
+    return builder.build(query)
 
-BUDGET ALLOCATIONS:
-{budget_text or "No budget allocations set"}
+def create_tool_prompt(query, profile, conversation=""):
+    """Create a small prompt for tool mode; figures are fetched by the model through tools"""
+    builder = PromptBuilder("financial_chat_tools", TOOL_PROMPT_TOKEN_BUDGET)
+    
+    builder.add_section("intro", f"""You are a helpful, friendly financial assistant for a personal budgeting app called Smart Budget.
+You're speaking with {profile.get('name', 'User')}. Their currency is {profile.get('currency', '₹ INR')} and today is {date.today().isoformat()}.
+Use the available tools to look up any figures you need. Never guess amounts; if a tool returns an error, say the data is unavailable.""", required=True)
+    
+    if conversation:
+        builder.add_section("conversation", conversation, header="CONVERSATION SO FAR:", priority=4)
+    
+    builder.add_section("question", f"""User's Question: {query}
 
-CURRENT MONTH SPENDING BY CATEGORY:
-{expense_text or "No expenses recorded"}
+Respond concisely with specific, actionable advice. If the question isn't about their finances, politely steer them back to financial topics.""", required=True)
+    
+    return builder.build(query)
 
-{savings_text}
+def _function_calls(response):
+    """Function call parts of a Gemini response"""
+    try:
+        parts = response.candidates[0].content.parts
+    except (AttributeError, IndexError):
+        return []
+    return [part.function_call for part in parts if part.function_call and part.function_call.name]
 
-User's Question: {query}
+def get_financial_advice_with_tools(query, user_id, profile, memory=None):
+    """
+    Get financial advice using Gemini, letting it fetch aggregates through tools
+    
+    Args:
+        query (str): User's question
+        user_id (str): User whose data the tools read
+        profile (dict): User document, reused by the tools to avoid another read
+        memory (ConversationMemory): Conversation so far
+    
+    Returns:
+        str: Answer, or None if Gemini is unavailable or didn't finish
+    """
+    try:
+        conversation = memory.to_prompt(CONVERSATION_TOKEN_BUDGET) if memory else ""
+        prompt = create_tool_prompt(query, profile, conversation)
+        
+        # Tools read live data, so answers are only reused while the expenses and profile are unchanged
+        cache_key = (user_id, prompt, sorted((key, repr(value)) for key, value in profile.items()))
+        found, answer = get_cache().get("chat_tools", cache_key, version=profile.get("expenses_version", 0))
+        if found:
+            return answer
+        
+        model = setup_gemini(tools=tool_declarations())
+        
+        if not model:
+            return None
+        
+        chat = model.start_chat()
+        response = chat.send_message(prompt)
+        context = ToolContext(user_id, profile)
+        
+        for _ in range(MAX_TOOL_ROUNDS):
+            calls = _function_calls(response)
+            if not calls:
+                if not response.text:
+                    return None
+                get_cache().set("chat_tools", cache_key, response.text, ttl=ANSWER_CACHE_TTL,
+                                version=profile.get("expenses_version", 0))
+                return response.text
+            
+            replies = []
+            for call in calls:
+                result = run_tool(call.name, dict(call.args), context)
+                replies.append(genai.protos.Part(function_response=genai.protos.FunctionResponse(
+                    name=call.name,
+                    response={"result": result}
+                )))
+            response = chat.send_message(replies)
+        
+        # Still asking for data after MAX_TOOL_ROUNDS; let the caller fall back
+        return None
+    except Exception as e:
+        print(f"Error with Gemini tools: {e}")
+        return None
 
-Respond concisely as a helpful financial assistant. Provide specific advice based on their financial situation, but keep answers brief and actionable. If the question isn't about their finances, politely steer them back to financial topics.
-"""
-    return prompt
+def process_query_with_tools(query, user_id, profile, context_loader, memory=None):
+    """
+    Answer with tool calling, falling back to the precomputed-context path
+    
+    Args:
+        context_loader (callable): Builds the full financial context; only
+                                   called if the tool path fails
+    """
+    response = get_financial_advice_with_tools(query, user_id, profile, memory)
+    
+    if response:
+        return response
+    
+    return process_query_with_gemini(query, context_loader(), memory)
 
-def process_query_with_gemini(query, financial_context):
+def process_query_with_gemini(query, financial_context, memory=None):
     """Process user query with Gemini, falling back to rule-based responses if needed"""
     # First try with Gemini
-    gemini_response = get_financial_advice_with_gemini(query, financial_context)
+    gemini_response = get_financial_advice_with_gemini(query, financial_context, memory)
     
     if gemini_response:
         return gemini_response
@@ -0,0 +1,251 @@
+"""
+Tools the financial assistant can call to fetch aggregates on demand.
+
+Instead of precomputing every total before each question, Gemini is given
+the declarations below and asks for exactly the data it needs. Each tool is
+backed by a bounded query in data_layer, so questions about arbitrary
+periods never load the whole expense history.
+"""
+from datetime import date, datetime, timedelta
+
+from category_registry import canonical_amounts
+from data_layer import FRAME_FIELDS, TOTAL_FIELDS, get_user_data, query_expenses, sum_by_category
+from money import DEFAULT_CURRENCY, base_amount, minor_per_unit, stored_allocations
+from savings_goals import DEFAULT_STRATEGY, STRATEGIES, load_goals, monthly_savings_budget, schedule_contributions
+
+# name -> {"function": callable, "declaration": dict}
+TOOLS = {}
+
+# Hard cap on rows a single tool call may pull back
+MAX_TOOL_ROWS = 2000
+
+
+def register_tool(name, description, parameters=None):
+    """
+    Register a function as a tool Gemini can call
+
+    The function is called as fn(context, **args), where context is a
+    ToolContext for the current user.
+
+    Args:
+        name (str): Tool name exposed to the model
+        description (str): What the tool returns and when to use it
+        parameters (dict): Properties of the OBJECT schema for the arguments
+    """
+    def decorator(fn):
+        declaration = {"name": name, "description": description}
+        if parameters:
+            declaration["parameters"] = {"type": "OBJECT", "properties": parameters}
+        TOOLS[name] = {"function": fn, "declaration": declaration}
+        return fn
+    return decorator
+
+
+def tool_declarations():
+    """Function declarations for every registered tool"""
+    return [tool["declaration"] for tool in TOOLS.values()]
+
+
+class ToolContext:
+    """Per-question state shared by tool calls, so the user doc is read at most once"""
+
+    def __init__(self, user_id, user_data=None):
+        self.user_id = user_id
+        self._user_data = user_data
+
+    @property
+    def user_data(self):
+        if self._user_data is None:
+            self._user_data = get_user_data(self.user_id, cached=True)
+        return self._user_data
+
+    @property
+    def expenses_version(self):
+        return self.user_data.get("expenses_version", 0)
+
+
+def run_tool(name, args, context):
+    """
+    Execute a tool call requested by the model
+
+    Returns:
+        dict: Tool result, or {"error": ...} if the call failed
+    """
+    tool = TOOLS.get(name)
+    if tool is None:
+        return {"error": f"Unknown tool: {name}"}
+    try:
+        return tool["function"](context, **dict(args or {}))
+    except Exception as e:
+        print(f"Error running tool {name}: {e}")
+        return {"error": str(e)}
+
+
+def _parse_date(value, default):
+    """Parse a YYYY-MM-DD string, falling back to default"""
+    if not value:
+        return default
+    try:
+        return datetime.fromisoformat(str(value)).date()
+    except ValueError:
+        return default
+
+
+def _month_bounds(month):
+    """First day of the month and first day of the next month for 'YYYY-MM'"""
+    today = date.today()
+    try:
+        year, month_number = (int(part) for part in str(month).split("-")[:2])
+        start = date(year, month_number, 1)
+    except (TypeError, ValueError):
+        start = date(today.year, today.month, 1)
+    end = date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+    return start, end
+
+
+def _round_totals(totals):
+    return {category: round(amount, 2) for category, amount in totals.items()}
+
+
+@register_tool(
+    "spend_by_category",
+    "Total spending per category between two dates. Use for questions about any period, e.g. last week, "
+    "March, or the last 90 days.",
+    {
+        "start_date": {"type": "STRING", "description": "Inclusive start date, YYYY-MM-DD. Defaults to 30 days ago."},
+        "end_date": {"type": "STRING", "description": "Inclusive end date, YYYY-MM-DD. Defaults to today."},
+        "category": {"type": "STRING", "description": "Optional category name to restrict to."}
+    }
+)
+def spend_by_category(context, start_date=None, end_date=None, category=None):
+    today = date.today()
+    end = _parse_date(end_date, today)
+    start = _parse_date(start_date, end - timedelta(days=30))
+
+    expenses = query_expenses(context.user_id, start, end + timedelta(days=1), category=category, limit=MAX_TOOL_ROWS,
+                              version=context.expenses_version, fields=TOTAL_FIELDS)
+    totals = sum_by_category(expenses, context.user_data.get("currency"))
+    return {
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "currency": context.user_data.get("currency", "₹ INR"),
+        "transaction_count": len(expenses),
+        "total": round(sum(totals.values()), 2),
+        "by_category": _round_totals(totals),
+        "truncated": len(expenses) >= MAX_TOOL_ROWS
+    }
+
+
+@register_tool(
+    "remaining_budget",
+    "Budget, spending and remaining amount per category for a calendar month.",
+    {
+        "month": {"type": "STRING", "description": "Month as YYYY-MM. Defaults to the current month."}
+    }
+)
+def remaining_budget(context, month=None):
+    start, end = _month_bounds(month)
+    allocations = canonical_amounts(stored_allocations(context.user_data))
+    spent = sum_by_category(query_expenses(context.user_id, start, end, limit=MAX_TOOL_ROWS,
+                                           version=context.expenses_version, fields=TOTAL_FIELDS),
+                            context.user_data.get("currency"))
+
+    categories = {}
+    for category in set(allocations) | set(spent):
+        budget = allocations.get(category, 0)
+        categories[category] = {
+            "budget": round(budget, 2),
+            "spent": round(spent.get(category, 0), 2),
+            "remaining": round(budget - spent.get(category, 0), 2)
+        }
+
+    total_budget = sum(allocations.values())
+    total_spent = sum(spent.values())
+    return {
+        "month": start.strftime("%Y-%m"),
+        "currency": context.user_data.get("currency", "₹ INR"),
+        "total_budget": round(total_budget, 2),
+        "total_spent": round(total_spent, 2),
+        "total_remaining": round(total_budget - total_spent, 2),
+        "categories": categories
+    }
+
+
+@register_tool(
+    "goal_progress",
+    "Progress toward each of the user's savings goals, in priority order: target, amount saved, deadline, "
+    "required monthly saving and this month's planned contribution."
+)
+def goal_progress(context):
+    goals = load_goals(context.user_id, context.user_data)
+    if not goals:
+        return {"has_goal": False}
+
+    currency = context.user_data.get("currency")
+    strategy = context.user_data.get("goal_strategy", DEFAULT_STRATEGY)
+    plan = schedule_contributions(goals, monthly_savings_budget(context.user_data), strategy,
+                                  minor_per_unit=minor_per_unit(currency))
+    results = []
+    for goal in goals:
+        result = {
+            "item": goal.get("item", "Goal"),
+            "priority": goal.get("priority", 1),
+            "total_cost": goal.get("total_cost", 0),
+            "current_savings": round(goal["saved"], 2),
+            "progress_percent": round(goal["progress"] * 100, 1),
+            "target_date": goal.get("target_date"),
+            "planned_this_month": plan.get(goal["id"], 0)
+        }
+        target = _parse_date(goal.get("target_date"), None)
+        if target:
+            months_left = max(1, round((target - date.today()).days / 30))
+            result["months_left"] = months_left
+            result["needed_per_month"] = round(goal["remaining"] / months_left, 2)
+        results.append(result)
+    return {
+        "has_goal": True,
+        "currency": context.user_data.get("currency", "₹ INR"),
+        "strategy": STRATEGIES.get(strategy, strategy),
+        "unallocated_savings": plan.get(None, 0),
+        "goals": results
+    }
+
+
+@register_tool(
+    "budget_allocations",
+    "The user's monthly income and budget allocation per category."
+)
+def budget_allocations(context):
+    allocations = canonical_amounts(stored_allocations(context.user_data))
+    return {
+        "income": context.user_data.get("income", 0),
+        "currency": context.user_data.get("currency", "₹ INR"),
+        "total_budget": round(sum(allocations.values()), 2),
+        "allocations": _round_totals(allocations)
+    }
+
+
+@register_tool(
+    "recent_transactions",
+    "The most recent individual expenses, newest first.",
+    {
+        "limit": {"type": "INTEGER", "description": "Number of transactions, at most 50. Defaults to 10."},
+        "category": {"type": "STRING", "description": "Optional category name to restrict to."}
+    }
+)
+def recent_transactions(context, limit=10, category=None):
+    limit = max(1, min(50, int(limit or 10)))
+    expenses = query_expenses(context.user_id, category=category, limit=limit, newest_first=True,
+                              version=context.expenses_version, fields=FRAME_FIELDS)
+    return {
+        "transactions": [
+            {
+                "date": expense.get("date"),
+                "category": expense.get("category"),
+                "amount": base_amount(expense, context.user_data.get("currency", DEFAULT_CURRENCY)),
+                "recorded_as": f'{expense["currency"]} {expense.get("amount", 0)}' if expense.get("currency") else None,
+                "notes": expense.get("notes", "")
+            }
+            for expense in expenses
+        ]
+    }
@@ -0,0 +1,125 @@
+"""
+Fragment-scoped reruns for the pages, with rerun timing and read metrics.
+
+Streamlit reruns the whole script for every widget interaction. Pages
+split their interactive parts into fragments instead:
+
+    @page_fragment("transactions.table")
+    def transactions_table(expenses):
+        ...  # a filter change reruns only this function
+
+A widget inside a fragment reruns just that fragment, with the arguments
+it was last called with, so the page's Firestore reads and other sections
+are skipped. Anything that changes data the rest of the page shows calls
+st.rerun() for a full rerun. Streamlit versions without fragments run
+the functions as part of the page.
+
+Fragments work from explicit data slices: data_slice() keeps a value
+derived from the page's data (totals, chart figures, ...) in the session
+and recomputes it only when its key, such as the user's expenses_version,
+changes.
+
+Every page run and fragment run is timed together with the Firestore
+documents it read (data_layer.track_reads). rerun_metrics() summarizes
+them per name, and the sidebar shows them when SHOW_RERUN_METRICS is set.
+"""
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+from data_layer import track_reads
+
+SHOW_RERUN_METRICS = os.getenv("SHOW_RERUN_METRICS", "") not in ("", "0", "false")
+
+# st.fragment, or its experimental name on Streamlit 1.33-1.36; None on versions without fragments
+FRAGMENT = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+_STATS = {}
+_LOCK = threading.Lock()
+
+
+@contextmanager
+def timed(name):
+    """
+    Time a page or fragment run and count its Firestore reads under a name
+
+    Args:
+        name (str or callable): Metrics name, or a function returning it when
+                                the run ends, for a name the run itself decides
+    """
+    started = time.perf_counter()
+    with track_reads() as reads:
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            if callable(name):
+                name = name()
+            with _LOCK:
+                stats = _STATS.setdefault(name, {"runs": 0, "seconds": 0.0, "reads": 0})
+                stats["runs"] += 1
+                stats["seconds"] += elapsed
+                stats["reads"] += reads[0]
+
+
+def page_fragment(name):
+    """
+    Decorator running a function as an st.fragment, timed under a name
+
+    Args:
+        name (str): Metrics name, e.g. "dashboard.add_expense"
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with timed(name):
+                return fn(*args, **kwargs)
+        return FRAGMENT(run) if FRAGMENT else run
+    return decorate
+
+
+def data_slice(name, key, compute):
+    """
+    A value derived from page data, kept in the session until its key changes
+
+    Args:
+        name (str): Slice name
+        key: Hashable key the value depends on, e.g. (expenses_version, currency);
+             None when it isn't known, and the value is computed without being kept
+        compute (callable): Builds the value when the key has changed
+
+    Returns:
+        The kept or newly computed value
+    """
+    if key is None:
+        return compute()
+    if "data_slices" not in st.session_state:
+        st.session_state.data_slices = {}
+    slices = st.session_state.data_slices
+    kept = slices.get(name)
+    if kept is None or kept[0] != key:
+        kept = (key, compute())
+        slices[name] = kept
+    return kept[1]
+
+
+def rerun_metrics():
+    """
+    Runs, mean duration and mean Firestore reads per page and fragment
+
+    Returns:
+        dict: name -> {"runs", "avg_ms", "avg_reads"}
+    """
+    with _LOCK:
+        return {
+            name: {
+                "runs": stats["runs"],
+                "avg_ms": stats["seconds"] * 1000 / stats["runs"],
+                "avg_reads": stats["reads"] / stats["runs"]
+            }
+            for name, stats in sorted(_STATS.items())
+        }
@@ -0,0 +1,101 @@
+"""
+Foreign exchange rates from a local rate table.
+
+Rates are read once per process from a CSV file (FX_RATES_FILE, default
+fx_rates.csv next to this module) with one row per date and currency:
+
+    date,currency,per_usd
+    2026-10-01,INR,88.7
+
+`per_usd` is the units of the currency one US dollar buys, so any pair
+converts through the dollar. A date uses the latest rate on or before it
+(the earliest rate for older dates). Single-day lookups are memoized, and
+whole arrays of dates are converted with one searchsorted per currency.
+"""
+import csv
+import os
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+FX_RATES_FILE = os.getenv("FX_RATES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fx_rates.csv"))
+
+_TABLE = None
+_LOCK = threading.Lock()
+
+
+class FXTable:
+    """
+    Per-currency rate histories
+
+    Args:
+        rows (list): (date, currency, per_usd) tuples
+    """
+
+    def __init__(self, rows):
+        history = {"USD": {}}
+        for day, currency, per_usd in rows:
+            history.setdefault(currency.strip().upper(), {})[str(day)[:10]] = float(per_usd)
+
+        self.dates = {}
+        self.per_usd = {}
+        for currency, rates in history.items():
+            if currency == "USD" and not rates:
+                rates = {"1970-01-01": 1.0}
+            days = sorted(rates)
+            self.dates[currency] = np.array(days, dtype="datetime64[D]")
+            self.per_usd[currency] = np.array([rates[day] for day in days])
+
+    @classmethod
+    def load(cls, path=FX_RATES_FILE):
+        """Table from a CSV file; empty (dollar only) if the file is missing"""
+        if not os.path.exists(path):
+            print(f"FX rate table {path} not found; only same-currency amounts can be converted")
+            return cls([])
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            return cls([(row["date"], row["currency"], row["per_usd"]) for row in reader if row.get("per_usd")])
+
+    @property
+    def currencies(self):
+        return sorted(self.per_usd)
+
+    def rates(self, currency, dates):
+        """
+        Units of currency per dollar on each date
+
+        Args:
+            currency (str): ISO currency code
+            dates (np.ndarray): datetime64[D] dates
+
+        Returns:
+            np.ndarray: Rates, one per date
+        """
+        if currency not in self.per_usd:
+            raise KeyError(f"No FX rates for {currency}")
+        index = np.searchsorted(self.dates[currency], dates, side="right") - 1
+        return self.per_usd[currency][np.clip(index, 0, None)]
+
+    def factors(self, source, target, dates):
+        """Multipliers converting amounts in source to target on each date"""
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        if source == target:
+            return np.ones(len(dates))
+        return self.rates(target, dates) / self.rates(source, dates)
+
+
+def get_fx_table():
+    """Process-wide rate table, loaded on first use"""
+    global _TABLE
+    if _TABLE is None:
+        with _LOCK:
+            if _TABLE is None:
+                _TABLE = FXTable.load()
+    return _TABLE
+
+
+@lru_cache(maxsize=4096)
+def daily_rate(source, target, day_iso):
+    """Multiplier converting source to target on one day, memoized"""
+    return float(get_fx_table().factors(source, target, np.array([day_iso[:10]], dtype="datetime64[D]"))[0])
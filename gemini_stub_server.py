@@ -0,0 +1,402 @@
+"""
+Local stand-in for the Gemini REST API.
+
+Implements the endpoints the app talks to (generateContent, streamGenerateContent
+and the model listing used by setup_gemini) with configurable latency, error,
+rate limit and malformed JSON behaviour, so the AI code paths can be load tested
+without using real quota.
+
+Usage:
+    python gemini_stub_server.py --port 8765 --latency lognormal:800:0.4 --error-rate 0.02
+    GEMINI_API_BASE=http://127.0.0.1:8765 GEMINI_API_KEY=stub streamlit run main.py
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+BUDGET_CATEGORIES_MARKER = "Allocate the monthly income ONLY across these specific user-selected categories:"
+
+MODEL_ROUTE = re.compile(r"^/(?P<version>v1(?:beta)?)/models/(?P<model>[^/:]+):(?P<method>\w+)$")
+LIST_MODELS_ROUTE = re.compile(r"^/(?P<version>v1(?:beta)?)/models/?$")
+
+CHAT_REPLIES = [
+    "Based on your spending so far, you're on track this month. Keep an eye on discretionary categories.",
+    "Your top spending category is taking a large share of your budget. Try setting a weekly cap for it.",
+    "You could move part of your remaining budget into savings to reach your goal sooner.",
+    "Consider reviewing your subscriptions, small recurring charges add up over a year.",
+]
+
+
+def parse_latency_spec(spec):
+    """
+    Build a latency sampler from a spec string
+
+    Supported specs (all values in milliseconds):
+        fixed:MS
+        uniform:LOW:HIGH
+        normal:MEAN:STDDEV
+        lognormal:MEDIAN:SIGMA
+        exponential:MEAN
+
+    Returns:
+        callable: Function returning a latency in seconds
+    """
+    parts = spec.split(":")
+    kind = parts[0]
+    values = [float(v) for v in parts[1:]]
+
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0] / 1000
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "normal" and len(values) == 2:
+        return lambda: max(0.0, random.gauss(values[0], values[1])) / 1000
+    if kind == "lognormal" and len(values) == 2:
+        import math
+        mu = math.log(max(values[0], 1e-3))
+        return lambda: random.lognormvariate(mu, values[1]) / 1000
+    if kind == "exponential" and len(values) == 1:
+        return lambda: random.expovariate(1 / max(values[0], 1e-3)) / 1000
+
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+class StubConfig:
+    """Behaviour knobs for the stub server"""
+
+    def __init__(self, latency="fixed:0", error_rate=0.0, rate_limit_rate=0.0,
+                 malformed_rate=0.0, stream_chunks=4, seed=None):
+        self.latency_spec = latency
+        self.sample_latency = parse_latency_spec(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.stream_chunks = max(1, stream_chunks)
+        if seed is not None:
+            random.seed(seed)
+
+
+class StubStats:
+    """Thread-safe counters of what the stub served"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def incr(self, key):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+def extract_prompt_text(payload):
+    """Return the text of the last user turn in a generateContent payload"""
+    contents = payload.get("contents", [])
+    for content in reversed(contents):
+        if content.get("role", "user") == "user":
+            return "".join(part.get("text", "") for part in content.get("parts", []))
+    return ""
+
+
+def build_budget_reply(prompt):
+    """Create a plausible budget recommendation JSON for a budget prompt"""
+    marker_index = prompt.find(BUDGET_CATEGORIES_MARKER)
+    category_line = prompt[marker_index + len(BUDGET_CATEGORIES_MARKER):].strip().split("\n", 1)[0]
+    categories = [c.strip() for c in category_line.split(",") if c.strip()] or ["Essentials"]
+
+    income_match = re.search(r"Monthly income: \S+ ([\d,\.]+)", prompt)
+    income = float(income_match.group(1).replace(",", "")) if income_match else 0
+
+    weights = [random.uniform(0.5, 1.5) for _ in categories]
+    total_weight = sum(weights)
+
+    allocations = {}
+    explanations = {}
+    tips = {}
+    for category, weight in zip(categories, weights):
+        percentage = round(weight / total_weight * 100, 1)
+        allocations[category] = {"percentage": percentage, "amount": round(income * percentage / 100, 2)}
+        explanations[category] = f"Stub explanation for {category}."
+        tips[category] = [f"Stub tip for {category}", "Review this category monthly"]
+
+    return {
+        "allocations": allocations,
+        "explanations": explanations,
+        "tips": tips,
+        "savings_plan": {
+            "item": "",
+            "total_cost": 0,
+            "monthly_amount": 0,
+            "timeline_months": 0,
+            "percentage_of_income": 0,
+            "is_realistic": True,
+            "recommendation": ""
+        },
+        "summary": "Stub budget summary."
+    }
+
+
+def build_reply_text(payload):
+    """Return the text the stub model answers with"""
+    prompt = extract_prompt_text(payload)
+    if BUDGET_CATEGORIES_MARKER in prompt:
+        generation_config = payload.get("generationConfig", {})
+        if generation_config.get("responseMimeType") == "application/json":
+            # Structured output: bare JSON, no markdown fences
+            return json.dumps(build_budget_reply(prompt))
+        return "```json\n" + json.dumps(build_budget_reply(prompt), indent=2) + "\n```"
+    return random.choice(CHAT_REPLIES)
+
+
+def build_function_call(payload):
+    """
+    Return a functionCall part if the request declares tools and has not yet
+    answered one, so the chatbot's tool loop is exercised
+    """
+    declarations = [
+        declaration
+        for tool in payload.get("tools", [])
+        for declaration in tool.get("functionDeclarations", tool.get("function_declarations", []))
+    ]
+    if not declarations:
+        return None
+    contents = payload.get("contents", [])
+    if contents and any("functionResponse" in part for part in contents[-1].get("parts", [])):
+        return None
+    return {"functionCall": {"name": random.choice(declarations)["name"], "args": {}}}
+
+
+def build_response(text, finish_reason="STOP"):
+    """Wrap text in a generateContent response body"""
+    return {
+        "candidates": [
+            {
+                "content": {"role": "model", "parts": [{"text": text}]},
+                "finishReason": finish_reason,
+                "index": 0
+            }
+        ],
+        "usageMetadata": {
+            "promptTokenCount": 0,
+            "candidatesTokenCount": max(1, len(text) // 4),
+            "totalTokenCount": max(1, len(text) // 4)
+        }
+    }
+
+
+def split_text(text, chunks):
+    """Split text into roughly equal chunks for streaming"""
+    size = max(1, -(-len(text) // chunks))
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+class GeminiStubHandler(BaseHTTPRequestHandler):
+    """Request handler implementing the Gemini REST surface used by the app"""
+
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+    stats = StubStats()
+
+    def log_message(self, format, *args):
+        # Keep the console quiet under load
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_raw(self, status, data, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_payload(self):
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return None
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if LIST_MODELS_ROUTE.match(path):
+            self.stats.incr("list_models")
+            self._send_json(200, {
+                "models": [
+                    {
+                        "name": "models/gemini-1.5-pro",
+                        "displayName": "Gemini 1.5 Pro (stub)",
+                        "supportedGenerationMethods": ["generateContent", "streamGenerateContent"]
+                    }
+                ]
+            })
+            return
+        self._send_json(404, {"error": {"code": 404, "message": f"Unknown path {path}", "status": "NOT_FOUND"}})
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        match = MODEL_ROUTE.match(parsed.path)
+        if not match or match.group("method") not in ("generateContent", "streamGenerateContent"):
+            self._send_json(404, {"error": {"code": 404, "message": f"Unknown path {parsed.path}", "status": "NOT_FOUND"}})
+            return
+
+        method = match.group("method")
+        payload = self._read_payload()
+        if payload is None:
+            self.stats.incr("bad_request")
+            self._send_json(400, {"error": {"code": 400, "message": "Invalid JSON payload", "status": "INVALID_ARGUMENT"}})
+            return
+
+        time.sleep(self.config.sample_latency())
+
+        roll = random.random()
+        if roll < self.config.rate_limit_rate:
+            self.stats.incr("rate_limited")
+            self._send_json(429, {"error": {"code": 429, "message": "Resource has been exhausted (stub)", "status": "RESOURCE_EXHAUSTED"}})
+            return
+        roll -= self.config.rate_limit_rate
+        if roll < self.config.error_rate:
+            self.stats.incr("server_error")
+            self._send_json(500, {"error": {"code": 500, "message": "Internal error (stub)", "status": "INTERNAL"}})
+            return
+        roll -= self.config.error_rate
+        malformed = roll < self.config.malformed_rate
+
+        text = build_reply_text(payload)
+        if malformed:
+            self.stats.incr("malformed")
+            # Cut the answer short so the body (or the JSON inside it) no longer parses
+            text = text[:max(1, len(text) // 2)]
+
+        if method == "generateContent":
+            self.stats.incr("generate")
+            function_call = None if malformed else build_function_call(payload)
+            if function_call:
+                self.stats.incr("function_call")
+                body = build_response("")
+                body["candidates"][0]["content"]["parts"] = [function_call]
+                self._send_json(200, body)
+            elif malformed:
+                body = json.dumps(build_response(text))
+                self._send_raw(200, body[:max(1, len(body) - 20)].encode("utf-8"))
+            else:
+                self._send_json(200, build_response(text))
+            return
+
+        self.stats.incr("stream")
+        self._stream(text, parse_qs(parsed.query).get("alt", [""])[0] == "sse")
+
+    def _stream(self, text, sse):
+        chunks = split_text(text, self.config.stream_chunks)
+        chunk_delay = self.config.sample_latency() / len(chunks)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if sse else "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_chunk(data):
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        if not sse:
+            write_chunk(b"[")
+        for i, chunk in enumerate(chunks):
+            finish_reason = "STOP" if i == len(chunks) - 1 else None
+            body = build_response(chunk, finish_reason)
+            if finish_reason is None:
+                del body["candidates"][0]["finishReason"]
+            encoded = json.dumps(body)
+            if sse:
+                write_chunk(f"data: {encoded}\r\n\r\n".encode("utf-8"))
+            else:
+                write_chunk(((", " if i else "") + encoded).encode("utf-8"))
+            time.sleep(chunk_delay)
+        if not sse:
+            write_chunk(b"]")
+        write_chunk(b"")
+
+
+def start_stub_server(config=None, host="127.0.0.1", port=0):
+    """
+    Start the stub server on a background thread
+
+    Args:
+        config (StubConfig): Behaviour of the stub, defaults to no latency or errors
+        host (str): Interface to bind
+        port (int): Port to bind, 0 picks a free port
+
+    Returns:
+        tuple: (server, base_url); call server.shutdown() to stop it
+    """
+    handler = type("ConfiguredGeminiStubHandler", (GeminiStubHandler,), {
+        "config": config or StubConfig(),
+        "stats": StubStats()
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    bound_host, bound_port = server.server_address[:2]
+    return server, f"http://{bound_host}:{bound_port}"
+
+
+def add_stub_arguments(parser):
+    """Register the stub behaviour flags on an argparse parser"""
+    parser.add_argument("--latency", default="fixed:0",
+                        help="Latency distribution in ms, e.g. fixed:500, uniform:200:900, lognormal:800:0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of responses with truncated JSON")
+    parser.add_argument("--stream-chunks", type=int, default=4, help="Number of chunks per streamed response")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+
+
+def config_from_args(args):
+    """Build a StubConfig from parsed add_stub_arguments flags"""
+    return StubConfig(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        malformed_rate=args.malformed_rate,
+        stream_chunks=args.stream_chunks,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stub of the Gemini API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(config_from_args(args), args.host, args.port)
+    print(f"Gemini stub listening on {base_url} (latency={args.latency}, errors={args.error_rate}, "
+          f"429s={args.rate_limit_rate}, malformed={args.malformed_rate})")
+    print(f"Point the app at it with GEMINI_API_BASE={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
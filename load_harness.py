@@ -0,0 +1,217 @@
+"""
+Load harness for the AI code paths.
+
+Drives the budget recommendation (SDK and direct REST) and chatbot paths
+concurrently against the local Gemini stub (or any GEMINI_API_BASE) and reports
+throughput, tail latency and how often each path fell back to the simulated or
+rule-based answer.
+
+Usage:
+    python load_harness.py --requests 200 --concurrency 16 --latency lognormal:800:0.4 --rate-limit-rate 0.05
+    python load_harness.py --base-url http://127.0.0.1:8765 --paths chat
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from gemini_stub_server import add_stub_arguments, config_from_args, start_stub_server
+
+PATHS = ["recommendation", "recommendation_rest", "chat"]
+
+SAMPLE_CATEGORIES = [
+    "Essentials", "Food & Dining", "Transportation", "Entertainment", "Shopping", "Health",
+    "Education", "Subscriptions", "Investments", "Gifts & Donations", "Travel"
+]
+
+SAMPLE_QUESTIONS = [
+    "How much did I spend this month?",
+    "Am I on track with my savings goal?",
+    "Which category should I cut back on?",
+    "What's my remaining budget?",
+    "Give me a tip to save more on food",
+]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def sample_profile(rng):
+    """Random recommendation inputs shaped like the budget_setup form"""
+    planning = rng.random() < 0.3
+    return {
+        "income": rng.choice([25000, 50000, 80000, 120000, 250000]),
+        "categories": rng.sample(SAMPLE_CATEGORIES, rng.randint(3, len(SAMPLE_CATEGORIES))),
+        "saving_preference": rng.choice([10, 15, 20, 25, 30]),
+        "has_debt": rng.random() < 0.3,
+        "planning_major_purchase": planning,
+        "purchase_item": "Car" if planning else "",
+        "purchase_cost": 600000 if planning else 0,
+        "purchase_deadline": (datetime.now() + timedelta(days=365)).date() if planning else None,
+        "financial_goal": rng.choice(["Save for emergency fund", "Build long-term wealth", "Balance savings and lifestyle"]),
+        "life_stage": rng.choice(["Student", "Young professional", "Family with children"]),
+    }
+
+
+def sample_financial_context(rng):
+    """Random chatbot context shaped like the one built in financial_assistant"""
+    categories = rng.sample(SAMPLE_CATEGORIES, 5)
+    income = rng.choice([50000, 80000, 120000])
+    allocations = {cat: income / len(categories) for cat in categories}
+    breakdown = {cat: round(amount * rng.uniform(0.2, 1.1), 2) for cat, amount in allocations.items()}
+    top = max(breakdown.items(), key=lambda x: x[1])
+    return {
+        "user_name": "Load Test",
+        "income": income,
+        "currency": "₹",
+        "total_budget": sum(allocations.values()),
+        "budget_allocations": allocations,
+        "monthly_expenses": sum(breakdown.values()) * 0.6,
+        "expenses_last_30_days": sum(breakdown.values()),
+        "category_breakdown": breakdown,
+        "top_spending_category": top[0],
+        "top_spending_amount": top[1],
+        "has_savings_goal": False,
+    }
+
+
+def run_one(path, rng):
+    """
+    Run a single request through the given path
+
+    Returns:
+        bool: True if the path fell back to the simulated / rule-based answer
+    """
+    if path == "chat":
+        from finance_chatbot import get_financial_advice_with_gemini
+        return get_financial_advice_with_gemini(rng.choice(SAMPLE_QUESTIONS), sample_financial_context(rng)) is None
+
+    from budget_ai import get_gemini_recommendation, get_gemini_api_fallback
+    profile = sample_profile(rng)
+    if path == "recommendation_rest":
+        return get_gemini_api_fallback(api_key=os.environ["GEMINI_API_KEY"], **profile) is None
+    return get_gemini_recommendation(**profile) is None
+
+
+class PathStats:
+    """Latency and outcome samples for one code path"""
+
+    def __init__(self):
+        self.latencies = []
+        self.fallbacks = 0
+        self.errors = 0
+
+
+def run_load(paths, total_requests, concurrency, seed=None):
+    """
+    Fire total_requests spread over paths using concurrency worker threads
+
+    Returns:
+        tuple: (dict of path -> PathStats, wall clock seconds)
+    """
+    stats = {path: PathStats() for path in paths}
+    lock = threading.Lock()
+    seeder = random.Random(seed)
+    jobs = [(paths[i % len(paths)], seeder.randrange(2 ** 32)) for i in range(total_requests)]
+
+    def worker(job):
+        path, job_seed = job
+        rng = random.Random(job_seed)
+        start = time.perf_counter()
+        fell_back = False
+        failed = False
+        try:
+            fell_back = run_one(path, rng)
+        except Exception as e:
+            print(f"Unhandled error on {path}: {e}")
+            failed = True
+        elapsed = time.perf_counter() - start
+        with lock:
+            path_stats = stats[path]
+            path_stats.latencies.append(elapsed)
+            path_stats.fallbacks += 1 if fell_back or failed else 0
+            path_stats.errors += 1 if failed else 0
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, jobs))
+    return stats, time.perf_counter() - wall_start
+
+
+def format_report(stats, wall_seconds):
+    """Render the per-path summary table"""
+    header = f"{'path':<22}{'n':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'fallback':>10}{'errors':>8}"
+    lines = [header, "-" * len(header)]
+    all_latencies = []
+    total_fallbacks = 0
+
+    for path, path_stats in stats.items():
+        latencies = sorted(path_stats.latencies)
+        all_latencies.extend(latencies)
+        total_fallbacks += path_stats.fallbacks
+        n = len(latencies)
+        lines.append(
+            f"{path:<22}{n:>6}{n / wall_seconds if wall_seconds else 0:>9.1f}"
+            f"{percentile(latencies, 50) * 1000:>9.0f}{percentile(latencies, 95) * 1000:>9.0f}"
+            f"{percentile(latencies, 99) * 1000:>9.0f}{(latencies[-1] if latencies else 0) * 1000:>9.0f}"
+            f"{(path_stats.fallbacks / n if n else 0):>10.1%}{path_stats.errors:>8}"
+        )
+
+    all_latencies.sort()
+    n = len(all_latencies)
+    lines.append("-" * len(header))
+    lines.append(
+        f"{'total':<22}{n:>6}{n / wall_seconds if wall_seconds else 0:>9.1f}"
+        f"{percentile(all_latencies, 50) * 1000:>9.0f}{percentile(all_latencies, 95) * 1000:>9.0f}"
+        f"{percentile(all_latencies, 99) * 1000:>9.0f}{(all_latencies[-1] if all_latencies else 0) * 1000:>9.0f}"
+        f"{(total_fallbacks / n if n else 0):>10.1%}{'':>8}"
+    )
+    lines.append(f"Wall time: {wall_seconds:.2f}s")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the AI recommendation and chat paths")
+    parser.add_argument("--base-url", default=None,
+                        help="Existing Gemini-compatible server; starts an in-process stub when omitted")
+    parser.add_argument("--paths", default=",".join(PATHS), help=f"Comma separated subset of {PATHS}")
+    parser.add_argument("--requests", type=int, default=100, help="Total number of requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of concurrent workers")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    paths = [p.strip() for p in args.paths.split(",") if p.strip()]
+    unknown = [p for p in paths if p not in PATHS]
+    if unknown:
+        parser.error(f"Unknown paths: {unknown}")
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server, base_url = start_stub_server(config_from_args(args))
+        print(f"Started Gemini stub at {base_url}")
+
+    # Never send load to the real API by accident
+    os.environ["GEMINI_API_BASE"] = base_url
+    os.environ.setdefault("GEMINI_API_KEY", "stub-key")
+
+    try:
+        stats, wall_seconds = run_load(paths, args.requests, args.concurrency, args.seed)
+        print(format_report(stats, wall_seconds))
+        if server is not None:
+            print(f"Stub served: {server.RequestHandlerClass.stats.snapshot()}")
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
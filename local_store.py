@@ -0,0 +1,87 @@
+"""
+Where the app keeps files on the local disk, and how values are stored in them.
+
+The expense journal (expense_journal.py) and the shared cache (cache.py)
+hold users' expenses and profiles, so by default they live in directories
+only the app's own OS user can open (mode 0700): under XDG_DATA_HOME and
+XDG_CACHE_HOME, or ~/.local/share and ~/.cache.
+
+Values are stored as JSON rather than pickled, so a file someone else
+could write to can't run code in the app when it is read. Datetimes and
+dates keep their type through a tagged ISO string; tuples come back as
+lists, and other numbers, such as numpy's, become plain ints and floats.
+"""
+import datetime
+import json
+import numbers
+import os
+
+APP_NAME = "smart_budget"
+
+DATA_HOME = os.path.join(os.getenv("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share"),
+                         APP_NAME)
+CACHE_HOME = os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                          APP_NAME)
+
+
+def private_dir(path):
+    """
+    Create a directory only the current user can open, tightening it if it exists
+
+    Args:
+        path (str): Directory
+
+    Returns:
+        str: The directory
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    os.chmod(path, 0o700)
+    return path
+
+
+def private_file(path):
+    """
+    Create a file only the current user can read, tightening it if it exists
+
+    SQLite gives its -wal and -shm files the permissions of the database file.
+
+    Args:
+        path (str): File
+
+    Returns:
+        str: The file
+    """
+    os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+    os.chmod(path, 0o600)
+    return path
+
+
+def _default(value):
+    if isinstance(value, datetime.datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} can't be stored as JSON")
+
+
+def _hook(value):
+    if len(value) == 1:
+        if "$datetime" in value:
+            return datetime.datetime.fromisoformat(value["$datetime"])
+        if "$date" in value:
+            return datetime.date.fromisoformat(value["$date"])
+    return value
+
+
+def dumps(value):
+    """JSON text of a value, datetimes and dates included"""
+    return json.dumps(value, default=_default)
+
+
+def loads(text):
+    """The value stored by dumps()"""
+    return json.loads(text, object_hook=_hook)
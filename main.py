@@ -6,13 +6,28 @@ import firebase_admin
 from firebase_admin import credentials
 import pyrebase
 import json
+import calendar
 from datetime import datetime,timedelta,time
 import plotly.express as px
 
 import pandas as pd
 from shared import db, auth, firebase
 from budget_setup import budget_setup
-from finance_chatbot import process_query_with_gemini
+from finance_chatbot import process_query_with_gemini, process_query_with_tools
+from data_layer import PAGE_LOAD_TIMEOUT, TOTAL_FIELDS, get_expense, load_concurrently, query_expenses, sum_by_category
+from money import amount_fields, base_amount, currency_choices, currency_code, stored_allocations, sum_amounts
+from category_registry import (DEFAULT_EXPENSE_CATEGORIES, SAVINGS, canonical_amounts, canonical_categories,
+                               canonical_category, category_group)
+from chat_memory import ConversationMemory
+from spend_forecast import get_forecaster
+from anomaly import assess_expense
+from bulk_ops import EDIT_VERSION_BUMPS, delete_expenses, update_expenses
+from recurring import load_recurring, recurring_update, upcoming_charges
+from savings_goals import contribute_savings
+from task_executor import pop_finished, submit_task
+from expense_queue import get_expense_queue
+from fragments import SHOW_RERUN_METRICS, data_slice, page_fragment, rerun_metrics, timed
+from figure_cache import cached_figure, get_figure_cache
 
 # Page configuration
 st.set_page_config(
@@ -294,10 +309,14 @@ def init_session_state():
         st.session_state.page = "dashboard"
 
 # Dashboard page
-def dashboard(user_id):
-    # Get user data
-    user_doc = db.collection("users").document(user_id).get()
-    user_data = user_doc.to_dict()
+def dashboard(user_id, page_data=None):
+    # Get user data, from the local journal's copy if Firestore is unreachable
+    expense_queue = get_expense_queue(user_id)
+    user_data = page_data["user"] if page_data else expense_queue.read_user()
+    
+    # Expenses still being written in the background count as saved
+    server_version = user_data.get('expenses_version', 0)
+    user_data = expense_queue.overlay(user_data)
     
     # Header with user name
     st.markdown(f"""
@@ -307,12 +326,17 @@ def dashboard(user_id):
     </div>
     """, unsafe_allow_html=True)
     
+    # Anomaly notice from an expense added before the last rerun
+    if st.session_state.get("expense_notice"):
+        st.warning(st.session_state.pop("expense_notice"))
+    show_task_notices(user_id, user_data.get('currency', '₹ INR').split()[0])
+    
     # Key metrics
     currency_symbol = user_data.get('currency', '₹ INR').split()[0]
     income = user_data.get('income', 0)
     
     # Get budget allocations and calculate metrics
-    budget_allocations = user_data.get('budget_allocations', {})
+    budget_allocations = canonical_amounts(stored_allocations(user_data))
     total_budget = sum(budget_allocations.values()) if budget_allocations else income
     
     # Get recent expenses (last month)
@@ -320,46 +344,23 @@ def dashboard(user_id):
         now = datetime.now()
         month_ago = (now - timedelta(days=30)).isoformat()
         
-        expenses_ref = db.collection("users").document(user_id).collection("expenses")
-        recent_expenses_query = expenses_ref.where('date', '>=', month_ago).get()
+        # Recomputed only when the expenses change, not on every rerun
+        slice_key = (user_id, user_data.get('expenses_version', 0), month_ago[:10], user_data.get('currency'))
         
-        recent_expenses = []
-        for doc in recent_expenses_query:
-            expense = doc.to_dict()
-            expense['id'] = doc.id
-            recent_expenses.append(expense)
-        
-        # Calculate total expenses
-        total_expenses = sum(expense['amount'] for expense in recent_expenses)
+        def recent_totals():
+            # From the session's expense snapshot, so saving an expense doesn't reread them all
+            expenses = expense_queue.expenses(server_version, page_data.get("expenses") if page_data else None)
+            recent = [e for e in expenses if e.get('date', '') >= month_ago]
+            return recent, sum_amounts(recent, user_data.get('currency')), sum_by_category(recent, user_data.get('currency'))
         
-        # Group expenses by category
-        expense_by_category = {}
-        for expense in recent_expenses:
-            category = expense.get('category', 'Other')
-            expense_by_category[category] = expense_by_category.get(category, 0) + expense['amount']
+        recent_expenses, total_expenses, expense_by_category = data_slice("dashboard.recent", slice_key, recent_totals)
             
     except Exception as e:
-        # If error occurs, use simulated data
-        total_expenses = total_budget * 0.8  # Simulated as 80% of budget used
-        
-        # Generate some sample expenses data based on categories
-        expense_by_category = {}
-        import random
-        for cat, amount in budget_allocations.items():
-            expense_by_category[cat] = round(random.uniform(0.5, 0.9) * amount, 2)
-            
+        st.error(f"Failed to load expenses: {str(e)}")
+        slice_key = None
         recent_expenses = []
-        for cat, amount in expense_by_category.items():
-            # Create 2-3 expenses per category
-            num_expenses = random.randint(2, 3)
-            for i in range(num_expenses):
-                expense_amount = round(amount / num_expenses * random.uniform(0.8, 1.2), 2)
-                recent_expenses.append({
-                    'category': cat,
-                    'amount': expense_amount,
-                    'date': (now - timedelta(days=random.randint(0, 29))).isoformat(),
-                    'notes': f"Sample {cat} expense #{i+1}"
-                })
+        total_expenses = 0
+        expense_by_category = {}
     
     # Calculate remaining budget
     remaining_budget = total_budget - total_expenses
@@ -382,36 +383,21 @@ def dashboard(user_id):
             delta_color = "off"  # Red if close to or exceeding budget
         st.metric("Total Expenses", f"{currency_symbol} {total_expenses:,.0f}", delta, delta_color=delta_color)
     
-    # Dashboard tabs
+    # Dashboard tabs; each reruns on its own when its widgets are used
     tab1, tab2 = st.tabs(["Overview", "Add Expense"])
     
-    with tab1:
+    @page_fragment("dashboard.overview")
+    def overview():
         col1, col2 = st.columns([3, 2])
         
         with col1:
             st.subheader("Expense Breakdown")
             
-            # Create a dataframe for the pie chart from actual expense data
+            # Pie chart from actual expense data; the figure cache rebuilds it only when the totals change
             if expense_by_category:
-                df = pd.DataFrame({
-                    'Category': expense_by_category.keys(),
-                    'Amount': expense_by_category.values()
-                })
-                
-                # Create a pie chart
-                fig = px.pie(
-                    df, 
-                    values='Amount', 
-                    names='Category',
-                    color_discrete_sequence=px.colors.sequential.Bluyl, 
-                    hole=0.4
-                )
-                
-                fig.update_layout(
-                    margin=dict(l=20, r=20, t=30, b=20),
-                    height=300
-                )
-                
+                breakdown_df = data_slice("dashboard.breakdown_frame", slice_key,
+                                          lambda: expense_breakdown_frame(expense_by_category))
+                fig = cached_figure("expense_breakdown", breakdown_df, breakdown_pie)
                 st.plotly_chart(fig, use_container_width=True)
             else:
                 st.info("No expense data available yet. Add your first expense!")
@@ -425,7 +411,7 @@ def dashboard(user_id):
                 
                 for i, expense in enumerate(sorted_expenses[:5]):  # Show 5 most recent
                     category = expense.get('category', 'Other')
-                    amount = expense.get('amount', 0)
+                    amount = base_amount(expense, user_data.get('currency', '₹ INR'))
                     date_str = expense.get('date', '')
                     
                     # Parse date for display
@@ -452,47 +438,30 @@ def dashboard(user_id):
             
             # Get budget allocations if available
             if budget_allocations:
-                # Create a dataframe comparing budget vs actual spending by category
-                budget_vs_spent = []
-                
-                for category, budget_amount in budget_allocations.items():
-                    spent_amount = expense_by_category.get(category, 0)
-                    percent_used = (spent_amount / budget_amount * 100) if budget_amount > 0 else 0
-                    
-                    budget_vs_spent.append({
-                        'Category': category,
-                        'Allocated': budget_amount,
-                        'Spent': spent_amount,
-                        'Percent_Used': percent_used
-                    })
-                
-                # Sort by percent used (highest first)
-                budget_vs_spent = sorted(budget_vs_spent, key=lambda x: x['Percent_Used'], reverse=True)
-                
-                # Convert to dataframe for visualization
-                budget_df = pd.DataFrame(budget_vs_spent)
-                
-                # Create a horizontal bar chart for budget vs spent
-                fig2 = px.bar(
-                    budget_df, 
-                    x=['Allocated', 'Spent'], 
-                    y='Category', 
-                    orientation='h',
-                    barmode='group',
-                    color_discrete_sequence=['#4361EE', '#FF5E78']
-                )
-                
-                fig2.update_layout(
-                    margin=dict(l=20, r=20, t=20, b=20),
-                    height=240
+                # Budget vs actual spending by category, recomputed only when either changes
+                budget_vs_spent, budget_df = data_slice(
+                    "dashboard.budget_frame",
+                    (slice_key, tuple(budget_allocations.items())) if slice_key else None,
+                    lambda: budget_vs_spent_frame(budget_allocations, expense_by_category)
                 )
-                
+                fig2 = cached_figure("budget_vs_spent", budget_df, budget_vs_spent_bar)
                 st.plotly_chart(fig2, use_container_width=True)
                 
-                # Flag categories that are over budget
+                # Flag categories that are over budget, or on course to be by month end
+                try:
+                    forecast = get_forecaster(user_id, user_data.get('expenses_version', 0), list(budget_allocations), now.date(), user_data.get('currency', '₹ INR'),
+                                              pending=expense_queue.pending_changes()).forecast(now.date())
+                except Exception as e:
+                    print(f"Error forecasting spend: {e}")
+                    forecast = {}
+                
                 for item in budget_vs_spent:
+                    projected = forecast.get(item['Category'], {}).get('projected', 0)
+                    budget_amount = item['Allocated']
                     if item['Percent_Used'] > 90:
                         st.warning(f"⚠️ {item['Category']} is at {item['Percent_Used']:.1f}% of budget")
+                    elif budget_amount > 0 and projected > budget_amount:
+                        st.warning(f"📈 {item['Category']} is projected to reach {projected / budget_amount * 100:.0f}% of budget by month end")
                 
                 # Add link to budget setup
                 if st.button("Adjust Budget Allocations"):
@@ -548,7 +517,11 @@ def dashboard(user_id):
                     st.session_state.active_tab = "Savings Goals"
                     st.rerun()
             
-    with tab2:
+    with tab1:
+        overview()
+    
+    @page_fragment("dashboard.add_expense")
+    def add_expense():
         with st.form("add_expense_form"):
             st.subheader("Record New Expense")
             
@@ -556,6 +529,7 @@ def dashboard(user_id):
             
             with col1:
                 expense_amount = st.number_input("Amount", min_value=0.0, step=100.0)
+                expense_currency = st.selectbox("Currency", currency_choices(user_data.get('currency', '₹ INR')))
                 expense_date = st.date_input("Date", value=datetime.now())
             
             with col2:
@@ -565,22 +539,31 @@ def dashboard(user_id):
                 else:
                     # Extract category names from the full category strings (removing emojis)
                     categories = user_data.get('categories', [])
-                    categories_list = [cat.split(" ", 1)[1] if " " in cat else cat for cat in categories]
-                    if not categories_list:
-                        categories_list = ["Essentials", "Food & Dining", "Entertainment", "Transportation"]
+                    categories_list = canonical_categories(categories, DEFAULT_EXPENSE_CATEGORIES)
                 
                 expense_category = st.selectbox("Category", categories_list)
                 expense_notes = st.text_input("Description (Optional)")
             
+            # Amount in the user's own currency for budgets and statistics
+            amount_in_base = base_amount({
+                "amount": expense_amount,
+                "currency": expense_currency,
+                "date": expense_date.isoformat()
+            }, user_data.get('currency', '₹ INR'))
+            if expense_currency == currency_code(user_data.get('currency', '₹ INR')):
+                amount_text = f"{currency_symbol} {expense_amount:,.2f}"
+            else:
+                amount_text = f"{expense_currency} {expense_amount:,.2f} ({currency_symbol} {amount_in_base:,.2f})"
+            
             # Add warning if category is close to or over budget
             if budget_allocations and expense_category in budget_allocations and expense_category in expense_by_category:
                 budget_for_cat = budget_allocations[expense_category]
                 spent_for_cat = expense_by_category.get(expense_category, 0)
                 
                 # Check if this expense would put the category over budget
-                if spent_for_cat + expense_amount > budget_for_cat:
+                if spent_for_cat + amount_in_base > budget_for_cat:
                     st.warning(f"⚠️ This expense will put your {expense_category} category over budget!")
-                elif spent_for_cat + expense_amount > budget_for_cat * 0.9:
+                elif spent_for_cat + amount_in_base > budget_for_cat * 0.9:
                     st.warning(f"⚠️ This expense will use over 90% of your {expense_category} budget!")
             
             submitted = st.form_submit_button("Save Expense")
@@ -590,40 +573,131 @@ def dashboard(user_id):
                     st.warning("Please enter a valid expense amount")
                 else:
                     try:
-                        # Save the expense to Firestore
-                        db.collection("users").document(user_id).collection("expenses").add({
-                            "amount": expense_amount,
+                        # Score against the category's running statistics before saving
+                        assessment, stats_update = assess_expense(user_data, expense_category, amount_in_base)
+                        
+                        # Show the expense now and save it to Firestore in the background
+                        expense_queue.enqueue({
+                            **amount_fields(expense_amount, expense_currency),
+                            "currency": expense_currency,
                             "category": expense_category,
                             "date": expense_date.isoformat(),
                             "notes": expense_notes,
+                            "anomaly_score": assessment["anomaly_score"],
+                            "anomaly": assessment["anomaly"],
                             "created_at": firestore.SERVER_TIMESTAMP
-                        })
-                        st.success(f"Expense of {currency_symbol} {expense_amount:.2f} added to {expense_category}!")
-                        
-                        # If this is for a savings goal item, update savings progress
-                        if savings_goal and expense_category.lower().find("savings") >= 0:
-                            current_savings = savings_goal.get('current_savings', 0) + expense_amount
-                            
-                            db.collection("users").document(user_id).update({
-                                "savings_goal.current_savings": current_savings
+                        }, {
+                            **stats_update,
+                            **recurring_update(user_data, {
+                                "amount": amount_in_base,
+                                "category": expense_category,
+                                "date": expense_date.isoformat(),
+                                "notes": expense_notes
                             })
-                            
-                            st.success(f"Savings progress updated to {currency_symbol} {current_savings:,.2f}!")
+                        }, amount_in_base)
+                        st.success(f"Expense of {amount_text} added to {expense_category}!")
+                        if assessment["anomaly"]:
+                            st.session_state.expense_notice = (
+                                f"🔍 {amount_text} is unusually high for {expense_category} "
+                                f"(typically around {currency_symbol} {assessment['typical']:,.2f})"
+                            )
+                        
+                        # Money put into savings counts towards the user's goals
+                        if category_group(expense_category) == SAVINGS:
+                            submit_task("savings_contribution", contribute_savings, user_id, user_data, amount_in_base,
+                                        unique=False)
                             
                         # Refresh the page to show the new expense
                         st.rerun()
                     except Exception as e:
                         st.error(f"Failed to save expense: {str(e)}")
+    
+    with tab2:
+        add_expense()
+
+def expense_breakdown_frame(expense_by_category):
+    """Spending per category, for the breakdown donut chart"""
+    return pd.DataFrame({
+        'Category': list(expense_by_category.keys()),
+        'Amount': list(expense_by_category.values())
+    })
+
+def breakdown_pie(df):
+    fig = px.pie(
+        df, 
+        values='Amount', 
+        names='Category',
+        color_discrete_sequence=px.colors.sequential.Bluyl, 
+        hole=0.4
+    )
+    
+    fig.update_layout(
+        margin=dict(l=20, r=20, t=30, b=20),
+        height=300
+    )
+    return fig
+
+def budget_vs_spent_frame(budget_allocations, expense_by_category):
+    """
+    Budget against spending per category
+    
+    Returns:
+        tuple: (rows sorted by percent of budget used, their data frame for the bar chart)
+    """
+    budget_vs_spent = []
+    
+    for category, budget_amount in budget_allocations.items():
+        spent_amount = expense_by_category.get(category, 0)
+        percent_used = (spent_amount / budget_amount * 100) if budget_amount > 0 else 0
+        
+        budget_vs_spent.append({
+            'Category': category,
+            'Allocated': budget_amount,
+            'Spent': spent_amount,
+            'Percent_Used': percent_used
+        })
+    
+    # Sort by percent used (highest first)
+    budget_vs_spent = sorted(budget_vs_spent, key=lambda x: x['Percent_Used'], reverse=True)
+    
+    # Horizontal bar chart for budget vs spent
+    df = pd.DataFrame(budget_vs_spent, columns=['Category', 'Allocated', 'Spent', 'Percent_Used'])
+    return budget_vs_spent, df
+
+def budget_vs_spent_bar(df):
+    fig = px.bar(
+        df, 
+        x=['Allocated', 'Spent'], 
+        y='Category', 
+        orientation='h',
+        barmode='group',
+        color_discrete_sequence=['#4361EE', '#FF5E78']
+    )
+    
+    fig.update_layout(
+        margin=dict(l=20, r=20, t=20, b=20),
+        height=240
+    )
+    return fig
 
 # Add this function after the dashboard function
 
-def transactions_page(user_id):
+# Rows rendered per page of the transactions table
+TRANSACTIONS_PAGE_SIZE = 50
+# Selected transactions whose full documents are shown below the table
+TRANSACTION_DETAILS_LIMIT = 5
+
+def transactions_page(user_id, page_data=None):
     """Display and manage user transactions"""
-    # Get user data
-    user_doc = db.collection("users").document(user_id).get()
-    user_data = user_doc.to_dict()
+    # Get user data, from the local journal's copy if Firestore is unreachable
+    expense_queue = get_expense_queue(user_id)
+    user_data = page_data["user"] if page_data else expense_queue.read_user()
     currency_symbol = user_data.get('currency', '₹ INR').split()[0]
     
+    # Expenses still being written in the background count as saved
+    server_version = user_data.get('expenses_version', 0)
+    user_data = expense_queue.overlay(user_data)
+    
     st.markdown("""
     <div class="header-banner">
         <h1>📊 Transactions</h1>
@@ -631,24 +705,23 @@ def transactions_page(user_id):
     </div>
     """, unsafe_allow_html=True)
     
+    # Anomaly notice from an expense added before the last rerun
+    if st.session_state.get("expense_notice"):
+        st.warning(st.session_state.pop("expense_notice"))
+    show_task_notices(user_id, currency_symbol)
+    
     # Get all expenses
     try:
-        expenses_ref = db.collection("users").document(user_id).collection("expenses")
-        expenses_query = expenses_ref.order_by('date', direction='DESCENDING').get()
-        
-        expenses = []
-        for doc in expenses_query:
-            expense = doc.to_dict()
-            expense['id'] = doc.id
-            expenses.append(expense)
+        expenses = expense_queue.expenses(server_version, page_data.get("expenses") if page_data else None)
     except Exception as e:
         st.error(f"Failed to load transactions: {str(e)}")
         expenses = []
     
-    # Tabs for transactions view
-    tab1, tab2 = st.tabs(["All Transactions", "Add New"])
+    # Tabs for transactions view; filters, paging and forms rerun only their own tab
+    tab1, tab2, tab3 = st.tabs(["All Transactions", "Add New", "Recurring"])
     
-    with tab1:
+    @page_fragment("transactions.table")
+    def transactions_table():
         if not expenses:
             st.info("No transactions found. Add your first expense!")
         else:
@@ -657,9 +730,7 @@ def transactions_page(user_id):
             with col1:
                 # Get all categories from user data
                 categories = user_data.get('categories', [])
-                clean_categories = [cat.split(" ", 1)[1] if " " in cat else cat for cat in categories]
-                if not clean_categories:
-                    clean_categories = ["Essentials", "Food & Dining", "Entertainment", "Transportation"]
+                clean_categories = canonical_categories(categories, DEFAULT_EXPENSE_CATEGORIES)
                 
                 selected_category = st.selectbox("Filter by Category", ["All"] + clean_categories)
             
@@ -674,7 +745,7 @@ def transactions_page(user_id):
             
             # Category filter
             if selected_category != "All":
-                filtered_expenses = [e for e in filtered_expenses if e.get('category', '') == selected_category]
+                filtered_expenses = [e for e in filtered_expenses if canonical_category(e.get('category', '')) == selected_category]
             
             # Time filter
             now = datetime.now()
@@ -706,13 +777,13 @@ def transactions_page(user_id):
             elif sort_by == "Date (Oldest)":
                 filtered_expenses = sorted(filtered_expenses, key=lambda x: x.get('date', ''))
             elif sort_by == "Amount (Highest)":
-                filtered_expenses = sorted(filtered_expenses, key=lambda x: x.get('amount', 0), reverse=True)
+                filtered_expenses = sorted(filtered_expenses, key=lambda x: base_amount(x, user_data.get('currency', '₹ INR')), reverse=True)
             elif sort_by == "Amount (Lowest)":
-                filtered_expenses = sorted(filtered_expenses, key=lambda x: x.get('amount', 0))
+                filtered_expenses = sorted(filtered_expenses, key=lambda x: base_amount(x, user_data.get('currency', '₹ INR')))
             
             # Summary metrics
             if filtered_expenses:
-                total = sum(e.get('amount', 0) for e in filtered_expenses)
+                total = sum_amounts(filtered_expenses, user_data.get('currency'))
                 avg = total / len(filtered_expenses) if filtered_expenses else 0
                 
                 cols = st.columns(3)
@@ -723,42 +794,112 @@ def transactions_page(user_id):
                 with cols[2]:
                     st.metric("Average Amount", f"{currency_symbol} {avg:,.2f}")
             
-            # Show transactions
-            for expense in filtered_expenses:
-                category = expense.get('category', 'Other')
-                amount = expense.get('amount', 0)
-                date_str = expense.get('date', '')
-                notes = expense.get('notes', '')
-                
-                # Parse date for display
-                try:
-                    date_obj = datetime.fromisoformat(date_str)
-                    date_display = date_obj.strftime('%d %b, %Y')
-                except:
-                    date_display = "Unknown date"
+            # Only one page of rows goes to the browser, however long the history
+            page_count = max(1, -(-len(filtered_expenses) // TRANSACTIONS_PAGE_SIZE))
+            page_number = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, step=1)
+            page_start = (page_number - 1) * TRANSACTIONS_PAGE_SIZE
+            page_expenses = filtered_expenses[page_start:page_start + TRANSACTIONS_PAGE_SIZE]
+            
+            base_currency = currency_code(user_data.get('currency', '₹ INR'))
+            rows = []
+            for expense in page_expenses:
+                # Foreign-currency expenses show the amount as recorded next to the converted one
+                recorded = ""
+                if expense.get('currency') and expense['currency'] != base_currency:
+                    recorded = f"{expense['currency']} {expense.get('amount', 0):,.2f}"
+                status = "⏳ Saving" if expense.get('pending') else ("🔍 Unusual" if expense.get('anomaly') else "")
+                rows.append({
+                    "Select": False,
+                    "Date": expense.get('date', '')[:10],
+                    "Category": expense.get('category', 'Other'),
+                    "Amount": base_amount(expense, user_data.get('currency', '₹ INR')),
+                    "Recorded As": recorded,
+                    "Notes": expense.get('notes', ''),
+                    "Status": status
+                })
+            
+            edited = st.data_editor(
+                pd.DataFrame(rows, columns=["Select", "Date", "Category", "Amount", "Recorded As", "Notes", "Status"]),
+                # A new key per filter and page, so a selection never carries over to other rows
+                key=f"transactions_table_{selected_category}_{time_filter}_{sort_by}_{page_number}",
+                hide_index=True,
+                use_container_width=True,
+                disabled=["Date", "Category", "Amount", "Recorded As", "Notes", "Status"],
+                column_config={
+                    "Select": st.column_config.CheckboxColumn("Select", width="small"),
+                    "Amount": st.column_config.NumberColumn(f"Amount ({currency_symbol})", format="%.2f")
+                }
+            )
+            selected = [expense for expense, chosen in zip(page_expenses, edited["Select"].tolist()) if chosen]
+            
+            # Bulk changes to the selected rows or to everything the filters match
+            with st.expander("Bulk actions"):
+                scope = st.radio("Apply to", [f"Selected ({len(selected)})", f"All matching filters ({len(filtered_expenses)})"],
+                                 horizontal=True)
+                # Expenses still being saved have no document to change yet
+                targets = [e for e in (selected if scope.startswith("Selected") else filtered_expenses) if not e.get('pending')]
+                action = st.selectbox("Action", ["Delete", "Change category", "Change date", "Change amount"])
+                new_value = None
+                if action == "Change category":
+                    new_value = st.selectbox("New category", clean_categories)
+                elif action == "Change date":
+                    new_value = st.date_input("New date", value=datetime.now())
+                elif action == "Change amount":
+                    new_value = st.number_input("New amount (in each transaction's own currency)", min_value=0.0, step=100.0)
+                ready = bool(targets) and (action != "Change amount" or new_value > 0)
+                if action == "Delete":
+                    ready = ready and st.checkbox(f"Yes, delete {len(targets)} transaction(s)")
                 
-                # Create an expandable card for each transaction
-                with st.expander(f"{date_display} | {category} | {currency_symbol} {amount:,.2f}"):
-                    cols = st.columns([3, 1])
-                    with cols[0]:
-                        st.write(f"**Category:** {category}")
-                        st.write(f"**Date:** {date_display}")
-                        st.write(f"**Amount:** {currency_symbol} {amount:,.2f}")
-                        if notes:
-                            st.write(f"**Notes:** {notes}")
-                    
-                    with cols[1]:
-                        # Action buttons
-                        if st.button("Delete", key=f"delete_{expense.get('id', 'unknown')}"):
-                            try:
-                                # Delete from Firestore
-                                db.collection("users").document(user_id).collection("expenses").document(expense['id']).delete()
-                                st.success("Transaction deleted!")
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"Failed to delete: {str(e)}")
+                if st.button(f"Apply to {len(targets)} transaction(s)", disabled=not ready):
+                    progress_bar = st.progress(0.0, text=f"0 of {len(targets)} done")
+                    report = lambda done, total: progress_bar.progress(done / total, text=f"{done} of {total} done")
+                    if action == "Delete":
+                        result = delete_expenses(user_id, user_data, targets, report)
+                        for expense_id in result["written"]:
+                            expense_queue.forget(expense_id)
+                    else:
+                        result = update_expenses(
+                            user_id, user_data, targets,
+                            category=new_value if action == "Change category" else None,
+                            date=new_value.isoformat() if action == "Change date" else None,
+                            amount=new_value if action == "Change amount" else None,
+                            progress=report
+                        )
+                        for expense_id, fields in result["fields"].items():
+                            expense_queue.amend(expense_id, fields, EDIT_VERSION_BUMPS)
+                    if result["error"]:
+                        st.error(f"Stopped after {len(result['written'])} of {len(targets)} transactions: {result['error']}")
+                    else:
+                        st.success(f"{len(result['written'])} transaction(s) updated!")
+                        st.rerun()
+            
+            if selected:
+                # Details for the selected rows; the list holds only the fields in the table
+                for expense in selected[:TRANSACTION_DETAILS_LIMIT]:
+                    details = expense
+                    if not expense.get('pending'):
+                        try:
+                            details = get_expense(user_id, expense['id']) or expense
+                        except Exception as e:
+                            st.error(f"Failed to load details: {str(e)}")
+                    title = (f"{details.get('date', '')[:10]} | {details.get('category', 'Other')} | "
+                             f"{currency_symbol} {base_amount(details, user_data.get('currency', '₹ INR')):,.2f}")
+                    with st.expander(title, expanded=True):
+                        if details.get('notes'):
+                            st.write(f"**Notes:** {details['notes']}")
+                        if details.get('anomaly_score') is not None:
+                            st.write(f"**Anomaly score:** {details['anomaly_score']:.1f} "
+                                     f"({'unusually high' if details.get('anomaly') else 'normal'} for {details.get('category', 'Other')})")
+                        if details.get('created_at'):
+                            st.write(f"**Recorded:** {details['created_at'].strftime('%d %b, %Y %H:%M')}")
+                if len(selected) > TRANSACTION_DETAILS_LIMIT:
+                    st.caption(f"Showing details for the first {TRANSACTION_DETAILS_LIMIT} selected transactions.")
     
-    with tab2:
+    with tab1:
+        transactions_table()
+    
+    @page_fragment("transactions.add_expense")
+    def add_expense():
         # Form to add new expense - similar to the one on dashboard
         with st.form("add_expense_form_transactions"):
             st.subheader("Record New Expense")
@@ -767,24 +908,34 @@ def transactions_page(user_id):
             
             with col1:
                 expense_amount = st.number_input("Amount", min_value=0.0, step=100.0)
+                expense_currency = st.selectbox("Currency", currency_choices(user_data.get('currency', '₹ INR')))
                 expense_date = st.date_input("Date", value=datetime.now())
             
             with col2:
                 # Use budget categories
-                budget_allocations = user_data.get('budget_allocations', {})
+                budget_allocations = canonical_amounts(stored_allocations(user_data))
                 
                 if budget_allocations:
                     categories_list = list(budget_allocations.keys())
                 else:
                     # Extract category names from the full category strings (removing emojis)
                     categories = user_data.get('categories', [])
-                    categories_list = [cat.split(" ", 1)[1] if " " in cat else cat for cat in categories]
-                    if not categories_list:
-                        categories_list = ["Essentials", "Food & Dining", "Entertainment", "Transportation"]
+                    categories_list = canonical_categories(categories, DEFAULT_EXPENSE_CATEGORIES)
                 
                 expense_category = st.selectbox("Category", categories_list)
                 expense_notes = st.text_input("Description (Optional)")
             
+            # Amount in the user's own currency for budgets and statistics
+            amount_in_base = base_amount({
+                "amount": expense_amount,
+                "currency": expense_currency,
+                "date": expense_date.isoformat()
+            }, user_data.get('currency', '₹ INR'))
+            if expense_currency == currency_code(user_data.get('currency', '₹ INR')):
+                amount_text = f"{currency_symbol} {expense_amount:,.2f}"
+            else:
+                amount_text = f"{expense_currency} {expense_amount:,.2f} ({currency_symbol} {amount_in_base:,.2f})"
+            
             submitted = st.form_submit_button("Save Expense", use_container_width=True)
             
             if submitted:
@@ -792,44 +943,109 @@ def transactions_page(user_id):
                     st.warning("Please enter a valid expense amount")
                 else:
                     try:
-                        # Save the expense to Firestore
-                        db.collection("users").document(user_id).collection("expenses").add({
-                            "amount": expense_amount,
+                        # Score against the category's running statistics before saving
+                        assessment, stats_update = assess_expense(user_data, expense_category, amount_in_base)
+                        
+                        # Show the expense now and save it to Firestore in the background
+                        expense_queue.enqueue({
+                            **amount_fields(expense_amount, expense_currency),
+                            "currency": expense_currency,
                             "category": expense_category,
                             "date": expense_date.isoformat(),
                             "notes": expense_notes,
+                            "anomaly_score": assessment["anomaly_score"],
+                            "anomaly": assessment["anomaly"],
                             "created_at": firestore.SERVER_TIMESTAMP
-                        })
+                        }, {
+                            **stats_update,
+                            **recurring_update(user_data, {
+                                "amount": amount_in_base,
+                                "category": expense_category,
+                                "date": expense_date.isoformat(),
+                                "notes": expense_notes
+                            })
+                        }, amount_in_base)
                         
                         # Update streak and potentially award achievements
-                        update_user_achievements(user_id)
+                        submit_task("achievements", update_user_achievements, user_id, unique=False)
                         
-                        st.success(f"Expense of {currency_symbol} {expense_amount:.2f} added to {expense_category}!")
+                        st.success(f"Expense of {amount_text} added to {expense_category}!")
+                        if assessment["anomaly"]:
+                            st.session_state.expense_notice = (
+                                f"🔍 {amount_text} is unusually high for {expense_category} "
+                                f"(typically around {currency_symbol} {assessment['typical']:,.2f})"
+                            )
                         
-                        # If this is for a savings goal item, update savings progress
-                        savings_goal = user_data.get('savings_goal', None)
-                        if savings_goal and expense_category.lower().find("savings") >= 0:
-                            current_savings = savings_goal.get('current_savings', 0) + expense_amount
-                            
-                            db.collection("users").document(user_id).update({
-                                "savings_goal.current_savings": current_savings
-                            })
-                            
-                            st.success(f"Savings progress updated to {currency_symbol} {current_savings:,.2f}!")
+                        # Money put into savings counts towards the user's goals
+                        if category_group(expense_category) == SAVINGS:
+                            submit_task("savings_contribution", contribute_savings, user_id, user_data, amount_in_base,
+                                        unique=False)
                         
                         st.balloons()  # Small celebration for added expense (gamification)
                         time.sleep(0.5)  # Give time to see the balloons
                         st.rerun()
                     except Exception as e:
                         st.error(f"Failed to save expense: {str(e)}")
+    
+    with tab2:
+        add_expense()
+
+    with tab3:
+        st.subheader("Recurring Charges & Subscriptions")
+
+        try:
+            series = load_recurring(user_id, user_data, expenses)
+        except Exception as e:
+            st.error(f"Failed to detect recurring charges: {str(e)}")
+            series = {}
+
+        active = [item for item in series.values() if item.get('active')]
+        if not active:
+            st.info("No recurring charges found yet. Charges that repeat weekly, monthly or yearly with the same description will show up here.")
+        else:
+            monthly_factor = {"weekly": 52 / 12, "monthly": 1, "yearly": 1 / 12}
+            monthly_total = sum(item['amount'] * monthly_factor[item['period']] for item in active)
+
+            cols = st.columns(2)
+            with cols[0]:
+                st.metric("Active Recurring Charges", f"{len(active)}")
+            with cols[1]:
+                st.metric("Monthly Cost", f"{currency_symbol} {monthly_total:,.2f}")
+
+            st.markdown("#### Upcoming (next 30 days)")
+            upcoming = upcoming_charges(series)
+            if upcoming:
+                for charge in upcoming:
+                    st.write(f"📅 **{charge['date'].strftime('%d %b')}** · {charge['label']} ({charge['category']}) · {currency_symbol} {charge['amount']:,.2f}")
+            else:
+                st.write("Nothing due in the next 30 days.")
+
+            st.markdown("#### All Recurring Charges")
+            st.dataframe(pd.DataFrame([
+                {
+                    "Name": item['label'],
+                    "Category": item['category'],
+                    "Every": {"weekly": "Week", "monthly": "Month", "yearly": "Year"}[item['period']],
+                    "Amount": item['amount'],
+                    "Last Charged": item['last_date'],
+                    "Next Charge": item['next_date'],
+                    "Times Seen": item['count']
+                }
+                for item in sorted(active, key=lambda item: item['next_date'])
+            ]), use_container_width=True, hide_index=True)
 
 # Add this function after the transactions_page function
 
-def budget_view(user_id):
+def budget_view(user_id, page_data=None):
     """Display the current budget and spending breakdown"""
-    # Get user data
-    user_doc = db.collection("users").document(user_id).get()
-    user_data = user_doc.to_dict()
+    # Get user data, from the local journal's copy if Firestore is unreachable
+    expense_queue = get_expense_queue(user_id)
+    page_data = page_data or load_page_data(user_id, "budget")
+    user_data = page_data["user"]
+    
+    # Expenses still being written in the background count as saved
+    server_version = user_data.get('expenses_version', 0)
+    user_data = expense_queue.overlay(user_data)
     
     st.markdown("""
     <div class="header-banner">
@@ -840,10 +1056,11 @@ def budget_view(user_id):
     
     # Key metrics
     currency_symbol = user_data.get('currency', '₹ INR').split()[0]
+    show_task_notices(user_id, currency_symbol)
     income = user_data.get('income', 0)
     
     # Get budget allocations
-    budget_allocations = user_data.get('budget_allocations', {})
+    budget_allocations = canonical_amounts(stored_allocations(user_data))
     if not budget_allocations:
         st.warning("You haven't set up a budget yet.")
         if st.button("Create My Budget"):
@@ -851,29 +1068,25 @@ def budget_view(user_id):
             st.rerun()
         return
     
-    # Get recent expenses (current month)
+    # Group this month's expenses by category, journaled ones included
+    now = datetime.now()
+    month_start = datetime(now.year, now.month, 1).date().isoformat()
     try:
-        now = datetime.now()
-        first_day_month = datetime(now.year, now.month, 1).isoformat()
-        
-        expenses_ref = db.collection("users").document(user_id).collection("expenses")
-        month_expenses_query = expenses_ref.where('date', '>=', first_day_month).get()
-        
-        month_expenses = []
-        for doc in month_expenses_query:
-            expense = doc.to_dict()
-            expense['id'] = doc.id
-            month_expenses.append(expense)
-        
-        # Group expenses by category
-        expense_by_category = {}
-        for expense in month_expenses:
-            category = expense.get('category', 'Other')
-            expense_by_category[category] = expense_by_category.get(category, 0) + expense['amount']
+        expenses = expense_queue.expenses(server_version, page_data.get("expenses"))
+        month_expenses = [e for e in expenses if str(e.get('date', ''))[:10] >= month_start]
+        expense_by_category = sum_by_category(month_expenses, user_data.get('currency'))
     except Exception as e:
         st.error(f"Failed to load expenses: {str(e)}")
         expense_by_category = {}
     
+    # Month-end projection per category from past months' spending patterns
+    try:
+        forecast = get_forecaster(user_id, user_data.get('expenses_version', 0), list(budget_allocations), now.date(), user_data.get('currency', '₹ INR'),
+                                  pending=expense_queue.pending_changes()).forecast(now.date())
+    except Exception as e:
+        print(f"Error forecasting spend: {e}")
+        forecast = {}
+    
     # Budget vs Actual comparison
     st.subheader("Monthly Budget Performance")
     
@@ -886,6 +1099,7 @@ def budget_view(user_id):
         spent_amount = expense_by_category.get(category, 0)
         percent_used = (spent_amount / budget_amount * 100) if budget_amount > 0 else 0
         remaining = budget_amount - spent_amount
+        projected_amount = forecast.get(category, {}).get('projected', spent_amount)
         
         total_budget += budget_amount
         total_spent += spent_amount
@@ -895,7 +1109,8 @@ def budget_view(user_id):
             'Budget': budget_amount,
             'Spent': spent_amount,
             'Remaining': remaining,
-            'Percent_Used': percent_used
+            'Percent_Used': percent_used,
+            'Projected': projected_amount
         })
     
     # Sort by percent used (highest first)
@@ -912,14 +1127,17 @@ def budget_view(user_id):
     
     with col3:
         remaining = total_budget - total_spent
-        days_in_month = pd.Timestamp(now.year, now.month + 1, 1) - pd.Timestamp(now.year, now.month, 1)
-        day_of_month = now.day
-        month_progress = day_of_month / days_in_month.days
         
-        # Calculate if spending is on track
-        budget_used_percent = total_spent / total_budget if total_budget > 0 else 0
+        # Projected month-end spend; without a forecast fall back to straight-line pace
+        if forecast:
+            projected_total = sum(item['Projected'] for item in budget_vs_actual)
+        else:
+            month_progress = now.day / calendar.monthrange(now.year, now.month)[1]
+            projected_total = total_spent / month_progress
+        projected_percent = projected_total / total_budget if total_budget > 0 else 0
         
-        if budget_used_percent <= month_progress + 0.05:
+        # Calculate if spending is on track
+        if projected_percent <= 1.05:
             status_delta = "On track 👍"
             delta_color = "normal"
         else:
@@ -928,8 +1146,10 @@ def budget_view(user_id):
         
         st.metric("Remaining Budget", f"{currency_symbol} {remaining:,.0f}", status_delta, delta_color=delta_color)
     
-    # Budget health score (gamification)
-    budget_health = 100 - max(0, min(100, (budget_used_percent - month_progress) * 100 * 2))
+    st.caption(f"Projected month-end spend: {currency_symbol} {projected_total:,.0f} ({projected_percent:.0%} of budget)")
+    
+    # Budget health score (gamification), penalizing projected overspend
+    budget_health = 100 - max(0, min(100, (projected_percent - 1) * 100 * 2))
     
     st.subheader("Budget Health Score")
     
@@ -970,45 +1190,17 @@ def budget_view(user_id):
         # Create plots for visualization
         fig1, fig2 = st.columns([3, 2])
         
+        # Charts of unchanged figures come from the figure cache
+        chart_df = budget_df[['Category', 'Budget', 'Spent']]
+        
         with fig1:
             # Budget vs Actual bar chart
-            fig = px.bar(
-                budget_df,
-                y='Category',
-                x=['Budget', 'Spent'],
-                orientation='h',
-                barmode='group',
-                color_discrete_sequence=['#4361EE', '#FF5E78'],
-                title="Budget vs Actual by Category"
-            )
-            
-            fig.update_layout(
-                margin=dict(l=20, r=20, t=40, b=20),
-                height=400,
-                xaxis_title="Amount",
-                yaxis_title="",
-                legend_title=""
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(cached_figure("budget_vs_actual", chart_df, budget_vs_actual_bar), use_container_width=True)
         
         with fig2:
             # Donut chart for budget distribution
-            fig2 = px.pie(
-                budget_df,
-                values='Budget',
-                names='Category',
-                hole=0.5,
-                color_discrete_sequence=px.colors.qualitative.Pastel,
-                title="Budget Distribution"
-            )
-            
-            fig2.update_layout(
-                margin=dict(l=20, r=20, t=40, b=20),
-                height=400
-            )
-            
-            st.plotly_chart(fig2, use_container_width=True)
+            st.plotly_chart(cached_figure("budget_distribution", chart_df, budget_distribution_pie),
+                            use_container_width=True)
         
         # Category-by-category breakdown with progress bars
         for item in budget_vs_actual:
@@ -1017,12 +1209,13 @@ def budget_view(user_id):
             spent = item['Spent']
             remaining = item['Remaining']
             percent = item['Percent_Used']
+            projected = item['Projected']
             
             # Determine color based on percentage used
             if percent > 100:
                 bar_color = "rgba(255, 0, 0, 0.8)"  # Red for over budget
                 emoji = "🚨"
-            elif percent > 85:
+            elif percent > 85 or projected > budget:
                 bar_color = "rgba(255, 165, 0, 0.8)"  # Orange for close to limit
                 emoji = "⚠️"
             else:
@@ -1041,6 +1234,7 @@ def budget_view(user_id):
                 </div>
                 <div style="display: flex; justify-content: space-between; margin-top: 5px; font-size: 14px;">
                     <span>{percent:.1f}% used</span>
+                    <span>Projected {currency_symbol} {projected:,.0f} by month end</span>
                     <span>{currency_symbol} {remaining:,.0f} remaining</span>
                 </div>
             </div>
@@ -1075,6 +1269,60 @@ def budget_view(user_id):
             st.session_state.page = "transactions"
             st.rerun()
 
+def budget_vs_actual_bar(df):
+    fig = px.bar(
+        df,
+        y='Category',
+        x=['Budget', 'Spent'],
+        orientation='h',
+        barmode='group',
+        color_discrete_sequence=['#4361EE', '#FF5E78'],
+        title="Budget vs Actual by Category"
+    )
+    
+    fig.update_layout(
+        margin=dict(l=20, r=20, t=40, b=20),
+        height=400,
+        xaxis_title="Amount",
+        yaxis_title="",
+        legend_title=""
+    )
+    return fig
+
+def budget_distribution_pie(df):
+    fig = px.pie(
+        df,
+        values='Budget',
+        names='Category',
+        hole=0.5,
+        color_discrete_sequence=px.colors.qualitative.Pastel,
+        title="Budget Distribution"
+    )
+    
+    fig.update_layout(
+        margin=dict(l=20, r=20, t=40, b=20),
+        height=400
+    )
+    return fig
+
+def show_task_notices(user_id, currency_symbol):
+    """Report background work that finished since the last rerun"""
+    expense_queue = get_expense_queue(user_id)
+    if expense_queue.offline:
+        st.warning("📴 Can't reach the server right now. You're seeing your last saved data, and new expenses "
+                   "are kept on this device and saved once the connection is back.")
+    for expense in expense_queue.pop_failures():
+        st.error(f"Couldn't save the {expense.get('category', '')} expense of {expense.get('currency', currency_symbol)} "
+                 f"{expense.get('amount', 0):,.2f} from {expense.get('date', '')[:10]}, so it was removed: {expense['error']}")
+    
+    task = pop_finished("savings_contribution")
+    if task is None:
+        return
+    if task.error:
+        st.error(f"Failed to update savings goals: {task.error}")
+    elif task.result:
+        st.success(f"{currency_symbol} {sum(task.result.values()):,.2f} added to {len(task.result)} savings goal(s)!")
+
 # Add these gamification functions
 
 def update_user_achievements(user_id):
@@ -1141,9 +1389,54 @@ def update_user_achievements(user_id):
         print(f"Error updating achievements: {str(e)}")
         return []
 
+# Seconds each page's reads may take together; pages not listed use PAGE_LOAD_TIMEOUT
+PAGE_LOAD_BUDGETS = {
+    "dashboard": 5,
+    "transactions": 5,
+    "budget": 8,
+    "financial assistant": 5
+}
+
+def load_page_data(user_id, page):
+    """
+    Read everything a page needs from Firestore at once
+    
+    The user document is read once per run for both the sidebar and the
+    page, alongside the page's other independent reads. On the dashboard,
+    transactions and budget pages that is the session's first read of the
+    expense list (ExpenseQueue.prefetch); later runs keep the list up to
+    date from the user document's expenses_version instead. A user document
+    read that fails or runs out of time falls back to the journal's copy.
+    
+    Args:
+        user_id (str): User id
+        page (str): Page name as kept in st.session_state.page
+        
+    Returns:
+        dict: Results by name, always including "user", and the failed reads under "errors"
+    """
+    expense_queue = get_expense_queue(user_id)
+    loaders = {"user": expense_queue.read_user}
+    if page in ("dashboard", "transactions", "budget"):
+        loaders["expenses"] = expense_queue.prefetch
+    
+    results, errors = load_concurrently(loaders, PAGE_LOAD_BUDGETS.get(page, PAGE_LOAD_TIMEOUT))
+    for name, error in errors.items():
+        print(f"Error loading {name} for the {page} page: {str(error)}")
+    if "user" not in results:
+        results["user"] = expense_queue.last_user()
+    results["errors"] = errors
+    return results
+
 # Update the sidebar function to add the Financial Assistant option
 
 def render_sidebar(user_id=None):
+    """
+    Show navigation and progress, and load the chosen page's data
+    
+    Returns:
+        dict: The page's data from load_page_data, or None when signed out
+    """
     if user_id:
         st.sidebar.markdown("""
         <div class="sidebar-header">
@@ -1163,9 +1456,11 @@ def render_sidebar(user_id=None):
         # Footer
         st.sidebar.markdown("---")
         
+        # The page's reads, the user document among them, run together
+        page_data = load_page_data(user_id, st.session_state.page)
+        user_data = page_data["user"]
+        
         # Add achievements and streak counter (gamification)
-        user_doc = db.collection("users").document(user_id).get()
-        user_data = user_doc.to_dict()
         
         # Get streak data (number of consecutive days logged in)
         streak = user_data.get('login_streak', 1)
@@ -1192,36 +1487,33 @@ def render_sidebar(user_id=None):
             st.sidebar.progress(progress)
             st.sidebar.markdown(f"Keep tracking expenses to level up!")
         
+        # Rerun timings and reads per page and fragment, for comparing them
+        if SHOW_RERUN_METRICS:
+            with st.sidebar.expander("⏱️ Rerun Metrics"):
+                st.dataframe(pd.DataFrame([
+                    {"Run": name, "Runs": stats["runs"], "Avg ms": round(stats["avg_ms"], 1),
+                     "Avg reads": round(stats["avg_reads"], 1)}
+                    for name, stats in rerun_metrics().items()
+                ]), hide_index=True, use_container_width=True)
+                figures = get_figure_cache().metrics()
+                st.caption(f"Figure cache: {figures['hit_ratio']:.0%} hits of {figures['hits'] + figures['misses']} lookups, "
+                           f"{figures['entries']} figures in {figures['bytes'] / 1024:,.0f} KB")
+        
         if st.sidebar.button("Logout"):
             st.session_state.authenticated = False
             st.session_state.onboarded = False
             st.rerun()
+        
+        return page_data
 
 # Add this function for the chatbot feature
 
-def financial_assistant(user_id):
-    """AI chatbot assistant that answers questions about user's financial data"""
-    # Get user data
-    user_doc = db.collection("users").document(user_id).get()
-    user_data = user_doc.to_dict()
-    
-    st.markdown("""
-    <div class="header-banner">
-        <h1>💬 Financial Assistant</h1>
-        <p>Ask anything about your finances and budget</p>
-    </div>
-    """, unsafe_allow_html=True)
-    
-    # Initialize chat history in session state if not present
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = [
-            {"role": "assistant", "content": "Hello! I'm your financial assistant powered by Gemini AI. I can answer questions about your income, expenses, budget, and savings. How can I help you today?"}
-        ]
-
+def build_financial_context(user_id, user_data):
+    """Precompute the full financial context used by the non-tool chatbot paths"""
     # Get user financial data for AI context
     currency_symbol = user_data.get('currency', '₹ INR').split()[0]
     income = user_data.get('income', 0)
-    budget_allocations = user_data.get('budget_allocations', {})
+    budget_allocations = canonical_amounts(stored_allocations(user_data))
     savings_goal = user_data.get('savings_goal', None)
     
     # Fetch recent expenses
@@ -1229,20 +1521,11 @@ def financial_assistant(user_id):
         now = datetime.now()
         month_ago = (now - timedelta(days=30)).isoformat()
         
-        expenses_ref = db.collection("users").document(user_id).collection("expenses")
-        recent_expenses_query = expenses_ref.where('date', '>=', month_ago).get()
-        
-        recent_expenses = []
-        for doc in recent_expenses_query:
-            expense = doc.to_dict()
-            recent_expenses.append(expense)
+        recent_expenses = query_expenses(user_id, start_date=month_ago, fields=TOTAL_FIELDS)
             
         # Calculate total expenses and categorize
-        total_expenses = sum(expense['amount'] for expense in recent_expenses)
-        expense_by_category = {}
-        for expense in recent_expenses:
-            category = expense.get('category', 'Other')
-            expense_by_category[category] = expense_by_category.get(category, 0) + expense['amount']
+        total_expenses = sum_amounts(recent_expenses, user_data.get('currency'))
+        expense_by_category = sum_by_category(recent_expenses, user_data.get('currency'))
             
         # Most expensive category
         most_expensive_category = max(expense_by_category.items(), key=lambda x: x[1], default=("None", 0))
@@ -1250,7 +1533,7 @@ def financial_assistant(user_id):
         # Get month to date spending
         first_day_month = datetime(now.year, now.month, 1).isoformat()
         month_expenses = [e for e in recent_expenses if e.get('date', '') >= first_day_month]
-        month_total = sum(expense['amount'] for expense in month_expenses)
+        month_total = sum_amounts(month_expenses, user_data.get('currency'))
         
     except Exception as e:
         recent_expenses = []
@@ -1282,8 +1565,33 @@ def financial_assistant(user_id):
             "savings_goal_progress": (savings_goal.get('current_savings', 0) / savings_goal.get('total_cost', 1)) * 100
         })
     
-    # Display chat messages
-    for message in st.session_state.chat_history:
+    return financial_context
+
+def financial_assistant(user_id, page_data=None):
+    """AI chatbot assistant that answers questions about user's financial data"""
+    # Get user data
+    user_data = page_data["user"] if page_data else get_expense_queue(user_id).read_user()
+    
+    st.markdown("""
+    <div class="header-banner">
+        <h1>💬 Financial Assistant</h1>
+        <p>Ask anything about your finances and budget</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    # Initialize bounded chat memory in session state if not present
+    if "chat_memory" not in st.session_state:
+        st.session_state.chat_memory = ConversationMemory(
+            greeting="Hello! I'm your financial assistant powered by Gemini AI. I can answer questions about your income, expenses, budget, and savings. How can I help you today?"
+        )
+    chat_memory = st.session_state.chat_memory
+
+    # Display a summary of older turns and the recent messages
+    if chat_memory.summary:
+        with st.expander("Earlier in this conversation"):
+            st.text(chat_memory.summary)
+    
+    for message in chat_memory.messages():
         with st.chat_message(message["role"]):
             st.write(message["content"])
 
@@ -1298,25 +1606,36 @@ def financial_assistant(user_id):
     except:
         st.caption("💬 Using built-in assistant")
 
+    use_tools = st.toggle("Look up data on demand", value=True,
+                          help="Let the assistant fetch just the figures each question needs, for any time period")
+    
     # User input
     user_query = st.chat_input("Ask about your finances...")
     
     if user_query:
-        # Add user query to chat history
-        st.session_state.chat_history.append({"role": "user", "content": user_query})
-        
         # Display user message
         with st.chat_message("user"):
             st.write(user_query)
         
-        # Process query and generate response using Gemini (with fallback)
+        # Process query and generate response using Gemini (with fallback),
+        # passing the conversation so far so follow-up questions keep context.
+        # In on-demand mode Gemini fetches only the figures it needs through
+        # tools; the full context is built only if that path fails.
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
-                response = process_query_with_gemini(user_query, financial_context)
+                if use_tools:
+                    response = process_query_with_tools(
+                        user_query, user_id, user_data,
+                        lambda: build_financial_context(user_id, user_data),
+                        chat_memory
+                    )
+                else:
+                    response = process_query_with_gemini(user_query, build_financial_context(user_id, user_data), chat_memory)
                 st.write(response)
                 
-        # Add assistant response to chat history
-        st.session_state.chat_history.append({"role": "assistant", "content": response})
+        # Add both turns to the bounded chat memory
+        chat_memory.add("user", user_query)
+        chat_memory.add("assistant", response)
 
 # Update the main function to include the Financial Assistant page
 
@@ -1336,30 +1655,33 @@ def main():
         last_login = st.session_state.get("last_login_date", None)
         
         if last_login != today:
-            new_achievements = update_user_achievements(st.session_state.user_id)
+            submit_task("achievements", update_user_achievements, st.session_state.user_id)
             st.session_state.last_login_date = today
-            
-            # Show achievement notifications
-            if new_achievements:
-                for achievement in new_achievements:
-                    st.toast(f"🏆 New Achievement: {achievement}!")
         
-        render_sidebar(st.session_state.user_id)
+        # Show achievement notifications once the background check finishes
+        achievements_task = pop_finished("achievements")
+        if achievements_task and achievements_task.result:
+            for achievement in achievements_task.result:
+                st.toast(f"🏆 New Achievement: {achievement}!")
         
-        # Show different pages based on navigation
-        if st.session_state.page == "dashboard":
-            dashboard(st.session_state.user_id)
-        elif st.session_state.page == "budget setup":
-            budget_setup(st.session_state.user_id)
-        elif st.session_state.page == "transactions":
-            transactions_page(st.session_state.user_id)
-        elif st.session_state.page == "budget":
-            budget_view(st.session_state.user_id)
-        elif st.session_state.page == "financial assistant":
-            financial_assistant(st.session_state.user_id)
-        else:
-            st.title(f"🚧 {st.session_state.page.capitalize()} Page")
-            st.write("This page is under construction... coming soon!")
+        # Full reruns are timed per page, named once the sidebar has picked it; fragments time their own reruns
+        with timed(lambda: f"page.{st.session_state.page}"):
+            page_data = render_sidebar(st.session_state.user_id)
+            
+            # Show different pages based on navigation
+            if st.session_state.page == "dashboard":
+                dashboard(st.session_state.user_id, page_data)
+            elif st.session_state.page == "budget setup":
+                budget_setup(st.session_state.user_id, page_data["user"])
+            elif st.session_state.page == "transactions":
+                transactions_page(st.session_state.user_id, page_data)
+            elif st.session_state.page == "budget":
+                budget_view(st.session_state.user_id, page_data)
+            elif st.session_state.page == "financial assistant":
+                financial_assistant(st.session_state.user_id, page_data)
+            else:
+                st.title(f"🚧 {st.session_state.page.capitalize()} Page")
+                st.write("This page is under construction... coming soon!")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,109 @@
+"""
+One-off migration of stored amounts to integer minor units.
+
+Adds `amount_minor` to every expense that lacks it and
+`budget_allocations_minor` to every user with a float-only budget, using
+each user's currency exponent. The float fields are rewritten to the
+rounded values so both representations agree. Already migrated documents
+are skipped, so the script can be rerun safely after an interruption.
+
+Usage:
+    python migrate_money.py --dry-run
+    python migrate_money.py --page-size 50
+"""
+import argparse
+import time
+
+from data_layer import expenses_ref, iter_user_pages, user_ref
+from money import allocation_fields, amount_fields
+from shared import db
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+
+class BatchWriter:
+    """
+    Collects updates into Firestore write batches of at most MAX_BATCH_WRITES
+
+    Args:
+        dry_run (bool): Count updates without writing them
+    """
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.batch = None
+        self.pending = 0
+        self.written = 0
+
+    def update(self, ref, fields):
+        if self.dry_run:
+            self.written += 1
+            return
+        if self.batch is None:
+            self.batch = db.batch()
+        self.batch.update(ref, fields)
+        self.pending += 1
+        if self.pending >= MAX_BATCH_WRITES:
+            self.flush()
+
+    def flush(self):
+        if self.batch is not None and self.pending:
+            self.batch.commit()
+            self.written += self.pending
+        self.batch = None
+        self.pending = 0
+
+
+def migrate_user(user_id, user_data, writer):
+    """
+    Queue the minor-unit fields missing from one user's documents
+
+    Returns:
+        tuple: (expenses converted, whether the budget was converted)
+    """
+    currency = user_data.get("currency")
+    expenses = 0
+    for doc in expenses_ref(user_id).stream():
+        expense = doc.to_dict() or {}
+        if expense.get("amount_minor") is not None:
+            continue
+        writer.update(doc.reference, amount_fields(expense.get("amount", 0), currency))
+        expenses += 1
+
+    allocations = user_data.get("budget_allocations")
+    budget = bool(allocations) and not user_data.get("budget_allocations_minor")
+    if budget:
+        writer.update(user_ref(user_id), allocation_fields(allocations, currency))
+    return expenses, budget
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert stored amounts to integer minor units")
+    parser.add_argument("--page-size", type=int, default=100, help="Users read per query")
+    parser.add_argument("--dry-run", action="store_true", help="Count what would change without writing")
+    args = parser.parse_args()
+
+    writer = BatchWriter(dry_run=args.dry_run)
+    started = time.perf_counter()
+    users = expenses = budgets = failed = 0
+    for page in iter_user_pages(page_size=args.page_size):
+        for user_id, user_data in page:
+            users += 1
+            try:
+                converted, budget = migrate_user(user_id, user_data, writer)
+                expenses += converted
+                budgets += budget
+            except Exception as e:
+                failed += 1
+                print(f"Error migrating user {user_id}: {str(e)}")
+        writer.flush()
+        print(f"{users} users scanned, {expenses} expenses and {budgets} budgets converted")
+
+    action = "Would convert" if args.dry_run else "Converted"
+    print(f"{action} {expenses} expenses and {budgets} budgets across {users} users "
+          f"in {time.perf_counter() - started:.1f}s ({failed} failed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Money as integer minor units.
+
+Amounts are held as whole minor units (paise, cents) in Python ints and
+int64 arrays, scaled by the currency's exponent, so totals are exact
+instead of accumulating float rounding error. Expenses store the integer
+under `amount_minor` next to the display `amount`, and budgets store
+`budget_allocations_minor` next to `budget_allocations`. Readers prefer the
+integer fields and fall back to the floats for documents written before
+migrate_money.py ran.
+
+An expense may carry its own `currency`; it is then stored in that
+currency's minor units and converted to the user's base currency with the
+FX table when aggregated.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+
+from fx import daily_rate, get_fx_table
+
+DEFAULT_CURRENCY = "INR"
+
+# ISO 4217 minor unit exponents; currencies not listed use 2
+CURRENCY_EXPONENTS = {
+    "INR": 2, "USD": 2, "EUR": 2, "GBP": 2, "AUD": 2, "CAD": 2, "SGD": 2, "AED": 2, "CHF": 2, "CNY": 2,
+    "JPY": 0, "KRW": 0, "VND": 0, "IDR": 2,
+    "BHD": 3, "KWD": 3, "OMR": 3
+}
+
+
+def currency_code(currency):
+    """ISO code from a stored currency such as "₹ INR" or "INR" """
+    parts = str(currency or "").split()
+    return parts[-1].upper() if parts else DEFAULT_CURRENCY
+
+
+def minor_per_unit(currency=DEFAULT_CURRENCY):
+    """Minor units in one unit of a currency (100 for INR, 1 for JPY)"""
+    return 10 ** CURRENCY_EXPONENTS.get(currency_code(currency), 2)
+
+
+def to_minor(amount, currency=DEFAULT_CURRENCY):
+    """Amount in major units to integer minor units, rounding half up"""
+    exponent = CURRENCY_EXPONENTS.get(currency_code(currency), 2)
+    return int(Decimal(str(amount or 0)).scaleb(exponent).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor(minor, currency=DEFAULT_CURRENCY):
+    """Integer minor units to a float amount in major units"""
+    return minor / minor_per_unit(currency)
+
+
+class Money:
+    """
+    An exact amount of one currency
+
+    Args:
+        minor (int): Amount in minor units
+        currency (str): Currency code or stored currency string
+    """
+
+    __slots__ = ("minor", "currency")
+
+    def __init__(self, minor, currency=DEFAULT_CURRENCY):
+        self.minor = int(minor)
+        self.currency = currency_code(currency)
+
+    @classmethod
+    def of(cls, amount, currency=DEFAULT_CURRENCY):
+        """Money from an amount in major units"""
+        return cls(to_minor(amount, currency), currency)
+
+    @property
+    def amount(self):
+        return from_minor(self.minor, self.currency)
+
+    def _check(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        if other.currency != self.currency:
+            raise ValueError(f"Cannot combine {self.currency} and {other.currency} amounts")
+        return other
+
+    def __add__(self, other):
+        other = self._check(other)
+        if other is NotImplemented:
+            return other
+        return Money(self.minor + other.minor, self.currency)
+
+    def __radd__(self, other):
+        # Lets sum() start from 0
+        if other == 0:
+            return self
+        return self.__add__(other)
+
+    def __sub__(self, other):
+        other = self._check(other)
+        if other is NotImplemented:
+            return other
+        return Money(self.minor - other.minor, self.currency)
+
+    def __neg__(self):
+        return Money(-self.minor, self.currency)
+
+    def __eq__(self, other):
+        return isinstance(other, Money) and (self.minor, self.currency) == (other.minor, other.currency)
+
+    def __lt__(self, other):
+        other = self._check(other)
+        if other is NotImplemented:
+            return other
+        return self.minor < other.minor
+
+    def __hash__(self):
+        return hash((self.minor, self.currency))
+
+    def __repr__(self):
+        return f"Money({self.amount:.{CURRENCY_EXPONENTS.get(self.currency, 2)}f} {self.currency})"
+
+    def format(self, symbol=None):
+        """Display string such as "₹ 1,234.50" """
+        exponent = CURRENCY_EXPONENTS.get(self.currency, 2)
+        return f"{symbol or self.currency} {self.amount:,.{exponent}f}"
+
+
+def expense_currency(expense, base=DEFAULT_CURRENCY):
+    """ISO code of the currency an expense was recorded in"""
+    return currency_code(expense.get("currency") or base)
+
+
+def expense_minor(expense, currency=DEFAULT_CURRENCY):
+    """
+    An expense's amount in minor units of its own currency, from amount_minor when stored
+
+    Args:
+        expense (dict): Expense document
+        currency (str): Base currency, used when the expense has no currency of its own
+    """
+    minor = expense.get("amount_minor")
+    if minor is not None:
+        return int(minor)
+    return to_minor(expense.get("amount", 0), expense_currency(expense, currency))
+
+
+def convert_minor(minor, currency_codes, currencies, dates, base=DEFAULT_CURRENCY):
+    """
+    Convert minor-unit amounts in mixed currencies to the base currency
+
+    Each foreign currency present is converted in one vectorized step using
+    its rates on the expenses' dates.
+
+    Args:
+        minor (np.ndarray): int64 amounts in minor units of their own currency
+        currency_codes (np.ndarray): Index into currencies for each amount
+        currencies (list): ISO codes
+        dates (np.ndarray): datetime64[D] expense dates
+        base (str): Currency to convert to
+
+    Returns:
+        np.ndarray: int64 amounts in base currency minor units
+    """
+    base = currency_code(base)
+    converted = np.asarray(minor, dtype=np.int64)
+    for code, currency in enumerate(currencies):
+        if currency == base:
+            continue
+        mask = currency_codes == code
+        if not mask.any():
+            continue
+        try:
+            factors = get_fx_table().factors(currency, base, dates[mask])
+        except KeyError as e:
+            print(f"Error converting {currency} amounts: {str(e)}")
+            continue
+        scale = minor_per_unit(base) / minor_per_unit(currency)
+        if converted is minor:
+            converted = converted.copy()
+        converted[mask] = np.rint(converted[mask] * factors * scale).astype(np.int64)
+    return converted
+
+
+def minor_array(expenses, currency=DEFAULT_CURRENCY):
+    """int64 array of the expenses' amounts in minor units of the base currency"""
+    minor, codes, currencies, dates = [], [], {}, []
+    for expense in expenses:
+        minor.append(expense_minor(expense, currency))
+        codes.append(currencies.setdefault(expense_currency(expense, currency), len(currencies)))
+        dates.append(str(expense.get("date", ""))[:10])
+    minor = np.array(minor, dtype=np.int64)
+    if set(currencies) <= {currency_code(currency)}:
+        return minor
+    return convert_minor(minor, np.array(codes), list(currencies),
+                         np.array([_day(d) for d in dates], dtype="datetime64[D]"), currency)
+
+
+def _day(text):
+    try:
+        return np.datetime64(text, "D")
+    except ValueError:
+        return np.datetime64("NaT")
+
+
+def sum_amounts(expenses, currency=DEFAULT_CURRENCY):
+    """Exact total of the expenses' amounts in the base currency, in major units"""
+    return from_minor(int(minor_array(expenses, currency).sum()), currency)
+
+
+def currency_choices(base=DEFAULT_CURRENCY):
+    """Currencies an expense can be recorded in, the base currency first"""
+    base = currency_code(base)
+    return [base] + [currency for currency in get_fx_table().currencies if currency != base]
+
+
+def base_amount(expense, currency=DEFAULT_CURRENCY):
+    """One expense's amount in the base currency, converted at its date's rate"""
+    source = expense_currency(expense, currency)
+    minor = expense_minor(expense, currency)
+    base = currency_code(currency)
+    if source != base:
+        try:
+            factor = daily_rate(source, base, str(expense.get("date", ""))[:10] or "1970-01-01")
+            minor = round(minor * factor * minor_per_unit(base) / minor_per_unit(source))
+        except (KeyError, ValueError) as e:
+            print(f"Error converting {source} amount: {str(e)}")
+    return from_minor(minor, base)
+
+
+def amount_fields(amount, currency=DEFAULT_CURRENCY):
+    """Expense fields for an amount: exact amount_minor and the matching display amount"""
+    minor = to_minor(amount, currency)
+    return {"amount": from_minor(minor, currency), "amount_minor": minor}
+
+
+def allocation_fields(allocations, currency=DEFAULT_CURRENCY):
+    """User document fields for a budget: budget_allocations and budget_allocations_minor"""
+    minor = {category: to_minor(amount, currency) for category, amount in allocations.items()}
+    return {
+        "budget_allocations": {category: from_minor(value, currency) for category, value in minor.items()},
+        "budget_allocations_minor": minor
+    }
+
+
+def stored_allocations(user_data):
+    """A user's budget allocations in major units, from the exact minor map when stored"""
+    minor = user_data.get("budget_allocations_minor")
+    if minor:
+        currency = user_data.get("currency", DEFAULT_CURRENCY)
+        return {category: from_minor(value, currency) for category, value in minor.items()}
+    return user_data.get("budget_allocations", {})
@@ -2,6 +2,9 @@ import streamlit as st
 from firebase_admin import firestore
 from shared import db
 from datetime import datetime, timedelta
+from allocation_engine import DEFAULT_GROUP_WEIGHTS, allocate, goal_group_weights
+from money import allocation_fields
+from category_registry import ONBOARDING_LABELS, canonical_categories
 
 def onboarding_screen(user_id=None):
     if user_id is None:
@@ -85,19 +88,7 @@ def onboarding_screen(user_id=None):
             st.markdown("Select spending categories relevant to your lifestyle:")
 
             # Suggested categories list
-            all_categories = [
-                "🏠 Essentials (Rent, Utilities)", 
-                "🚌 Transportation",
-                "🍔 Food & Dining",
-                "🎬 Entertainment",
-                "🛍️ Shopping",
-                "💊 Health",
-                "📚 Education",
-                "📱 Subscriptions",
-                "💸 Investments",
-                "🎁 Gifts & Donations",
-                "✈️ Travel"
-            ]
+            all_categories = ONBOARDING_LABELS
 
             # You can customize this list dynamically based on st.session_state.user_type too
             default_selection = all_categories[:4]
@@ -133,10 +124,7 @@ def onboarding_screen(user_id=None):
         
         # Get categories from session state
         categories = st.session_state.get("categories", [])
-        clean_categories = [cat.split(" ", 1)[1] if " " in cat else cat for cat in categories]
-        
-        if not clean_categories:
-            clean_categories = ["Essentials", "Lifestyle", "Savings & Investments", "Debt & EMIs", "Other / Subscriptions"]
+        clean_categories = canonical_categories(categories)
         
         st.write("Based on your selected categories, we'll help you create a balanced budget.")
         
@@ -149,75 +137,9 @@ def onboarding_screen(user_id=None):
         if setup_option == "Quick Setup (50/30/20 rule)":
             st.write("The 50/30/20 rule suggests spending 50% on needs, 30% on wants, and 20% on savings.")
             
-            # Classify user categories
-            essentials = []
-            lifestyle = []
-            savings = []
-            debt = []
-            other = []
-            
-            # Category classification dictionary
-            category_types = {
-                "Essentials": ["Essentials", "Food & Dining", "Transportation", "Health"],
-                "Lifestyle": ["Lifestyle", "Entertainment", "Shopping", "Travel"],
-                "Savings": ["Savings & Investments", "Investments"],
-                "Debt": ["Debt & EMIs"],
-                "Other": ["Other / Subscriptions", "Subscriptions", "Education", "Gifts & Donations"]
-            }
-            
-            # Simple category sorting logic
-            for cat in clean_categories:
-                if cat in category_types["Essentials"]:
-                    essentials.append(cat)
-                elif cat in category_types["Lifestyle"]:
-                    lifestyle.append(cat)
-                elif cat in category_types["Savings"]:
-                    savings.append(cat)
-                elif cat in category_types["Debt"]:
-                    debt.append(cat)
-                else:
-                    other.append(cat)
-            
             # Calculate budget allocations
             income = st.session_state.get("income", 0)
-            budget_allocations = {}
-            
-            # Distribute essentials (50%)
-            if essentials:
-                per_essential = (income * 0.5) / len(essentials)
-                for cat in essentials:
-                    budget_allocations[cat] = per_essential
-                    
-            # Distribute lifestyle (30%)
-            if lifestyle:
-                per_lifestyle = (income * 0.3) / len(lifestyle)
-                for cat in lifestyle:
-                    budget_allocations[cat] = per_lifestyle
-                    
-            # Distribute savings (15%)
-            if savings:
-                per_savings = (income * 0.15) / len(savings)
-                for cat in savings:
-                    budget_allocations[cat] = per_savings
-                    
-            # Distribute debt (5%)
-            if debt:
-                per_debt = (income * 0.05) / len(debt)
-                for cat in debt:
-                    budget_allocations[cat] = per_debt
-                    
-            # Distribute other
-            if other:
-                remaining = income - sum(budget_allocations.values())
-                per_other = max(0, remaining) / len(other)
-                for cat in other:
-                    budget_allocations[cat] = per_other
-            
-            # Ensure all categories are covered
-            for cat in clean_categories:
-                if cat not in budget_allocations:
-                    # Allocate a small default amount for any missing categories
-                    budget_allocations[cat] = income * 0.05
+            budget_allocations = allocate(income, clean_categories, DEFAULT_GROUP_WEIGHTS)
             
             # Display budget distribution
             currency = st.session_state.get("currency", "₹ INR").split()[0]
@@ -251,7 +173,7 @@ def onboarding_screen(user_id=None):
                         "income": st.session_state.get("income", 0),
                         "currency": st.session_state.get("currency", "₹ INR"),
                         "categories": st.session_state.get("categories", []),
-                        "budget_allocations": budget_allocations,
+                        **allocation_fields(budget_allocations, st.session_state.get("currency", "₹ INR")),
                         "profile_set": True,
                         "onboarding_completed_at": firestore.SERVER_TIMESTAMP
                     }
@@ -300,113 +222,12 @@ def onboarding_screen(user_id=None):
             
             if st.button("Generate Budget Plan"):
                 with st.spinner("Creating your personalized budget plan..."):
-                    # Classify user categories
-                    essentials = []
-                    lifestyle = []
-                    savings = []
-                    debt = []
-                    other = []
-                    
-                    # Category classification dictionary
-                    category_types = {
-                        "Essentials": ["Essentials", "Food & Dining", "Transportation", "Health"],
-                        "Lifestyle": ["Lifestyle", "Entertainment", "Shopping", "Travel"],
-                        "Savings": ["Savings & Investments", "Investments"],
-                        "Debt": ["Debt & EMIs"],
-                        "Other": ["Other / Subscriptions", "Subscriptions", "Education", "Gifts & Donations"]
-                    }
-                    
-                    # Sort categories
-                    for cat in clean_categories:
-                        if cat in category_types["Essentials"]:
-                            essentials.append(cat)
-                        elif cat in category_types["Lifestyle"]:
-                            lifestyle.append(cat)
-                        elif cat in category_types["Savings"]:
-                            savings.append(cat)
-                        elif cat in category_types["Debt"]:
-                            debt.append(cat)
-                        else:
-                            other.append(cat)
-                    
-                    # Calculate budget allocations based on user preferences
                     income = st.session_state.get("income", 0)
-                    budget_allocations = {}
-                    
-                    # Adjust percentages based on goals and preferences
-                    if has_debt:
-                        essentials_pct = 45
-                        lifestyle_pct = 20
-                        savings_pct = saving_preference
-                        debt_pct = 25
-                        other_pct = 10 - (saving_preference - 10) if saving_preference > 10 else 10
-                    elif financial_goal in ["Save for emergency fund", "Save for major purchase"]:
-                        essentials_pct = 50
-                        lifestyle_pct = 30 - (saving_preference - 10) if saving_preference > 10 else 30
-                        savings_pct = saving_preference
-                        debt_pct = 5
-                        other_pct = 5
-                    elif financial_goal == "Build long-term wealth":
-                        essentials_pct = 45
-                        lifestyle_pct = 25
-                        savings_pct = saving_preference
-                        debt_pct = 5
-                        other_pct = 100 - (essentials_pct + lifestyle_pct + savings_pct + debt_pct)
-                    else:  # Enjoy life or balanced
-                        essentials_pct = 50
-                        lifestyle_pct = 35
-                        savings_pct = saving_preference
-                        debt_pct = 5
-                        other_pct = 100 - (essentials_pct + lifestyle_pct + savings_pct + debt_pct)
-                        
-                    # Normalize to 100%
-                    total = essentials_pct + lifestyle_pct + savings_pct + debt_pct + other_pct
-                    if total != 100:
-                        factor = 100 / total
-                        essentials_pct *= factor
-                        lifestyle_pct *= factor
-                        savings_pct *= factor
-                        debt_pct *= factor
-                        other_pct *= factor
-                    
-                    # Distribute essentials
-                    if essentials:
-                        per_essential = (income * essentials_pct/100) / len(essentials)
-                        for cat in essentials:
-                            budget_allocations[cat] = per_essential
-                            
-                    # Distribute lifestyle
-                    if lifestyle:
-                        per_lifestyle = (income * lifestyle_pct/100) / len(lifestyle)
-                        for cat in lifestyle:
-                            budget_allocations[cat] = per_lifestyle
-                            
-                    # Distribute savings
-                    if savings:
-                        per_savings = (income * savings_pct/100) / len(savings)
-                        for cat in savings:
-                            budget_allocations[cat] = per_savings
-                            
-                    # Distribute debt
-                    if debt:
-                        per_debt = (income * debt_pct/100) / len(debt)
-                        for cat in debt:
-                            budget_allocations[cat] = per_debt
-                            
-                    # Distribute other
-                    if other:
-                        per_other = (income * other_pct/100) / len(other)
-                        for cat in other:
-                            budget_allocations[cat] = per_other
-                    
-                    # Ensure all categories are covered
-                    for cat in clean_categories:
-                        if cat not in budget_allocations:
-                            # Allocate a small default amount for any missing categories
-                            budget_allocations[cat] = income * 0.05
+                    group_weights = goal_group_weights(financial_goal, saving_preference, has_debt)
                     
                     # Create savings goal if applicable
                     savings_goal = None
+                    goal_contribution = 0
                     if is_saving_for_purchase and purchase_item and purchase_amount > 0 and purchase_deadline:
                         days_until = (purchase_deadline - datetime.now().date()).days
                         months_until = max(1, round(days_until / 30))
@@ -427,20 +248,12 @@ def onboarding_screen(user_id=None):
                             "percentage_of_income": percentage_of_income
                         }
                         
-                        # If user has savings category and goal is realistic, adjust budget
-                        if savings and is_realistic:
-                            # Ensure savings category has enough for the monthly goal amount
-                            savings_cat = savings[0]  # Use first savings category
-                            if budget_allocations[savings_cat] < monthly_amount:
-                                # Take proportionally from lifestyle categories
-                                shortfall = monthly_amount - budget_allocations[savings_cat]
-                                
-                                if lifestyle:
-                                    reduction_per_cat = shortfall / len(lifestyle)
-                                    for cat in lifestyle:
-                                        budget_allocations[cat] = max(0, budget_allocations[cat] - reduction_per_cat)
-                                
-                                budget_allocations[savings_cat] = monthly_amount
+                        # Fund a realistic goal from lifestyle categories
+                        if is_realistic:
+                            goal_contribution = monthly_amount
+                    
+                    budget_allocations = allocate(income, clean_categories, group_weights,
+                                                  goal_contribution=goal_contribution)
                     
                     # Display the AI-generated budget
                     st.success("Budget plan generated!")
@@ -494,7 +307,7 @@ def onboarding_screen(user_id=None):
                                 "income": st.session_state.get("income", 0),
                                 "currency": st.session_state.get("currency", "₹ INR"),
                                 "categories": st.session_state.get("categories", []),
-                                "budget_allocations": budget_allocations,
+                                **allocation_fields(budget_allocations, st.session_state.get("currency", "₹ INR")),
                                 "profile_set": True,
                                 "onboarding_completed_at": firestore.SERVER_TIMESTAMP
                             }
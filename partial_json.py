@@ -0,0 +1,165 @@
+"""
+Tolerant, incremental JSON parsing for model output.
+
+Model responses can arrive wrapped in markdown fences, with chatter around the
+object, or cut off mid-way (max tokens reached, stream dropped). Instead of
+throwing the whole generation away, IncrementalJSONParser scans the text once,
+remembers the last point where everything seen so far formed complete values,
+and closes any open objects/arrays from there.
+"""
+import json
+
+_WHITESPACE = " \t\r\n"
+
+
+class _Frame:
+    """An open object or array on the parser stack"""
+
+    __slots__ = ("kind", "expect")
+
+    def __init__(self, kind):
+        self.kind = kind
+        # Objects: key -> colon -> value -> comma; arrays: value -> comma
+        self.expect = "key" if kind == "{" else "value"
+
+
+class IncrementalJSONParser:
+    """
+    Feed text chunks as they arrive and read the best-effort object at any time
+
+    Each character is scanned once, so feeding a streamed response chunk by
+    chunk costs the same as parsing it in one go.
+
+    Example:
+        parser = IncrementalJSONParser()
+        for chunk in stream:
+            parser.feed(chunk)
+        data = parser.result()
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._length = 0
+        self._started = False
+        self._done = False
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_is_key = False
+        self._in_primitive = False
+        self._safe_end = None
+        self._safe_closers = ""
+        self.truncated = False
+
+    def feed(self, chunk):
+        """Scan another piece of the response"""
+        if self._done or not chunk:
+            return self
+
+        if not self._started:
+            start = chunk.find("{")
+            if start < 0:
+                return self
+            chunk = chunk[start:]
+            self._started = True
+
+        base = self._length
+        self._buffer.append(chunk)
+        self._length += len(chunk)
+
+        for offset, char in enumerate(chunk):
+            self._scan(char, base + offset)
+            if self._done:
+                break
+        return self
+
+    def _scan(self, char, index):
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if self._string_is_key:
+                    self._stack[-1].expect = "colon"
+                else:
+                    self._value_complete(index + 1)
+            return
+
+        if self._in_primitive:
+            if char in _WHITESPACE or char in ",}]":
+                self._in_primitive = False
+                self._value_complete(index)
+            else:
+                return
+
+        if char in _WHITESPACE:
+            return
+
+        top = self._stack[-1] if self._stack else None
+
+        if char == '"':
+            self._in_string = True
+            self._string_is_key = top is not None and top.kind == "{" and top.expect == "key"
+        elif char in "{[":
+            self._stack.append(_Frame(char))
+            # An empty container is a valid place to cut
+            self._mark_safe(index + 1)
+        elif char in "}]":
+            if self._stack:
+                self._stack.pop()
+            self._value_complete(index + 1)
+        elif char == ":":
+            if top is not None:
+                top.expect = "value"
+        elif char == ",":
+            if top is not None:
+                top.expect = "key" if top.kind == "{" else "value"
+        else:
+            # Start of a number, true, false or null
+            self._in_primitive = True
+
+    def _value_complete(self, end):
+        if not self._stack:
+            self._safe_end = end
+            self._safe_closers = ""
+            self._done = True
+            return
+        self._stack[-1].expect = "comma"
+        self._mark_safe(end)
+
+    def _mark_safe(self, end):
+        self._safe_end = end
+        self._safe_closers = "".join("}" if frame.kind == "{" else "]" for frame in reversed(self._stack))
+
+    def result(self):
+        """
+        Best-effort parse of everything fed so far
+
+        Returns:
+            dict or list: The complete value, or the salvaged prefix with open
+                          containers closed; None if nothing usable was seen
+        """
+        if self._safe_end is None:
+            return None
+
+        text = "".join(self._buffer)
+        self.truncated = not self._done
+        candidate = text[:self._safe_end] + self._safe_closers
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            return None
+
+
+def parse_partial_json(text):
+    """
+    Parse the first JSON object in text, salvaging truncated output
+
+    Returns:
+        dict or None: Parsed (possibly partial) object
+    """
+    if not text:
+        return None
+    return IncrementalJSONParser().feed(text).result()
@@ -0,0 +1,220 @@
+"""
+Token-budgeted prompt assembly with size metering.
+
+Prompts are declared as named sections. Required sections are always kept;
+optional ones are ranked by relevance to the user's query and either kept
+whole, condensed to their most relevant lines, or dropped so the final
+prompt fits a per-call token budget. Every built prompt is metered so cost
+and latency can be tracked against prompt length.
+"""
+import math
+import re
+import time
+from collections import deque
+
+# Rough size of a token for English text, good enough for budgeting prompts
+CHARS_PER_TOKEN = 4
+
+# Most recent prompt size records, newest last
+PROMPT_SIZE_LOG = deque(maxlen=500)
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = {
+    "the", "and", "for", "you", "your", "are", "was", "what", "how", "much", "did",
+    "can", "this", "that", "with", "have", "has", "about", "from", "into", "any", "all"
+}
+
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in text"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def query_terms(text):
+    """Lowercased content words of text used for relevance matching"""
+    return {word for word in _WORD.findall((text or "").lower()) if len(word) > 2 and word not in _STOP_WORDS}
+
+
+def log_prompt_size(report):
+    """
+    Record and print the size of an emitted prompt
+
+    Args:
+        report (dict): Report produced by PromptBuilder.build
+    """
+    PROMPT_SIZE_LOG.append(report)
+    print(
+        f"[prompt] {report['name']}: {report['tokens']}/{report['budget']} tokens "
+        f"({report['chars']:,} chars), condensed={report['condensed']}, dropped={report['dropped']}"
+    )
+
+
+def prompt_size_stats(name=None):
+    """
+    Summarize recorded prompt sizes
+
+    Args:
+        name (str): Only include prompts with this name
+
+    Returns:
+        dict: count, mean, p95 and max of the estimated tokens
+    """
+    sizes = sorted(r["tokens"] for r in PROMPT_SIZE_LOG if name is None or r["name"] == name)
+    if not sizes:
+        return {"count": 0, "mean": 0, "p95": 0, "max": 0}
+    return {
+        "count": len(sizes),
+        "mean": sum(sizes) / len(sizes),
+        "p95": sizes[min(len(sizes) - 1, int(len(sizes) * 0.95))],
+        "max": sizes[-1]
+    }
+
+
+class PromptSection:
+    """A named block of prompt lines"""
+
+    def __init__(self, key, lines, header=None, keywords=(), priority=0, required=False, overflow=None):
+        self.key = key
+        self.lines = [line for line in lines if line is not None]
+        self.header = header
+        self.keywords = {k.lower() for k in keywords}
+        self.priority = priority
+        self.required = required
+        self.overflow = overflow
+
+    def render(self, lines=None):
+        lines = self.lines if lines is None else lines
+        body = "\n".join(lines)
+        return f"{self.header}\n{body}" if self.header else body
+
+    def relevance(self, terms):
+        text_terms = query_terms(" ".join(self.lines))
+        return self.priority + 2 * len(terms & self.keywords) + len(terms & text_terms)
+
+
+class PromptBuilder:
+    """
+    Assemble a prompt from sections within a token budget
+
+    Args:
+        name (str): Name the prompt is metered under
+        token_budget (int): Maximum estimated tokens for the whole prompt
+    """
+
+    def __init__(self, name, token_budget):
+        self.name = name
+        self.token_budget = token_budget
+        self.sections = []
+
+    def add_section(self, key, lines, header=None, keywords=(), priority=0, required=False, overflow=None):
+        """
+        Add a section to the prompt
+
+        Args:
+            key (str): Section name used in size reports
+            lines (list or str): Section content, one entry per line
+            header (str): Optional heading rendered above the lines
+            keywords (iterable): Query words that make this section relevant
+            priority (int): Base relevance score
+            required (bool): Always include the section in full
+            overflow (callable): Given the indices of omitted lines, returns a
+                                 single line summarizing them
+        """
+        if isinstance(lines, str):
+            lines = lines.split("\n")
+        self.sections.append(PromptSection(key, lines, header, keywords, priority, required, overflow))
+        return self
+
+    def build(self, query=""):
+        """
+        Render the prompt and meter its size
+
+        Args:
+            query (str): User question used to rank optional sections and lines
+
+        Returns:
+            str: The assembled prompt
+        """
+        terms = query_terms(query)
+        rendered = {}
+        condensed = []
+        dropped = []
+        used = 0
+
+        # Sections are joined by a blank line
+        separator_cost = 1
+
+        for section in self.sections:
+            if section.required:
+                rendered[section.key] = section.render()
+                used += estimate_tokens(rendered[section.key]) + separator_cost
+
+        optional = [s for s in self.sections if not s.required and s.lines]
+        optional.sort(key=lambda s: s.relevance(terms), reverse=True)
+
+        for section in optional:
+            remaining = self.token_budget - used
+            full_text = section.render()
+            full_cost = estimate_tokens(full_text) + separator_cost
+            if full_cost <= remaining:
+                rendered[section.key] = full_text
+                used += full_cost
+                continue
+
+            text = self._condense(section, terms, remaining - separator_cost)
+            if text is None:
+                dropped.append(section.key)
+                continue
+            rendered[section.key] = text
+            used += estimate_tokens(text) + separator_cost
+            condensed.append(section.key)
+
+        prompt = "\n\n".join(rendered[s.key] for s in self.sections if s.key in rendered)
+        log_prompt_size({
+            "name": self.name,
+            "time": time.time(),
+            "chars": len(prompt),
+            "tokens": estimate_tokens(prompt),
+            "budget": self.token_budget,
+            "condensed": condensed,
+            "dropped": dropped
+        })
+        return prompt
+
+    def _condense(self, section, terms, budget):
+        """Keep the most relevant lines of a section that fit in budget tokens"""
+        header_cost = estimate_tokens(section.header) + 1 if section.header else 0
+        if budget <= header_cost:
+            return None
+
+        # Lines mentioning the query come first; ties keep their original order
+        ranked = sorted(
+            range(len(section.lines)),
+            key=lambda i: len(terms & query_terms(section.lines[i])),
+            reverse=True
+        )
+
+        # Reserve room for the overflow line; its length barely depends on what was cut
+        overflow_reserve = 0
+        if section.overflow:
+            overflow_reserve = estimate_tokens(section.overflow(list(range(len(section.lines))))) + 1
+
+        kept = set()
+        used = header_cost + overflow_reserve
+        for index in ranked:
+            cost = estimate_tokens(section.lines[index]) + 1
+            if used + cost > budget:
+                continue
+            kept.add(index)
+            used += cost
+
+        if not kept:
+            return None
+
+        lines = [section.lines[i] for i in sorted(kept)]
+        omitted = [i for i in range(len(section.lines)) if i not in kept]
+        if omitted and section.overflow:
+            lines.append(section.overflow(omitted))
+        return section.render(lines)
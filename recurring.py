@@ -0,0 +1,291 @@
+"""
+Recurring transaction and subscription detection.
+
+Expenses are grouped by payee (normalized notes), category and amount, then
+each group is checked for a regular weekly, monthly or yearly rhythm. Both
+steps are sort-and-sweep passes over ExpenseFrame columns:
+
+1. sort by (payee, category, amount) and start a new cluster wherever the
+   payee or category changes or the amount jumps by more than
+   AMOUNT_TOLERANCE
+2. sort by (cluster, date) and take the gaps between neighbours; a cluster
+   is a series when its median gap and most of its gaps fit a period
+
+Expenses without notes only form a series when every amount in the
+cluster is within AMOUNT_TOLERANCE of the others, such as rent with no
+description. Otherwise ordinary regular spending, like weekly groceries,
+would chain into one cluster and be reported as a subscription.
+
+Detected series are persisted on the user document under
+`recurring_series`, tagged with the `expenses_version` they were detected
+at. The write runs as a background task, off the page render. New
+expenses extend a matching series in place; deletes and periodic
+refreshes rerun the full detection.
+"""
+import hashlib
+from datetime import date, timedelta
+
+import numpy as np
+from firebase_admin import firestore
+
+from data_layer import FRAME_FIELDS, ExpenseFrame, note_key, query_expenses, user_ref
+from money import DEFAULT_CURRENCY
+from savings_projection import add_months
+from task_executor import submit_task
+
+# days: typical gap, tolerance: allowed deviation in days, min_count: occurrences needed
+PERIODS = {
+    "weekly": {"days": 7, "tolerance": 2, "min_count": 4},
+    "monthly": {"days": 30.44, "tolerance": 4, "min_count": 3},
+    "yearly": {"days": 365.25, "tolerance": 12, "min_count": 2}
+}
+
+# Relative change between neighbouring amounts still treated as the same charge
+AMOUNT_TOLERANCE = 0.1
+
+# Share of a cluster's gaps that must fit the period
+MIN_REGULARITY = 0.75
+
+# History scanned by a full detection, enough for two yearly charges
+HISTORY_DAYS = 800
+
+# Full detection is rerun at least this often so new series are picked up
+REDETECT_DAYS = 7
+
+
+def _advance(day, period, steps=1):
+    """Date of the charge steps periods after day"""
+    if period == "monthly":
+        return add_months(day, steps)
+    if period == "yearly":
+        return add_months(day, 12 * steps)
+    return day + timedelta(days=7 * steps)
+
+
+def _series_id(category, note, period):
+    return hashlib.sha1(f"{category}|{note}|{period}".encode()).hexdigest()[:12]
+
+
+def detect_series(frame, today=None):
+    """
+    Find recurring series in a frame of expenses
+
+    Args:
+        frame (ExpenseFrame): Expenses to scan
+        today (date): Current date, used for next charges and activity
+
+    Returns:
+        dict: series id -> {label, category, note, period, amount, count,
+              first_date, last_date, next_date, active}
+    """
+    today = today or date.today()
+    n = len(frame)
+    if n < 2:
+        return {}
+
+    # Pass 1: clusters of the same payee, category and amount
+    group = frame.note_codes.astype(np.int64) * max(len(frame.categories), 1) + frame.codes
+    order = np.lexsort((frame.amounts, group))
+    sorted_group = group[order]
+    sorted_amounts = frame.amounts[order]
+    new_cluster = np.ones(n, dtype=bool)
+    new_cluster[1:] = ((sorted_group[1:] != sorted_group[:-1])
+                       | (sorted_amounts[1:] > sorted_amounts[:-1] * (1 + AMOUNT_TOLERANCE) + 0.01))
+    cluster = np.empty(n, dtype=np.int64)
+    cluster[order] = np.cumsum(new_cluster) - 1
+    counts = np.bincount(cluster)
+    n_clusters = len(counts)
+
+    # Clusters are runs of ascending amounts, so each one's smallest and largest amount are its ends
+    starts = np.flatnonzero(new_cluster)
+    ends = np.concatenate([starts[1:] - 1, [n - 1]])
+    fixed_amount = sorted_amounts[ends] <= sorted_amounts[starts] * (1 + AMOUNT_TOLERANCE) + 0.01
+    has_note = np.array([frame.notes[code] != "" for code in frame.note_codes[order][starts]], dtype=bool)
+    identified = has_note | fixed_amount
+
+    # Pass 2: gaps between consecutive dates within each cluster
+    order = np.lexsort((frame.dates, cluster))
+    sorted_cluster = cluster[order]
+    days = frame.dates[order].astype(np.int64)
+    same = sorted_cluster[1:] == sorted_cluster[:-1]
+    gaps = np.diff(days)[same]
+    gap_cluster = sorted_cluster[1:][same]
+    gap_counts = np.bincount(gap_cluster, minlength=n_clusters)
+
+    # Gaps are already grouped by cluster, so sorting within groups gives medians by offset
+    gap_starts = np.concatenate([[0], np.cumsum(gap_counts)[:-1]])
+    sorted_gaps = gaps[np.lexsort((gaps, gap_cluster))]
+    median_gap = np.full(n_clusters, -1.0)
+    has_gaps = gap_counts > 0
+    median_gap[has_gaps] = sorted_gaps[(gap_starts + gap_counts // 2)[has_gaps]]
+
+    last_rows = order[np.flatnonzero(np.concatenate([~same, [True]]))]
+    first_rows = order[np.flatnonzero(np.concatenate([[True], ~same]))]
+
+    series = {}
+    for period, spec in PERIODS.items():
+        fits = np.abs(median_gap - spec["days"]) <= spec["tolerance"]
+        candidates = fits & (counts >= spec["min_count"]) & identified
+        if not candidates.any():
+            continue
+        regular = np.bincount(gap_cluster, weights=np.abs(gaps - spec["days"]) <= spec["tolerance"],
+                              minlength=n_clusters)
+        candidates &= regular >= MIN_REGULARITY * np.maximum(gap_counts, 1)
+
+        for c in np.flatnonzero(candidates):
+            last_row = last_rows[c]
+            category = frame.categories[frame.codes[last_row]]
+            note = frame.notes[frame.note_codes[last_row]]
+            last_date = frame.dates[last_row].astype(object)
+            next_date = _advance(last_date, period)
+            series_id = _series_id(category, note, period)
+            if series_id in series and series[series_id]["count"] >= counts[c]:
+                continue
+            series[series_id] = {
+                "label": note.title() if note else category,
+                "category": category,
+                "note": note,
+                "period": period,
+                "amount": float(frame.amounts[last_row]),
+                "count": int(counts[c]),
+                "first_date": frame.dates[first_rows[c]].astype(object).isoformat(),
+                "last_date": last_date.isoformat(),
+                "next_date": next_date.isoformat(),
+                "active": (today - next_date).days <= spec["tolerance"]
+            }
+    return series
+
+
+def match_expense(series, expense):
+    """
+    Find the series a new expense continues
+
+    Returns:
+        str: Id of the matching series, or None
+    """
+    try:
+        day = date.fromisoformat(str(expense["date"])[:10])
+    except (KeyError, ValueError):
+        return None
+    note = note_key(expense.get("notes"))
+    amount = expense.get("amount", 0)
+
+    best, best_distance = None, None
+    for series_id, item in series.items():
+        if item["category"] != expense.get("category") or item["note"] != note:
+            continue
+        if abs(amount - item["amount"]) > item["amount"] * AMOUNT_TOLERANCE + 0.01:
+            continue
+        distance = abs((day - date.fromisoformat(item["next_date"])).days)
+        if distance <= PERIODS[item["period"]]["tolerance"] and (best is None or distance < best_distance):
+            best, best_distance = series_id, distance
+    return best
+
+
+def extend_series(item, expense):
+    """Series after adding a matched expense"""
+    day = date.fromisoformat(str(expense["date"])[:10])
+    return {
+        **item,
+        "amount": float(expense.get("amount", item["amount"])),
+        "count": item["count"] + 1,
+        "last_date": day.isoformat(),
+        "next_date": _advance(day, item["period"]).isoformat(),
+        "active": True
+    }
+
+
+def recurring_update(user_data, expense):
+    """
+    Update the persisted series for a newly added expense
+
+    Only applies while the stored series are in step with the expenses, so
+    it can be written with the expenses_version bump; otherwise the next
+    load_recurring call redetects.
+
+    Returns:
+        dict: User document fields to write (empty if the series are stale)
+    """
+    if user_data.get("recurring_version") != user_data.get("expenses_version", 0):
+        return {}
+    updates = {"recurring_version": firestore.Increment(1)}
+    series = user_data.get("recurring_series", {})
+    series_id = match_expense(series, expense)
+    if series_id:
+        series[series_id] = extend_series(series[series_id], expense)
+        updates[f"recurring_series.{series_id}"] = series[series_id]
+    return updates
+
+
+def load_recurring(user_id, user_data, expenses=None, today=None):
+    """
+    Recurring series for a user, redetected when stale
+
+    Args:
+        user_id (str): User id
+        user_data (dict): User document
+        expenses (list): Already loaded expenses to detect from instead of
+                         querying Firestore
+        today (date): Current date; defaults to today
+
+    Returns:
+        dict: series id -> series, as returned by detect_series
+    """
+    today = today or date.today()
+    version = user_data.get("expenses_version", 0)
+    detected_on = user_data.get("recurring_detected_on")
+    if (user_data.get("recurring_version") == version and detected_on
+            and (today - date.fromisoformat(detected_on)).days < REDETECT_DAYS):
+        return user_data.get("recurring_series", {})
+
+    start = today - timedelta(days=HISTORY_DAYS)
+    if expenses is None:
+        expenses = query_expenses(user_id, start_date=start, version=version, fields=FRAME_FIELDS)
+    else:
+        expenses = [e for e in expenses if str(e.get("date", ""))[:10] >= start.isoformat()]
+
+    frame = ExpenseFrame.from_expenses(expenses, currency=user_data.get("currency", DEFAULT_CURRENCY))
+    series = detect_series(frame, today)
+    fields = {"recurring_series": series, "recurring_version": version, "recurring_detected_on": today.isoformat()}
+    # Saved in the background; a rerun before it lands finds the task still running rather than starting another
+    submit_task("recurring_save", save_recurring, user_id, fields)
+    user_data.update(fields)
+    return series
+
+
+def save_recurring(user_id, fields):
+    """Persist detected series on the user document"""
+    try:
+        user_ref(user_id).update(fields)
+    except Exception as e:
+        print(f"Error saving recurring series: {str(e)}")
+
+
+def upcoming_charges(series, today=None, days=30):
+    """
+    Projected charges of active series over the next days
+
+    Returns:
+        list: {"date", "label", "category", "amount", "series_id"} dicts, soonest first
+    """
+    today = today or date.today()
+    end = today + timedelta(days=days)
+    charges = []
+    for series_id, item in series.items():
+        if not item.get("active"):
+            continue
+        last = date.fromisoformat(item["last_date"])
+        step = 1
+        charge = _advance(last, item["period"], step)
+        while charge <= end:
+            if charge >= today:
+                charges.append({
+                    "date": charge,
+                    "label": item["label"],
+                    "category": item["category"],
+                    "amount": item["amount"],
+                    "series_id": series_id
+                })
+            step += 1
+            charge = _advance(last, item["period"], step)
+    return sorted(charges, key=lambda charge: charge["date"])
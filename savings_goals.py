@@ -0,0 +1,329 @@
+"""
+Multiple savings goals with a contributions ledger.
+
+Goals live in users/{user_id}/goals, each with its contributions in a
+`contributions` subcollection. Every contribution is written in the same
+batch as a `saved_minor` / `contribution_count` increment on its goal, so
+progress comes from the goal documents alone: loading the goals tab costs
+one read per goal however long the ledger grows. rebuild_rollup re-sums a
+ledger if a rollup is ever suspected to be off.
+
+A month's savings budget is split across goals by a scheduler:
+
+- "deadline": in proportion to the monthly pace each goal needs to meet its
+  target date, so urgent goals get more
+- "waterfall": fill goals one at a time in priority order
+
+The user document keeps `savings_goal` as a summary of the highest priority
+goal for the dashboard, chatbot and AI budget, which read a single goal.
+"""
+from datetime import date, datetime
+
+import numpy as np
+from firebase_admin import firestore
+
+from category_registry import SAVINGS, category_group
+from data_layer import count_reads, user_ref
+from money import amount_fields, from_minor, minor_per_unit, stored_allocations, to_minor
+from savings_projection import months_between
+from shared import db
+
+STRATEGIES = {
+    "deadline": "Deadline-weighted",
+    "waterfall": "Waterfall by priority"
+}
+DEFAULT_STRATEGY = "deadline"
+
+
+def goals_ref(user_id):
+    return user_ref(user_id).collection("goals")
+
+
+def contributions_ref(user_id, goal_id):
+    return goals_ref(user_id).document(goal_id).collection("contributions")
+
+
+def _goal_view(goal_id, data, currency):
+    """Goal document with derived progress fields"""
+    saved = from_minor(data.get("saved_minor", 0), currency)
+    total = data.get("total_cost", 0)
+    return {
+        **data,
+        "id": goal_id,
+        "saved": saved,
+        "remaining": max(0.0, total - saved),
+        "progress": saved / total if total else 0.0
+    }
+
+
+def _summary(goal):
+    """Legacy `savings_goal` map for the user document"""
+    today = date.today()
+    try:
+        months = max(1, months_between(today, date.fromisoformat(goal["target_date"][:10])))
+    except (KeyError, ValueError):
+        months = 12
+    return {
+        "goal_id": goal["id"],
+        "item": goal.get("item", "Goal"),
+        "total_cost": goal.get("total_cost", 0),
+        "current_savings": goal["saved"],
+        "monthly_amount": goal["remaining"] / months,
+        "timeline_months": months,
+        "target_date": goal.get("target_date"),
+        "start_date": goal.get("start_date")
+    }
+
+
+def _stream_goals(user_id, currency):
+    goals = [_goal_view(doc.id, doc.to_dict() or {}, currency) for doc in goals_ref(user_id).stream()]
+    count_reads(len(goals))
+    return goals
+
+
+def sort_goals(goals):
+    """Priority order: priority number, then nearest target date"""
+    return sorted(goals, key=lambda goal: (goal.get("priority", 99), goal.get("target_date", "9999")))
+
+
+def load_goals(user_id, user_data):
+    """
+    A user's goals with progress from their rollups
+
+    A single `savings_goal` map from before goals were a collection is
+    moved into the collection on first load, with its saved amount as the
+    opening contribution.
+
+    Returns:
+        list: Goal dicts sorted by priority, with id, saved, remaining and progress
+    """
+    goals = _stream_goals(user_id, user_data.get("currency"))
+
+    legacy = user_data.get("savings_goal")
+    if not goals and legacy and not legacy.get("goal_id"):
+        goal_id = create_goal(
+            user_id, user_data, legacy.get("item", "Goal"), legacy.get("total_cost", 0),
+            legacy.get("target_date") or date.today().isoformat(), priority=1,
+            opening_balance=legacy.get("current_savings", 0), start_date=legacy.get("start_date")
+        )
+        return load_goals(user_id, {**user_data, "savings_goal": {"goal_id": goal_id}})
+    return sort_goals(goals)
+
+
+def sync_summary(user_id, goals, batch, updates=None):
+    """
+    Queue the top priority unfinished goal's summary onto the user document
+
+    Args:
+        user_id (str): User id
+        goals (list): All of the user's goals after the write
+        batch: Firestore write batch to add the update to
+        updates (dict): Other user document fields to write with it
+    """
+    active = [goal for goal in sort_goals(goals) if goal["remaining"] > 0] or sort_goals(goals)
+    summary = _summary(active[0]) if active else firestore.DELETE_FIELD
+    batch.update(user_ref(user_id), {"savings_goal": summary, **(updates or {})})
+
+
+def create_goal(user_id, user_data, item, total_cost, target_date, priority=1, opening_balance=0, start_date=None):
+    """
+    Add a goal, recording any amount already saved as its first contribution
+
+    Returns:
+        str: The new goal's id
+    """
+    currency = user_data.get("currency")
+    goal_ref = goals_ref(user_id).document()
+    total_minor = to_minor(total_cost, currency)
+    data = {
+        "item": item,
+        "total_cost": from_minor(total_minor, currency),
+        "total_cost_minor": total_minor,
+        "priority": int(priority),
+        "target_date": str(target_date)[:10],
+        "start_date": str(start_date or date.today().isoformat())[:10],
+        "saved_minor": 0,
+        "contribution_count": 0,
+        "created_at": firestore.SERVER_TIMESTAMP
+    }
+    batch = db.batch()
+    batch.set(goal_ref, data)
+    opening_minor = to_minor(opening_balance, currency)
+    if opening_minor > 0:
+        batch.set(contributions_ref(user_id, goal_ref.id).document(), {
+            **amount_fields(opening_balance, currency),
+            "date": date.today().isoformat(),
+            "source": "opening balance",
+            "created_at": firestore.SERVER_TIMESTAMP
+        })
+        data.update(saved_minor=opening_minor, contribution_count=1)
+
+    goals = _stream_goals(user_id, currency)
+    goals.append(_goal_view(goal_ref.id, data, currency))
+    sync_summary(user_id, goals, batch)
+    batch.commit()
+    return goal_ref.id
+
+
+def add_contributions(user_id, user_data, goals, amounts, source="manual", day=None, user_updates=None):
+    """
+    Record contributions and bump each goal's rollup in one batch
+
+    Args:
+        user_id (str): User id
+        user_data (dict): User document
+        goals (list): The user's goals from load_goals
+        amounts (dict): goal id -> amount in major units; negative withdraws
+        source (str): What the money came from, e.g. "manual", "schedule", "expense"
+        day (date): Contribution date; defaults to today
+        user_updates (dict): User document fields to commit atomically with the contributions
+
+    Returns:
+        list: The goals with their rollups updated
+    """
+    currency = user_data.get("currency")
+    day = (day or date.today()).isoformat()
+    by_id = {goal["id"]: goal for goal in goals}
+    batch = db.batch()
+    for goal_id, amount in amounts.items():
+        minor = to_minor(amount, currency)
+        if not minor or goal_id not in by_id:
+            continue
+        batch.set(contributions_ref(user_id, goal_id).document(), {
+            **amount_fields(amount, currency),
+            "date": day,
+            "source": source,
+            "created_at": firestore.SERVER_TIMESTAMP
+        })
+        batch.update(goals_ref(user_id).document(goal_id), {
+            "saved_minor": firestore.Increment(minor),
+            "contribution_count": firestore.Increment(1),
+            "last_contribution_date": day
+        })
+        goal = by_id[goal_id]
+        by_id[goal_id] = _goal_view(goal_id, {**goal, "saved_minor": goal.get("saved_minor", 0) + minor}, currency)
+    sync_summary(user_id, list(by_id.values()), batch, user_updates)
+    batch.commit()
+    return sort_goals(by_id.values())
+
+
+def delete_goal(user_id, goals, goal_id):
+    """Delete a goal and its contributions ledger"""
+    goal_ref = goals_ref(user_id).document(goal_id)
+    batch = db.batch()
+    writes = 0
+    for doc in contributions_ref(user_id, goal_id).stream():
+        batch.delete(doc.reference)
+        writes += 1
+        if writes % 400 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.delete(goal_ref)
+    remaining = [goal for goal in goals if goal["id"] != goal_id]
+    sync_summary(user_id, remaining, batch)
+    batch.commit()
+    return remaining
+
+
+def rebuild_rollup(user_id, user_data, goal_id):
+    """
+    Recompute a goal's rollup from its full contributions ledger
+
+    Returns:
+        int: saved_minor after the rebuild
+    """
+    currency = user_data.get("currency")
+    total, count = 0, 0
+    for doc in contributions_ref(user_id, goal_id).stream():
+        contribution = doc.to_dict() or {}
+        minor = contribution.get("amount_minor")
+        total += int(minor) if minor is not None else to_minor(contribution.get("amount", 0), currency)
+        count += 1
+    goals_ref(user_id).document(goal_id).update({"saved_minor": total, "contribution_count": count})
+    return total
+
+
+def monthly_savings_budget(user_data):
+    """This month's savings allocation: the budget of every category in the savings group"""
+    return sum(amount for category, amount in stored_allocations(user_data).items()
+               if category_group(category) == SAVINGS)
+
+
+def schedule_contributions(goals, amount, strategy=DEFAULT_STRATEGY, today=None, minor_per_unit=100):
+    """
+    Split a month's savings across goals
+
+    No goal is given more than it still needs; whatever is left once every
+    goal is covered stays unallocated.
+
+    Args:
+        goals (list): Goals from load_goals
+        amount (float): Amount to split
+        strategy (str): "deadline" or "waterfall"
+        today (date): Current date; defaults to today
+        minor_per_unit (int): Rounding unit, so the split adds up exactly
+
+    Returns:
+        dict: goal id -> amount, plus the leftover under None
+    """
+    today = today or date.today()
+    goals = [goal for goal in sort_goals(goals) if goal["remaining"] > 0]
+    total = int(round(amount * minor_per_unit))
+    if not goals or total <= 0:
+        return {None: max(total, 0) / minor_per_unit}
+
+    need = np.array([round(goal["remaining"] * minor_per_unit) for goal in goals], dtype=np.int64)
+    split = np.zeros(len(goals), dtype=np.int64)
+
+    if strategy == "waterfall":
+        before = np.concatenate([[0], np.cumsum(need)[:-1]])
+        split = np.minimum(need, np.maximum(total - before, 0))
+    else:
+        months = []
+        for goal in goals:
+            try:
+                target = datetime.fromisoformat(goal.get("target_date", "")[:10]).date()
+                months.append(max(1, months_between(today, target)))
+            except ValueError:
+                months.append(12)
+        pace = need / np.array(months)
+
+        # Proportional to pace, capping goals at what they need and re-spreading the rest
+        open_goals = need > 0
+        left = total
+        while left > 0 and open_goals.any():
+            share = np.where(open_goals, pace, 0)
+            proposed = np.floor(left * share / share.sum()).astype(np.int64)
+            proposed = np.minimum(proposed, need - split)
+            if proposed.sum() == 0:
+                # Hand out the last few minor units to the most urgent goals
+                for i in np.argsort(-share):
+                    if left == 0 or not open_goals[i]:
+                        break
+                    split[i] += 1
+                    left -= 1
+                    open_goals[i] = split[i] < need[i]
+                break
+            split += proposed
+            left -= int(proposed.sum())
+            open_goals = split < need
+
+    result = {goal["id"]: value / minor_per_unit for goal, value in zip(goals, split.tolist()) if value > 0}
+    result[None] = (total - int(split.sum())) / minor_per_unit
+    return result
+
+
+def contribute_savings(user_id, user_data, amount, source="expense"):
+    """
+    Split money put into savings across the user's goals with their chosen strategy
+
+    Returns:
+        dict: goal id -> amount contributed; empty if there are no open goals
+    """
+    goals = load_goals(user_id, user_data)
+    plan = schedule_contributions(goals, amount, user_data.get("goal_strategy", DEFAULT_STRATEGY),
+                                  minor_per_unit=minor_per_unit(user_data.get("currency")))
+    plan.pop(None, None)
+    if plan:
+        add_contributions(user_id, user_data, goals, plan, source=source)
+    return plan
@@ -0,0 +1,170 @@
+"""
+Monte Carlo projection of a savings goal from the user's own history.
+
+Each simulated path draws monthly net savings (income minus that month's
+spending) with replacement from the user's past complete months and adds
+them to the current savings. Across many paths this gives the probability
+of reaching the goal by its target date and a spread of likely completion
+dates, instead of assuming a fixed monthly contribution.
+"""
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+
+from data_layer import TOTAL_FIELDS, query_expenses
+from money import DEFAULT_CURRENCY, from_minor, minor_array
+
+# Complete months of history used as the resampling pool
+HISTORY_MONTHS = 24
+
+# Longest horizon simulated; paths that haven't reached the goal by then never do
+MAX_HORIZON_MONTHS = 240
+
+DEFAULT_PATHS = 10000
+
+
+def add_months(day, months):
+    """Date months calendar months after day, clamped to the end of the month"""
+    month_index = day.month - 1 + months
+    year = day.year + month_index // 12
+    month = month_index % 12 + 1
+    next_month = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    last_day = (next_month - date(year, month, 1)).days
+    return date(year, month, min(day.day, last_day))
+
+
+def months_between(start, end):
+    """Whole calendar months from start to end, rounded up so a partial month counts"""
+    months = (end.year - start.year) * 12 + (end.month - start.month)
+    return months + (1 if end.day > start.day else 0)
+
+
+def monthly_net_savings(expenses, income, today, currency=DEFAULT_CURRENCY):
+    """
+    Net savings of each complete month between the first and last month with expenses
+
+    Months after the last logged expense are left out rather than counted as
+    months with no spending.
+
+    Args:
+        expenses (list): Expense dicts with ISO 'date' and 'amount'
+        income (float): Monthly income
+        today (date): Current date; its month is incomplete and excluded
+        currency (str): Base currency; foreign expenses are converted to it
+
+    Returns:
+        np.ndarray: income minus spending per month, oldest first
+    """
+    current = (today.year, today.month)
+    spend = {}
+    for expense, minor in zip(expenses, minor_array(expenses, currency).tolist()):
+        try:
+            year, month = int(expense["date"][:4]), int(expense["date"][5:7])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if (year, month) < current:
+            spend[(year, month)] = spend.get((year, month), 0) + minor
+    if not spend:
+        return np.array([])
+
+    first_year, first_month = min(spend)
+    last_year, last_month = max(spend)
+    count = (last_year - first_year) * 12 + (last_month - first_month) + 1
+    totals = np.zeros(count)
+    for (year, month), amount in spend.items():
+        totals[(year - first_year) * 12 + (month - first_month)] = from_minor(amount, currency)
+    return income - totals
+
+
+def simulate_goal(current_savings, total_cost, samples, months_to_target, n_paths=DEFAULT_PATHS, seed=None):
+    """
+    Simulate savings paths by resampling monthly net savings
+
+    Args:
+        current_savings (float): Amount already saved
+        total_cost (float): Goal amount
+        samples (array-like): Historical monthly net savings to resample
+        months_to_target (int): Months until the target date
+        n_paths (int): Number of simulated paths
+        seed (int): Optional random seed
+
+    Returns:
+        dict: probability of reaching the goal by the target, months to
+              completion at P10/P50/P90 (None if not reached within the
+              horizon) and P10/P50/P90 savings per month for charting
+    """
+    samples = np.asarray(samples, dtype=float)
+    remaining = total_cost - current_savings
+    if remaining <= 0:
+        return {"probability": 1.0, "months": {10: 0, 50: 0, 90: 0}, "fan": np.full((3, 1), current_savings)}
+
+    horizon = int(min(MAX_HORIZON_MONTHS, max(24, 2 * months_to_target)))
+    rng = np.random.default_rng(seed)
+    draws = samples[rng.integers(0, len(samples), size=(n_paths, horizon))]
+    balances = np.cumsum(draws, axis=1)
+
+    # Paths that never reach the goal complete "after the horizon"
+    reached = balances >= remaining
+    completion = np.where(reached.any(axis=1), reached.argmax(axis=1) + 1, horizon + 1)
+
+    months = {}
+    for pct, value in zip((10, 50, 90), np.percentile(completion, [10, 50, 90], method="higher")):
+        months[pct] = int(value) if value <= horizon else None
+
+    fan_months = min(horizon, max(months_to_target, 1) + 12)
+    fan = current_savings + np.percentile(balances[:, :fan_months], [10, 50, 90], axis=0)
+    return {
+        "probability": float(np.mean(completion <= months_to_target)),
+        "months": months,
+        "fan": fan
+    }
+
+
+@lru_cache(maxsize=256)
+def project_goal(user_id, data_version, income, current_savings, total_cost, target_date_iso,
+                 fallback_monthly=0, today_iso=None, n_paths=DEFAULT_PATHS, currency=DEFAULT_CURRENCY, share=1.0):
+    """
+    Project a user's savings goal, cached per expenses data version
+
+    Arguments are hashable so results are reused across reruns until the
+    user's expenses, goal or the day change.
+
+    Args:
+        user_id (str): User id
+        data_version (int): The user's expenses_version counter
+        income (float): Monthly income
+        current_savings (float): Amount already saved
+        total_cost (float): Goal amount
+        target_date_iso (str): Goal target date
+        fallback_monthly (float): Monthly saving assumed when there is no history
+        today_iso (str): Current date; defaults to today
+        n_paths (int): Number of simulated paths
+        currency (str): The user's base currency
+        share (float): Fraction of monthly savings that goes to this goal
+
+    Returns:
+        dict: simulate_goal result plus completion dates and the number of
+              history months used
+    """
+    today = date.fromisoformat(today_iso) if today_iso else date.today()
+    target_date = date.fromisoformat(target_date_iso[:10])
+    months_to_target = max(0, months_between(today, target_date))
+
+    month_start = date(today.year, today.month, 1)
+    expenses = query_expenses(user_id, start_date=add_months(month_start, -HISTORY_MONTHS), end_date=month_start,
+                              version=data_version, fields=TOTAL_FIELDS)
+
+    samples = monthly_net_savings(expenses, income, today, currency) * share
+    history_months = len(samples)
+    if not history_months:
+        samples = np.array([fallback_monthly])
+
+    result = simulate_goal(current_savings, total_cost, samples, months_to_target, n_paths)
+    result["dates"] = {
+        pct: add_months(today, months) if months is not None else None
+        for pct, months in result["months"].items()
+    }
+    result["months_to_target"] = months_to_target
+    result["history_months"] = history_months
+    return result
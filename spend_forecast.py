@@ -0,0 +1,286 @@
+"""
+Month-end spend forecasting per category.
+
+For every category the forecaster keeps an EWMA of past monthly totals and
+an EWMA day-of-month profile: the share of a month's spending that has
+usually happened by each day. Rent paid on the 1st shows up as a profile
+that jumps to ~1 on day one, so a big early payment is not mistaken for
+overspending. The month-end projection is the spend so far plus the
+expected remainder of the month, blending the historical level (trusted
+early in the month) with this month's own pace (trusted later).
+
+All categories are handled together as [categories x 31] arrays. New or
+deleted expenses update the current month in place; the model is refit
+from Firestore only when the data version or month moves on unexpectedly.
+
+Fitted models are kept per user for the process's sessions, up to
+MAX_FORECASTERS, dropping the least recently used. Each model has its own
+lock, so a forecast never reads arrays an update is halfway through.
+"""
+import calendar
+import functools
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+
+from category_registry import canonical_category
+from data_layer import FRAME_FIELDS, ExpenseFrame, query_expenses
+from money import DEFAULT_CURRENCY
+
+# Past complete months used to fit the model
+HISTORY_MONTHS = 6
+
+# Weight of the most recent month in the EWMAs
+EWMA_ALPHA = 0.4
+
+DAYS = 31
+
+# Share of the month's usual spend that must have happened before this
+# month's pace is used to extrapolate
+MIN_PACE_FRACTION = 0.05
+
+_LINEAR_PROFILE = np.arange(1, DAYS + 1) / DAYS
+
+# Users whose fitted models are kept in memory
+MAX_FORECASTERS = 500
+
+# user_id -> SpendForecaster, shared across reruns and sessions of this process, least recently used first
+_FORECASTERS = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _month_key(day):
+    return day.year * 12 + day.month - 1
+
+
+def _locked(method):
+    """Run a SpendForecaster method under the model's lock"""
+    @functools.wraps(method)
+    def run(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return run
+
+
+class SpendForecaster:
+    """
+    Per-category month-end spend model
+
+    Args:
+        categories (list): Category names
+        alpha (float): EWMA weight of the most recent month
+    """
+
+    def __init__(self, categories, alpha=EWMA_ALPHA):
+        self.alpha = alpha
+        self.categories = []
+        self._index = {}
+        self.level = np.zeros(0)
+        self.profile = np.zeros((0, DAYS))
+        self.has_history = np.zeros(0, dtype=bool)
+        self.current = np.zeros((0, DAYS))
+        self.month = None
+        self.version = None
+        self.stale = False
+        # Reentrant, since fit() adds categories
+        self.lock = threading.RLock()
+        self.ensure_categories(categories)
+
+    @_locked
+    def ensure_categories(self, categories):
+        """Add rows for categories the model hasn't seen yet"""
+        new = [c for c in dict.fromkeys(categories) if c not in self._index]
+        if not new:
+            return
+        for category in new:
+            self._index[category] = len(self.categories)
+            self.categories.append(category)
+        n = len(new)
+        self.level = np.concatenate([self.level, np.zeros(n)])
+        self.profile = np.vstack([self.profile, np.tile(_LINEAR_PROFILE, (n, 1))])
+        self.has_history = np.concatenate([self.has_history, np.zeros(n, dtype=bool)])
+        self.current = np.vstack([self.current, np.zeros((n, DAYS))])
+
+    @_locked
+    def fit(self, frame, today):
+        """
+        Fit levels and profiles from past months and load the current month
+
+        Args:
+            frame (ExpenseFrame): Expenses covering at least HISTORY_MONTHS
+            today (date): Current date
+        """
+        self.ensure_categories(frame.categories)
+        self.month = _month_key(today)
+        self.stale = False
+
+        rows = np.array([self._index[c] for c in frame.categories], dtype=np.int64)[frame.codes]
+        months = frame.dates.astype("datetime64[M]")
+        month_keys = months.astype(np.int64) + 1970 * 12
+        days = (frame.dates - months.astype("datetime64[D]")).astype(np.int64)
+        age = self.month - month_keys - 1
+
+        n = len(self.categories)
+        self.current = np.zeros((n, DAYS))
+        in_month = age == -1
+        np.add.at(self.current, (rows[in_month], days[in_month]), frame.amounts[in_month])
+
+        past = (age >= 0) & (age < HISTORY_MONTHS)
+        if not past.any():
+            return
+        daily = np.zeros((HISTORY_MONTHS, n, DAYS))
+        np.add.at(daily, (age[past], rows[past], days[past]), frame.amounts[past])
+
+        # Months before the first recorded expense aren't evidence of zero spend
+        observed = np.arange(HISTORY_MONTHS) <= age[past].max()
+        month_weights = np.where(observed, self.alpha * (1 - self.alpha) ** np.arange(HISTORY_MONTHS), 0)
+
+        totals = daily.sum(axis=2)
+        self.level = month_weights @ totals / month_weights.sum()
+
+        spent = totals > 0
+        fractions = np.cumsum(daily, axis=2) / np.where(spent, totals, 1)[:, :, None]
+        profile_weights = month_weights[:, None] * spent
+        weight_sums = profile_weights.sum(axis=0)
+        self.has_history = weight_sums > 0
+        fitted = np.einsum("mc,mcd->cd", profile_weights, fractions) / np.where(self.has_history, weight_sums, 1)[:, None]
+        self.profile = np.where(self.has_history[:, None], fitted, _LINEAR_PROFILE)
+
+    @_locked
+    def roll_to(self, today):
+        """
+        Move the model to today's month, folding a just-finished month into the EWMAs
+
+        Returns:
+            bool: False if the model is too far behind and needs a refit
+        """
+        month = _month_key(today)
+        if month == self.month:
+            return True
+        if self.month is None or month != self.month + 1:
+            return False
+
+        totals = self.current.sum(axis=1)
+        spent = totals > 0
+        fractions = np.cumsum(self.current, axis=1) / np.where(spent, totals, 1)[:, None]
+        self.level = np.where(self.has_history, self.alpha * totals + (1 - self.alpha) * self.level, totals)
+        update = self.alpha * fractions + (1 - self.alpha) * self.profile
+        self.profile = np.where(spent[:, None], np.where(self.has_history[:, None], update, fractions), self.profile)
+        self.has_history |= spent
+        self.current = np.zeros_like(self.current)
+        self.month = month
+        return True
+
+    @_locked
+    def observe(self, expenses, sign=1):
+        """
+        Apply added (sign=1) or deleted (sign=-1) expenses incrementally
+
+        Changes to past months invalidate the fit and mark the model stale.
+        """
+        for expense in expenses:
+            try:
+                day = date.fromisoformat(str(expense["date"])[:10])
+            except (KeyError, ValueError):
+                continue
+            month = _month_key(day)
+            if month == self.month:
+                category = canonical_category(expense.get("category", "Other"))
+                self.ensure_categories([category])
+                row = self._index[category]
+                self.current[row, day.day - 1] += sign * expense.get("amount", 0)
+            elif self.month is not None and self.month - HISTORY_MONTHS <= month < self.month:
+                self.stale = True
+
+    @_locked
+    def forecast(self, today):
+        """
+        Project month-end spend for every category
+
+        Returns:
+            dict: category -> {"spent": spent so far this month,
+                               "projected": expected month-end total}
+        """
+        days_in_month = calendar.monthrange(today.year, today.month)[1]
+        day = min(today.day, days_in_month)
+
+        # Usual share of the month's spend done by today, rescaled to this month's length
+        month_end = self.profile[:, days_in_month - 1]
+        fraction = np.clip(self.profile[:, day - 1] / np.where(month_end > 0, month_end, 1), 0, 1)
+        fraction = np.where(month_end > 0, fraction, day / days_in_month)
+
+        spent = self.current.sum(axis=1)
+        pace = np.where(fraction >= MIN_PACE_FRACTION, spent / np.maximum(fraction, MIN_PACE_FRACTION), spent)
+        history_weight = np.where(self.has_history, 1 - fraction, 0)
+        expected_month = history_weight * self.level + (1 - history_weight) * pace
+        projected = spent + (1 - fraction) * expected_month
+        # A regular expense that hasn't shown up yet (rent paid late) is still expected
+        projected = np.where(self.has_history & (spent <= 0), self.level, projected)
+
+        return {
+            category: {"spent": float(spent[i]), "projected": float(projected[i])}
+            for i, category in enumerate(self.categories)
+        }
+
+
+def get_forecaster(user_id, data_version, categories=(), today=None, currency=DEFAULT_CURRENCY, pending=()):
+    """
+    Forecaster for a user, refit only when its data version or month is out of date
+
+    Args:
+        user_id (str): User id
+        data_version (int): The user's expenses_version counter, counting pending expenses
+        categories (list): Categories to include even without expenses
+        today (date): Current date; defaults to today
+        currency (str): The user's base currency
+        pending (list): Expenses counted in data_version but not yet in Firestore
+                        (ExpenseQueue.pending_changes); a refit reads Firestore at
+                        the version without them and adds them on top
+
+    Returns:
+        SpendForecaster
+    """
+    today = today or date.today()
+    with _LOCK:
+        forecaster = _FORECASTERS.get(user_id)
+        if (forecaster and forecaster.version == data_version and not forecaster.stale
+                and forecaster.roll_to(today)):
+            _FORECASTERS.move_to_end(user_id)
+            forecaster.ensure_categories(categories)
+            return forecaster
+
+    start_month = _month_key(today) - HISTORY_MONTHS
+    start = date(start_month // 12, start_month % 12 + 1, 1)
+    # Firestore's copy is at the version before the pending expenses, so cached queries stay keyed on what they hold
+    server_version = data_version - len(pending)
+    frame = ExpenseFrame.from_expenses(query_expenses(user_id, start_date=start, version=server_version, fields=FRAME_FIELDS),
+                                       categories, currency)
+
+    forecaster = SpendForecaster(frame.categories)
+    forecaster.fit(frame, today)
+    forecaster.observe(pending)
+    forecaster.version = data_version
+    with _LOCK:
+        _FORECASTERS[user_id] = forecaster
+        _FORECASTERS.move_to_end(user_id)
+        while len(_FORECASTERS) > MAX_FORECASTERS:
+            _FORECASTERS.popitem(last=False)
+    return forecaster
+
+
+def record_expense_change(user_id, expense, removed=False):
+    """
+    Update a cached forecaster after an expense write and bump_expenses_version
+
+    Keeps the cached model in step with the incremented data version so the
+    next read doesn't refit from Firestore.
+    """
+    with _LOCK:
+        forecaster = _FORECASTERS.get(user_id)
+        if forecaster is None or forecaster.version is None:
+            return
+        with forecaster.lock:
+            forecaster.observe([expense], -1 if removed else 1)
+            forecaster.version += 1
@@ -0,0 +1,168 @@
+"""
+Background tasks for slow work off the Streamlit script thread.
+
+Work submitted here runs on a process-wide thread pool, so a rerun no
+longer cancels it halfway and the page keeps responding. Each session keeps its
+task handles in st.session_state["tasks"] under a key chosen by the page:
+
+    submit_task("ai_budget", get_ai_budget_recommendation, income=...)
+    watch_task("ai_budget", "Creating your budget...")  # polls until done
+    task = get_task("ai_budget")                         # result on a later rerun
+    task = pop_finished("ai_budget")                     # or taken once, for results applied to state
+
+Task functions run outside the script thread, so they must not call any
+st.* function or touch session state.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from fragments import FRAGMENT
+
+TASK_THREADS = int(os.getenv("TASK_THREADS", "8"))
+
+# Seconds between status checks while a page waits on a task
+POLL_INTERVAL = 1.0
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_THREADS = None
+_LOCK = threading.Lock()
+
+
+def _executor():
+    """Shared executor, created on first use"""
+    global _THREADS
+    with _LOCK:
+        if _THREADS is None:
+            _THREADS = ThreadPoolExecutor(max_workers=TASK_THREADS, thread_name_prefix="task")
+        return _THREADS
+
+
+class Task:
+    """
+    Handle to one submitted task
+
+    Args:
+        name (str): Session key the task is stored under
+        future (concurrent.futures.Future): The running work
+        meta (dict): Caller data kept with the task, e.g. the inputs it was started with
+    """
+
+    def __init__(self, name, future, meta=None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.future = future
+        self.meta = meta or {}
+        self.submitted_at = time.time()
+        self.finished_at = None
+        future.add_done_callback(self._finished)
+
+    def _finished(self, future):
+        self.finished_at = time.time()
+        if future.exception() is not None:
+            print(f"Error in background task {self.name}: {str(future.exception())}")
+
+    @property
+    def status(self):
+        if self.future.done():
+            return FAILED if self.future.exception() is not None else DONE
+        return RUNNING if self.future.running() else PENDING
+
+    @property
+    def done(self):
+        return self.future.done()
+
+    @property
+    def result(self):
+        """The function's return value, or None until it has succeeded"""
+        if self.status != DONE:
+            return None
+        return self.future.result()
+
+    @property
+    def error(self):
+        if self.status != FAILED:
+            return None
+        return str(self.future.exception())
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.submitted_at
+
+
+def _tasks():
+    if "tasks" not in st.session_state:
+        st.session_state.tasks = {}
+    return st.session_state.tasks
+
+
+def submit_task(key, fn, *args, meta=None, unique=True, **kwargs):
+    """
+    Run fn(*args, **kwargs) in the background under a session key
+
+    Args:
+        key (str): Session key for the task
+        fn (callable): Work to run
+        meta (dict): Data to keep with the task
+        unique (bool): Return an unfinished task under the same key instead of
+                       starting another, so a page can submit on every rerun.
+                       With False the new task always runs and takes over the key.
+
+    Returns:
+        Task: The task handle
+    """
+    tasks = _tasks()
+    task = tasks.get(key)
+    if unique and task is not None and not task.done:
+        return task
+    task = Task(key, _executor().submit(fn, *args, **kwargs), meta)
+    tasks[key] = task
+    return task
+
+
+def get_task(key):
+    """The task under a session key, or None"""
+    return _tasks().get(key)
+
+
+def pop_finished(key):
+    """Remove and return the task under a key once it has finished, else None"""
+    task = _tasks().get(key)
+    if task is None or not task.done:
+        return None
+    return _tasks().pop(key)
+
+
+def watch_task(key, message="Working..."):
+    """
+    Show a running task's status and rerun the page when it finishes
+
+    Uses an auto-refreshing fragment (fragments.FRAGMENT) so only the status
+    line reruns while waiting. Streamlit versions without fragments sleep
+    and rerun the whole page instead.
+    """
+    task = get_task(key)
+    if task is None or task.done:
+        return
+
+    if FRAGMENT is None:
+        st.info(f"⏳ {message} ({task.elapsed:.0f}s)")
+        time.sleep(POLL_INTERVAL)
+        st.rerun()
+
+    @FRAGMENT(run_every=POLL_INTERVAL)
+    def poll():
+        current = get_task(key)
+        if current is None or current.done:
+            st.rerun()
+        st.info(f"⏳ {message} ({current.elapsed:.0f}s)")
+
+    poll()
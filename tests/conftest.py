@@ -0,0 +1,17 @@
+"""
+Test setup shared by every test module.
+
+Importing shared initializes Firebase from the local credentials, so tests
+get an offline stand-in whose db each test patches where it needs one, and
+the shared cache tier stays off so no test writes to the user's cache.
+"""
+import os
+import sys
+import types
+
+os.environ.setdefault("CACHE_BACKEND", "none")
+
+if "shared" not in sys.modules:
+    shared = types.ModuleType("shared")
+    shared.db = None
+    sys.modules["shared"] = shared
@@ -0,0 +1,104 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+pytest.importorskip("firebase_admin")
+
+from anomaly import MIN_HISTORY, CategoryStats, P2Quantile, assess_expense, forget_expense, stats_field  # noqa: E402
+
+
+def _amounts(count, seed=7):
+    rng = random.Random(seed)
+    return [round(rng.lognormvariate(6, 0.6), 2) for _ in range(count)]
+
+
+def test_welford_matches_batch_statistics():
+    amounts = _amounts(2000)
+    stats = CategoryStats()
+    for amount in amounts:
+        stats.add(amount)
+    logs = np.log1p(amounts)
+    assert stats.count == 2000
+    assert stats.mean == pytest.approx(logs.mean(), rel=1e-9)
+    assert stats.std() == pytest.approx(logs.std(ddof=1), rel=1e-9)
+
+
+def test_remove_undoes_add():
+    amounts = _amounts(50)
+    stats = CategoryStats()
+    for amount in amounts:
+        stats.add(amount)
+    stats.remove(amounts[-1])
+    logs = np.log1p(amounts[:-1])
+    assert stats.count == 49
+    assert stats.mean == pytest.approx(logs.mean(), rel=1e-9)
+    assert stats.std() == pytest.approx(logs.std(ddof=1), rel=1e-9)
+
+    single = CategoryStats()
+    single.add(100)
+    single.remove(100)
+    assert (single.count, single.mean, single.m2) == (0, 0.0, 0.0)
+
+
+@pytest.mark.parametrize("p", [0.5, 0.9, 0.99])
+def test_p2_quantiles_track_exact_quantiles(p):
+    amounts = _amounts(5000, seed=11)
+    sketch = P2Quantile(p)
+    for amount in amounts:
+        sketch.add(amount)
+    assert sketch.value() == pytest.approx(np.quantile(amounts, p), rel=0.05)
+
+
+def test_p2_small_samples_and_state_round_trip():
+    sketch = P2Quantile(0.5)
+    assert sketch.value() is None
+    for amount in (30, 10, 20):
+        sketch.add(amount)
+    assert sketch.value() == 20
+
+    for amount in _amounts(100):
+        sketch.add(amount)
+    restored = P2Quantile(0.5, sketch.state())
+    for amount in _amounts(100, seed=3):
+        sketch.add(amount)
+        restored.add(amount)
+    assert restored.state() == sketch.state()
+
+
+def test_scores_need_history_and_flag_large_outliers():
+    stats = CategoryStats()
+    for amount in _amounts(MIN_HISTORY - 1):
+        stats.add(amount)
+    assert stats.score(50000)["anomaly_score"] is None
+
+    for amount in _amounts(200):
+        stats.add(amount)
+    normal = stats.score(400)
+    assert not normal["anomaly"]
+    assert abs(normal["anomaly_score"]) < 1
+    outlier = stats.score(50000)
+    assert outlier["anomaly"]
+    assert outlier["anomaly_score"] >= 3
+    assert outlier["typical"] == pytest.approx(math.exp(6), rel=0.1)
+
+
+def test_identical_amounts_do_not_give_infinite_scores():
+    stats = CategoryStats()
+    for _ in range(10):
+        stats.add(100)
+    assert math.isfinite(stats.score(101)["anomaly_score"])
+    assert not stats.score(101)["anomaly"]
+
+
+def test_assess_and_forget_update_the_user_document():
+    user_data = {}
+    for amount in _amounts(20):
+        result, update = assess_expense(user_data, "Food & Dining", amount)
+    assert result["anomaly_score"] is not None
+    assert list(update) == [stats_field("Food & Dining")]
+    assert CategoryStats(user_data["expense_stats"]["Food & Dining"]).count == 20
+
+    update = forget_expense(user_data, "Food & Dining", amount)
+    assert update[stats_field("Food & Dining")]["n"] == 19
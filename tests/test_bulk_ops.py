@@ -0,0 +1,133 @@
+import pytest
+
+pytest.importorskip("firebase_admin")
+pytest.importorskip("streamlit")
+
+import bulk_ops  # noqa: E402
+import data_layer  # noqa: E402
+from anomaly import CategoryStats, stats_field  # noqa: E402
+from bulk_ops import BULK_BATCH_SIZE, EDIT_VERSION_BUMPS, delete_expenses, update_expenses  # noqa: E402
+
+
+class FakeRef:
+    def __init__(self, path):
+        self.path = path
+
+    def collection(self, name):
+        return FakeRef(f"{self.path}/{name}")
+
+    def document(self, doc_id):
+        return FakeRef(f"{self.path}/{doc_id}")
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def delete(self, ref):
+        self.ops.append(("delete", ref.path, None))
+
+    def update(self, ref, fields):
+        self.ops.append(("update", ref.path, fields))
+
+    def commit(self):
+        if len(self.db.committed) == self.db.fail_at:
+            raise RuntimeError("deadline exceeded")
+        self.db.committed.append(self.ops)
+
+
+class FakeDB:
+    """Records committed batches; the batch numbered fail_at fails"""
+
+    def __init__(self, fail_at=None):
+        self.committed = []
+        self.fail_at = fail_at
+
+    def collection(self, name):
+        return FakeRef(name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(bulk_ops, "db", fake)
+    monkeypatch.setattr(data_layer, "db", fake)
+    return fake
+
+
+def _expenses(count, category="Food & Dining"):
+    return [{"id": f"e{i:04d}", "amount": 100.0 + i % 7, "category": category, "date": "2025-10-01"}
+            for i in range(count)]
+
+
+def _user(expenses):
+    stats = CategoryStats()
+    for expense in expenses:
+        stats.add(expense["amount"])
+    return {"currency": "INR", "expense_stats": {"Food & Dining": stats.state()}}
+
+
+def _user_update(batch):
+    [update] = [fields for op, path, fields in batch if path == "users/user-1"]
+    return update
+
+
+def test_deletes_are_written_in_chunks(db):
+    expenses = _expenses(1000)
+    user_data = _user(expenses)
+    progress = []
+
+    result = delete_expenses("user-1", user_data, expenses, lambda done, total: progress.append((done, total)))
+
+    assert result == {"written": [e["id"] for e in expenses], "error": None}
+    assert [len(batch) for batch in db.committed] == [BULK_BATCH_SIZE + 1, BULK_BATCH_SIZE + 1, 201]
+    assert all(len(batch) <= 500 for batch in db.committed)
+    assert progress == [(400, 1000), (800, 1000), (1000, 1000)]
+    assert [_user_update(batch)["expenses_version"].value for batch in db.committed] == [400, 400, 200]
+
+    deleted = [path for batch in db.committed for op, path, fields in batch if op == "delete"]
+    assert deleted == [f"users/user-1/expenses/{e['id']}" for e in expenses]
+    # Each chunk carries the statistics as they stand once it lands
+    field = stats_field("Food & Dining")
+    assert [_user_update(batch)[field]["n"] for batch in db.committed] == [600, 200, 0]
+    assert user_data["expense_stats"]["Food & Dining"]["n"] == 1000
+
+
+def test_failed_chunk_stops_the_rest(db):
+    db.fail_at = 1
+    expenses = _expenses(1000)
+
+    result = delete_expenses("user-1", _user(expenses), expenses)
+
+    assert result["written"] == [e["id"] for e in expenses[:BULK_BATCH_SIZE]]
+    assert result["error"] == "deadline exceeded"
+    assert len(db.committed) == 1
+
+
+def test_edits_move_statistics_and_bump_twice(db):
+    expenses = _expenses(10)
+
+    result = update_expenses("user-1", _user(expenses), expenses, category="Entertainment", amount=250)
+
+    [batch] = db.committed
+    assert _user_update(batch)["expenses_version"].value == 10 * EDIT_VERSION_BUMPS
+    assert _user_update(batch)[stats_field("Food & Dining")]["n"] == 0
+    assert _user_update(batch)[stats_field("Entertainment")]["n"] == 10
+    assert result["fields"]["e0000"] == {"category": "Entertainment", "amount": 250.0, "amount_minor": 25000}
+    assert [op for op, path, fields in batch].count("update") == 11
+
+
+def test_edited_amounts_stay_in_each_expense_currency(db):
+    expense = {"id": "e1", "amount": 10.0, "amount_minor": 1000, "currency": "JPY", "category": "Food & Dining",
+               "date": "2025-10-01"}
+    result = update_expenses("user-1", {"currency": "INR"}, [expense], amount=1234.5)
+    assert result["fields"]["e1"] == {"amount": 1235.0, "amount_minor": 1235}
+
+
+def test_nothing_to_write(db):
+    assert delete_expenses("user-1", {}, []) == {"written": [], "error": None}
+    assert db.committed == []
@@ -0,0 +1,162 @@
+import os
+import stat
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+
+import cache
+from cache import Cache, LRUTier, SQLiteTier, make_key
+
+
+class BrokenTier:
+    """Shared tier whose server is down"""
+
+    name = "broken"
+
+    def __init__(self):
+        self.stats = cache.TierStats()
+
+    def _fail(self, *args, **kwargs):
+        raise ConnectionError("cache server unreachable")
+
+    get = set = delete = incr = counter = _fail
+
+
+@pytest.fixture
+def shared_path(tmp_path):
+    return str(tmp_path / "cache.sqlite3")
+
+
+@pytest.fixture
+def workers(shared_path, monkeypatch):
+    """Two worker processes' caches over one shared SQLite file"""
+    monkeypatch.setattr(cache, "NAMESPACE_VERSION_TTL", 0)
+    return Cache(LRUTier(), SQLiteTier(shared_path)), Cache(LRUTier(), SQLiteTier(shared_path))
+
+
+def test_lru_evicts_least_recently_used():
+    tier = LRUTier(max_entries=2)
+    tier.set("a", 1, 60)
+    tier.set("b", 2, 60)
+    assert tier.get("a") == (True, 1)
+    tier.set("c", 3, 60)
+    assert tier.get("b") == (False, None)
+    assert tier.get("a") == (True, 1)
+    assert tier.get("c") == (True, 3)
+
+
+def test_expired_entries_are_misses():
+    tier = LRUTier()
+    tier.set("old", "value", -1)
+    assert tier.get("old") == (False, None)
+    assert "old" not in tier.entries
+    assert tier.stats.as_dict() == {"hits": 0, "misses": 1, "writes": 1, "hit_ratio": 0.0}
+
+
+def test_values_round_trip_as_json_copies():
+    local = Cache(LRUTier())
+    value = {"when": datetime(2025, 10, 1, 9, 30), "day": date(2025, 10, 1), "pair": (1, 2),
+             "total": np.int64(5), "share": np.float64(0.25), "items": [{"amount": 10}]}
+    local.set("expenses", "user-1", value)
+
+    found, copy = local.get("expenses", "user-1")
+    assert found
+    assert copy == {**value, "pair": [1, 2]}
+    assert type(copy["total"]) is int and type(copy["share"]) is float
+
+    copy["items"].append({"amount": 99})
+    assert local.get("expenses", "user-1")[1]["items"] == [{"amount": 10}]
+
+
+def test_values_that_are_not_json_are_not_cached():
+    local = Cache(LRUTier())
+    local.set("chat", "answer", object())
+    assert local.get("chat", "answer") == (False, None)
+
+
+def test_versions_are_part_of_the_key():
+    local = Cache(LRUTier())
+    local.set("expenses", "user-1", ["old"], version=3)
+    assert local.get("expenses", "user-1", version=3) == (True, ["old"])
+    assert local.get("expenses", "user-1", version=4) == (False, None)
+
+
+def test_get_or_set_computes_once_and_respects_cache_if():
+    local = Cache(LRUTier())
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"ok": len(calls) > 1}
+
+    assert local.get_or_set("ai", "q", compute, cache_if=lambda value: value["ok"]) == {"ok": False}
+    assert local.get_or_set("ai", "q", compute, cache_if=lambda value: value["ok"]) == {"ok": True}
+    assert local.get_or_set("ai", "q", compute) == {"ok": True}
+    assert len(calls) == 2
+
+
+def test_shared_tier_serves_other_workers(workers):
+    first, second = workers
+    first.set("budget_ai", ("user-1", 50000), {"food": 9000})
+
+    assert second.get("budget_ai", ("user-1", 50000)) == (True, {"food": 9000})
+    assert second.metrics()["sqlite"]["hits"] == 1
+    # Promoted into the second worker's own LRU
+    assert second.get("budget_ai", ("user-1", 50000)) == (True, {"food": 9000})
+    assert second.metrics()["local"]["hits"] == 1
+
+
+def test_invalidate_reaches_every_worker(workers):
+    first, second = workers
+    first.set("chat", "q", "cached answer")
+    assert second.get("chat", "q") == (True, "cached answer")
+
+    second.invalidate("chat")
+    assert first.get("chat", "q") == (False, None)
+    assert second.get("chat", "q") == (False, None)
+    assert first.namespace_version("chat") == second.namespace_version("chat") == 1
+
+
+def test_namespace_versions_never_go_back():
+    local = Cache(LRUTier())
+    assert local._note_version("chat", 5) == 5
+    assert local._note_version("chat", 3) == 5
+    local.invalidate("chat")
+    assert local.namespace_version("chat") == 6
+
+
+def test_invalidate_without_shared_tier_is_local():
+    local = Cache(LRUTier())
+    local.set("chat", "q", "answer")
+    local.invalidate("chat")
+    assert local.get("chat", "q") == (False, None)
+
+
+def test_unavailable_shared_tier_is_a_miss(capsys):
+    degraded = Cache(LRUTier(), BrokenTier())
+    degraded.set("chat", "q", "answer")
+    assert degraded.get("chat", "q") == (True, "answer")
+    degraded.local.clear()
+    assert degraded.get("chat", "q") == (False, None)
+    degraded.invalidate("chat")
+    assert "Error" in capsys.readouterr().out
+
+
+def test_sqlite_file_is_private_and_counters_are_atomic(shared_path):
+    tier = SQLiteTier(shared_path)
+    assert stat.S_IMODE(os.stat(shared_path).st_mode) == 0o600
+    assert tier.counter("hits") == 0
+    assert [tier.incr("hits") for _ in range(3)] == [1, 2, 3]
+    assert SQLiteTier(shared_path).counter("hits") == 3
+
+    tier.set("gone", 1, -1)
+    tier.prune()
+    assert tier._connection().execute("SELECT COUNT(*) FROM cache WHERE key = 'gone'").fetchone()[0] == 0
+
+
+def test_make_key_hashes_long_keys():
+    assert make_key("user-1", 3) == "'user-1'|3"
+    long_key = make_key("x" * 300)
+    assert len(long_key) == 40
+    assert long_key == make_key("x" * 300) != make_key("y" * 300)
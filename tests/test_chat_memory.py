@@ -0,0 +1,73 @@
+from chat_memory import MAX_PENDING_CHARS, ConversationMemory
+
+
+def test_window_keeps_only_recent_messages():
+    memory = ConversationMemory(window_messages=3)
+    for i in range(10):
+        memory.add("user" if i % 2 == 0 else "assistant", f"message {i}.")
+    assert [m["content"] for m in memory.messages()] == ["message 7.", "message 8.", "message 9."]
+    assert memory.total_messages == 10
+
+
+def test_evicted_question_and_answer_share_a_summary_line():
+    memory = ConversationMemory(window_messages=2)
+    memory.add("user", "How much did I spend on food? Just roughly.")
+    memory.add("assistant", "About 4,200 this month. That is 10% over.")
+    memory.add("user", "Thanks")
+    memory.add("assistant", "Anytime")
+    assert memory.summary == "User asked: How much did I spend on food? Assistant: About 4,200 this month."
+
+
+def test_consecutive_questions_are_all_kept():
+    memory = ConversationMemory(window_messages=1)
+    memory.add("user", "How much on food?")
+    memory.add("user", "And on rent?")
+    assert memory.summary == "User asked: How much on food?"
+    memory.add("assistant", "Food 200, rent 900.")
+    assert memory.summary == "User asked: How much on food? And on rent?"
+    memory.add("user", "Ok")
+    assert memory.summary == "User asked: How much on food? And on rent? Assistant: Food 200, rent 900."
+
+
+def test_pending_questions_are_capped():
+    memory = ConversationMemory(window_messages=1)
+    for i in range(40):
+        memory.add("user", f"Question number {i}?")
+    memory.add("assistant", "Answer.")
+    assert memory.summary.startswith("User asked: Question number 0? Question number 1?")
+    assert len(memory.summary) <= len("User asked: ") + MAX_PENDING_CHARS
+
+
+def test_summary_is_bounded():
+    memory = ConversationMemory(window_messages=2, max_summary_chars=300)
+    for i in range(200):
+        memory.add("user", f"Question {i}?")
+        memory.add("assistant", f"Answer {i}.")
+    assert len(memory.summary) <= 300
+    assert memory.summary.endswith("User asked: Question 198? Assistant: Answer 198.")
+
+
+def test_prompt_stays_within_budget_and_prefers_recent_messages():
+    memory = ConversationMemory(window_messages=4, greeting="Hi, ask me about your budget.")
+    for i in range(20):
+        memory.add("user", f"Question {i} " + "about spending " * 5)
+        memory.add("assistant", f"Answer {i} " + "with details " * 5)
+
+    prompt = memory.to_prompt(60)
+    assert len(prompt) <= 60 * 4
+    assert "Answer 19" in prompt
+    assert "Earlier in the conversation" not in prompt
+
+    roomy = memory.to_prompt(2000)
+    assert roomy.startswith("Earlier in the conversation:\n")
+    assert "Recent messages:\nUser: Question 18" in roomy
+
+
+def test_tiny_budget_renders_nothing_and_latest_message_is_shortened():
+    memory = ConversationMemory()
+    assert memory.to_prompt(100) == ""
+    memory.add("user", "word " * 500)
+    assert memory.to_prompt(12) == ""
+    prompt = memory.to_prompt(40)
+    assert prompt.startswith("Recent messages:\nUser: word")
+    assert prompt.endswith("…")
@@ -0,0 +1,130 @@
+import os
+import stat
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("firebase_admin")
+
+from firebase_admin import firestore  # noqa: E402
+
+from expense_journal import DONE, FAILED, PENDING, ExpenseJournal  # noqa: E402
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / "journal")
+
+
+@pytest.fixture
+def journal(directory):
+    return ExpenseJournal("user-1", directory)
+
+
+def _append(journal, key, amount=100.0):
+    journal.append(key, {"amount": amount, "category": "Food & Dining", "date": "2025-10-01"},
+                   {"expenses_version": firestore.Increment(1), "expense_stats": {"food": {"n": 1}}},
+                   {"amount": amount, "category": "Food & Dining"})
+
+
+def test_entries_round_trip(journal):
+    journal.append("e1", {"amount": 120.5, "created": datetime(2025, 10, 1, 9, 0)},
+                   {"expenses_version": firestore.Increment(2)}, {"amount": 120.5})
+    [entry] = journal.entries(PENDING)
+    assert entry["key"] == "e1"
+    assert entry["expense"] == {"amount": 120.5, "created": datetime(2025, 10, 1, 9, 0)}
+    assert isinstance(entry["user_updates"]["expenses_version"], firestore.Increment)
+    assert entry["user_updates"]["expenses_version"].value == 2
+    assert (entry["attempts"], entry["claims"], entry["error"]) == (0, 0, None)
+
+
+def test_append_is_idempotent_per_key(journal):
+    _append(journal, "e1", 100.0)
+    _append(journal, "e1", 999.0)
+    assert [entry["expense"]["amount"] for entry in journal.entries(PENDING)] == [100.0]
+
+
+def test_server_timestamps_are_rejected(journal):
+    with pytest.raises(ValueError):
+        journal.append("e1", {"amount": 1, "created_at": firestore.SERVER_TIMESTAMP}, {}, {})
+    with pytest.raises(ValueError):
+        journal.append("e2", {"amount": 1}, {"last_expense_at": firestore.SERVER_TIMESTAMP}, {})
+    assert journal.entries(PENDING, DONE, FAILED) == []
+
+
+def test_claims_are_leased_oldest_first(journal):
+    for key in ("e1", "e2", "e3"):
+        _append(journal, key)
+    assert [entry["key"] for entry in journal.claim(2)] == ["e1", "e2"]
+    assert journal.in_flight() == 2
+    assert journal.claimable() == 1
+    assert [entry["key"] for entry in journal.claim(10)] == ["e3"]
+    assert journal.claim(10) == []
+
+
+def test_expired_lease_is_reclaimed_with_claims_counted(journal):
+    _append(journal, "e1")
+    [first] = journal.claim(1, lease=-1)
+    assert first["claims"] == 1
+    [second] = journal.claim(1)
+    assert second["key"] == "e1"
+    assert second["claims"] == 2
+
+
+def test_release_returns_entries_for_retry(journal):
+    _append(journal, "e1")
+    journal.claim(1)
+    journal.release(["e1"], "deadline exceeded")
+    [entry] = journal.claim(1)
+    assert (entry["attempts"], entry["claims"], entry["error"]) == (1, 2, "deadline exceeded")
+
+
+def test_done_and_failed_entries(journal):
+    for key in ("e1", "e2", "e3"):
+        _append(journal, key)
+    started = time.time()
+    journal.claim(3)
+    journal.mark_done(["e1", "e2"])
+    journal.mark_failed(["e3"], "permission denied")
+
+    assert journal.claimable() == journal.in_flight() == 0
+    assert journal.done_since(started) == 2
+    assert [entry["key"] for entry in journal.entries(DONE)] == ["e1", "e2"]
+    assert [(entry["key"], entry["error"]) for entry in journal.pop_failed()] == [("e3", "permission denied")]
+    assert journal.pop_failed() == []
+
+    journal.purge_done(time.time() + 1)
+    assert journal.entries(PENDING, DONE, FAILED) == []
+
+
+def test_workers_never_claim_the_same_entry(directory):
+    for i in range(200):
+        _append(ExpenseJournal("user-1", directory), f"e{i:03d}")
+    # Separate journal objects stand in for separate processes
+    workers = [ExpenseJournal("user-1", directory) for _ in range(4)]
+    claimed = []
+
+    def replay(worker):
+        while True:
+            entries = worker.claim(7)
+            if not entries:
+                return
+            claimed.extend(entry["key"] for entry in entries)
+
+    threads = [threading.Thread(target=replay, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == [f"e{i:03d}" for i in range(200)]
+
+
+def test_snapshots_and_private_files(journal, directory):
+    assert journal.snapshot("user", {}) == {}
+    journal.save_snapshot("user", {"income": 50000, "updated": datetime(2025, 10, 1)})
+    assert ExpenseJournal("user-1", directory).snapshot("user") == {"income": 50000, "updated": datetime(2025, 10, 1)}
+
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+    assert os.path.dirname(ExpenseJournal("../other user", directory).path) == directory
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+import fx
+from fx import FXTable
+from money import (Money, allocation_fields, amount_fields, base_amount, from_minor, minor_array, stored_allocations,
+                   sum_amounts, to_minor)
+
+
+@pytest.fixture
+def rates(monkeypatch):
+    table = FXTable([
+        ("2025-10-01", "INR", 80.0),
+        ("2025-10-10", "INR", 88.0),
+        ("2025-10-01", "EUR", 0.8),
+        ("2025-10-01", "JPY", 150.0),
+    ])
+    monkeypatch.setattr(fx, "_TABLE", table)
+    fx.daily_rate.cache_clear()
+    yield table
+    fx.daily_rate.cache_clear()
+
+
+def test_to_minor_rounds_half_up_per_currency_exponent():
+    assert to_minor(0.1 + 0.2) == 30
+    assert to_minor(2.675) == 268
+    assert to_minor("19.995", "USD") == 2000
+    assert to_minor(-1.005) == -101
+    assert to_minor(1234.5, "JPY") == 1235
+    assert to_minor(1.2345, "KWD") == 1235
+    assert to_minor(None) == 0
+    assert from_minor(1235, "₹ INR") == 12.35
+
+
+def test_sums_are_exact():
+    expenses = [{"amount": 0.1}] * 10 + [{"amount_minor": 1}]
+    assert sum_amounts(expenses) == 1.01
+    assert minor_array(expenses).dtype == np.int64
+
+
+def test_money_arithmetic_refuses_mixed_currencies():
+    total = sum([Money.of(0.1), Money.of(0.2)])
+    assert total == Money(30, "INR")
+    assert total.format("₹") == "₹ 0.30"
+    assert Money.of(5, "USD") - Money.of(7.5, "USD") == Money(-250, "USD")
+    with pytest.raises(ValueError):
+        Money.of(1, "USD") + Money.of(1, "EUR")
+
+
+def test_stored_fields_prefer_minor_units():
+    assert amount_fields(10.005) == {"amount": 10.01, "amount_minor": 1001}
+    fields = allocation_fields({"food": 100.125})
+    assert fields["budget_allocations_minor"] == {"food": 10013}
+    assert stored_allocations({**fields, "budget_allocations": {"food": 1.0}}) == {"food": 100.13}
+    assert stored_allocations({"budget_allocations": {"food": 5.0}}) == {"food": 5.0}
+
+
+def test_rates_use_latest_date_on_or_before(rates):
+    days = np.array(["2025-09-01", "2025-10-01", "2025-10-09", "2025-10-10", "2025-12-31"], dtype="datetime64[D]")
+    assert rates.rates("INR", days).tolist() == [80.0, 80.0, 80.0, 88.0, 88.0]
+    with pytest.raises(KeyError):
+        rates.rates("XYZ", days)
+
+
+def test_foreign_expenses_convert_at_their_date(rates):
+    assert base_amount({"amount": 10, "currency": "USD", "date": "2025-10-05"}) == 800.0
+    assert base_amount({"amount": 10, "currency": "USD", "date": "2025-10-12T09:00:00"}) == 880.0
+    assert base_amount({"amount": 1000, "currency": "JPY", "date": "2025-10-05"}, "USD") == 6.67
+    assert base_amount({"amount": 5}) == 5.0
+
+
+def test_vectorized_conversion_matches_single_conversions(rates):
+    expenses = [
+        {"amount": 100, "date": "2025-10-02"},
+        {"amount": 10, "currency": "USD", "date": "2025-10-02"},
+        {"amount": 10, "currency": "USD", "date": "2025-10-11"},
+        {"amount": 2.5, "currency": "EUR", "date": "2025-10-11"},
+    ]
+    converted = minor_array(expenses)
+    assert converted.tolist() == [10000, 80000, 88000, 27500]
+    assert [to_minor(base_amount(e)) for e in expenses] == converted.tolist()
+    assert sum_amounts(expenses) == 2055.0
+
+
+def test_unknown_currency_is_left_unconverted(rates):
+    assert minor_array([{"amount": 3, "currency": "XYZ", "date": "2025-10-02"}]).tolist() == [300]
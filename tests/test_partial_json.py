@@ -0,0 +1,48 @@
+import json
+
+from partial_json import IncrementalJSONParser, parse_partial_json
+
+
+def test_complete_object_ignores_surrounding_text():
+    text = 'Here you go:\n```json\n{"needs": 50, "wants": 30}\n```\nAnything else?'
+    assert parse_partial_json(text) == {"needs": 50, "wants": 30}
+
+
+def test_truncated_object_keeps_complete_values():
+    parser = IncrementalJSONParser().feed('{"food": 1200, "rent": 9000, "fun": 45')
+    assert parser.result() == {"food": 1200, "rent": 9000}
+    assert parser.truncated
+
+
+def test_truncated_nested_containers_are_closed():
+    text = '{"allocations": {"food": 10, "rent": 20}, "tips": ["save more", "cook at ho'
+    assert parse_partial_json(text) == {"allocations": {"food": 10, "rent": 20}, "tips": ["save more"]}
+
+
+def test_cut_after_key_drops_the_key():
+    assert parse_partial_json('{"food": 10, "rent"') == {"food": 10}
+    assert parse_partial_json('{"food": 10, "rent":') == {"food": 10}
+
+
+def test_escaped_quotes_and_braces_inside_strings():
+    data = {"note": 'He said "hi" \\ {not a brace} [nor this]', "n": 1}
+    assert parse_partial_json(json.dumps(data)) == data
+
+
+def test_truncated_inside_escaped_string():
+    assert parse_partial_json('{"a": 1, "note": "say \\"hel') == {"a": 1}
+
+
+def test_chunked_feed_matches_single_feed():
+    text = '```json\n{"tips": ["a", "b\\"c"], "total": 100, "ok": true, "x": null}\n```'
+    parser = IncrementalJSONParser()
+    for char in text:
+        parser.feed(char)
+    assert parser.result() == parse_partial_json(text) == json.loads(text[8:-4])
+    assert not parser.truncated
+
+
+def test_no_object_returns_none():
+    assert parse_partial_json("") is None
+    assert parse_partial_json("sorry, I can't help with that") is None
+    assert IncrementalJSONParser().feed('{"food": 1').result() == {}
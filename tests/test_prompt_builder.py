@@ -0,0 +1,64 @@
+import prompt_builder
+from prompt_builder import PromptBuilder, estimate_tokens, prompt_size_stats, query_terms
+
+
+def _expense_lines(count):
+    categories = ["food", "rent", "travel", "utilities"]
+    return [f"2025-10-{i % 28 + 1:02d} {categories[i % 4]} spent {100 + i}" for i in range(count)]
+
+
+def test_estimate_tokens_and_query_terms():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcde") == 2
+    assert query_terms("How much did I spend on Food and travel?") == {"spend", "food", "travel"}
+
+
+def test_everything_fits_in_declared_order():
+    prompt = (PromptBuilder("test", 500)
+              .add_section("intro", "You are a budget assistant.", required=True)
+              .add_section("goals", ["Save for a car"], header="Goals:")
+              .build("car"))
+    assert prompt == "You are a budget assistant.\n\nGoals:\nSave for a car"
+
+
+def test_condensed_section_keeps_lines_matching_the_query():
+    builder = PromptBuilder("test", 120)
+    builder.add_section("intro", "You are a budget assistant.", required=True)
+    builder.add_section("expenses", _expense_lines(60), header="Expenses:",
+                        overflow=lambda omitted: f"({len(omitted)} more expenses)")
+    prompt = builder.build("what did I spend on travel")
+
+    assert estimate_tokens(prompt) <= 120
+    body = prompt.split("Expenses:\n", 1)[1].split("\n")
+    kept = body[:-1]
+    assert kept and all("travel" in line for line in kept)
+    assert body[-1] == f"({60 - len(kept)} more expenses)"
+
+
+def test_required_sections_survive_and_irrelevant_ones_drop_first():
+    builder = PromptBuilder("test", 60)
+    builder.add_section("intro", "x" * 120, required=True)
+    builder.add_section("goals", ["Goal: car fund 50000", "Goal: trip 20000"], header="Goals:",
+                        keywords=("goal", "save"))
+    builder.add_section("tips", ["Tip: " + "y" * 200], header="Tips:")
+    prompt = builder.build("how close is my goal")
+
+    assert prompt.startswith("x" * 120)
+    assert "Goals:\nGoal: car fund 50000\nGoal: trip 20000" in prompt
+    assert "Tips:" not in prompt
+    report = prompt_builder.PROMPT_SIZE_LOG[-1]
+    assert report["dropped"] == ["tips"]
+    assert report["tokens"] == estimate_tokens(prompt) <= report["budget"]
+
+
+def test_prompt_sizes_are_metered():
+    prompt_builder.PROMPT_SIZE_LOG.clear()
+    for budget in (50, 100, 200):
+        PromptBuilder("metered", budget).add_section("lines", _expense_lines(40)).build()
+    PromptBuilder("other", 50).add_section("intro", "hi", required=True).build()
+
+    stats = prompt_size_stats("metered")
+    assert stats["count"] == 3
+    assert stats["max"] <= 200
+    assert prompt_size_stats()["count"] == 4
+    assert prompt_size_stats("missing") == {"count": 0, "mean": 0, "p95": 0, "max": 0}
@@ -0,0 +1,90 @@
+from datetime import date, timedelta
+
+import pytest
+
+pytest.importorskip("firebase_admin")
+pytest.importorskip("streamlit")
+
+from data_layer import ExpenseFrame  # noqa: E402
+from recurring import detect_series, extend_series, match_expense, upcoming_charges  # noqa: E402
+
+TODAY = date(2025, 10, 20)
+
+
+def _expense(day, amount, category="Entertainment", notes=""):
+    return {"date": day.isoformat(), "amount": amount, "amount_minor": round(amount * 100),
+            "category": category, "notes": notes}
+
+
+def _monthly(first, count, amount, **fields):
+    return [_expense(date(first.year + (first.month - 1 + i) // 12, (first.month - 1 + i) % 12 + 1, first.day),
+                     amount, **fields) for i in range(count)]
+
+
+def _detect(expenses):
+    return detect_series(ExpenseFrame.from_expenses(expenses), TODAY)
+
+
+def test_monthly_subscription_is_detected_across_note_variants():
+    expenses = [{**expense, "notes": f"NETFLIX #{4400 + i} ({date.fromisoformat(expense['date']):%b})"}
+                for i, expense in enumerate(_monthly(date(2025, 5, 12), 6, 649.0))]
+    expenses.append(_expense(date(2025, 9, 3), 120.0, category="Food & Dining", notes="Pizza"))
+
+    series = _detect(expenses)
+    assert len(series) == 1
+    item = next(iter(series.values()))
+    assert item["label"] == "Netflix"
+    assert item["period"] == "monthly"
+    assert item["count"] == 6
+    assert item["first_date"] == "2025-05-12"
+    assert item["last_date"] == "2025-10-12"
+    assert item["next_date"] == "2025-11-12"
+    assert item["active"]
+
+
+def test_unnamed_fixed_amount_is_a_series():
+    series = _detect(_monthly(date(2025, 3, 1), 8, 15000.0, category="Essentials"))
+    assert [(s["period"], s["label"], s["amount"]) for s in series.values()] == [("monthly", "Essentials", 15000.0)]
+
+
+def test_unnamed_varying_spend_is_not_a_series():
+    # Weekly groceries creep up in small steps, so neighbouring amounts chain into one cluster
+    start = date(2025, 6, 2)
+    groceries = [_expense(start + timedelta(weeks=i), 1000.0 * 1.05 ** i, category="Food & Dining")
+                 for i in range(16)]
+    assert _detect(groceries) == {}
+
+
+def test_irregular_and_too_few_charges_are_ignored():
+    days = [date(2025, 1, 3), date(2025, 1, 20), date(2025, 3, 29), date(2025, 4, 2), date(2025, 8, 15)]
+    assert _detect([_expense(day, 300.0, notes="Uber") for day in days]) == {}
+    assert _detect(_monthly(date(2025, 8, 1), 2, 99.0, notes="Spotify")) == {}
+
+
+def test_weekly_and_yearly_periods():
+    weekly = [_expense(date(2025, 8, 4) + timedelta(weeks=i), 250.0, notes="Gym class") for i in range(6)]
+    yearly = [_expense(date(2023, 11, 2), 1499.0, notes="Prime"), _expense(date(2024, 11, 1), 1499.0, notes="Prime")]
+    periods = {s["label"]: s["period"] for s in _detect(weekly + yearly).values()}
+    assert periods == {"Gym Class": "weekly", "Prime": "yearly"}
+
+
+def test_new_charge_extends_its_series():
+    series = _detect(_monthly(date(2025, 5, 12), 6, 649.0, notes="Netflix"))
+    series_id = next(iter(series))
+
+    charge = _expense(date(2025, 11, 13), 659.0, notes="Netflix #4411 (Nov)")
+    assert match_expense(series, charge) == series_id
+    assert match_expense(series, {**charge, "amount": 999.0}) is None
+    assert match_expense(series, {**charge, "date": "2025-12-25"}) is None
+    assert match_expense(series, {**charge, "category": "Food & Dining"}) is None
+
+    extended = extend_series(series[series_id], charge)
+    assert (extended["count"], extended["last_date"], extended["next_date"]) == (7, "2025-11-13", "2025-12-13")
+
+
+def test_upcoming_charges_project_active_series():
+    series = _detect(_monthly(date(2025, 5, 12), 6, 649.0, notes="Netflix")
+                     + [_expense(date(2025, 8, 4) + timedelta(weeks=i), 250.0, notes="Gym") for i in range(12)])
+    charges = upcoming_charges(series, TODAY, days=14)
+    assert [(c["date"].isoformat(), c["label"]) for c in charges] == [("2025-10-27", "Gym"), ("2025-11-03", "Gym")]
+    assert [c["label"] for c in upcoming_charges(series, TODAY, days=30)].count("Netflix") == 1